@@ -0,0 +1,187 @@
+#coding: utf-8
+
+#python3 benchmarks.py run --rounds 20000 --n 10 100 --pF 0.2 0.5
+#python3 benchmarks.py compare <base commit> <head commit> --tolerance 0.1
+from sweep import *
+from rewards import *
+import subprocess
+import tempfile
+import tracemalloc
+import platform
+import time
+import json
+import sys
+
+# Parameters of the benchmark matrix and their defaults
+MATRIX = {'n': [10, 100], 'p': [0.1], 'pF': [0.2, 0.5], 'k': [16], 'txRate': [5]}
+
+# Methods whose cost is measured, as (class, method name)
+PHASES = [(Environment, 'step'), (Node, 'mineBlock'), (Node, 'getFreshFruits'),
+    (FruitchainWindow, 'addBlock'), (Simulator, 'saveData')]
+
+def configKey(config):
+    return ",".join(key + "=" + str(config[key]) for key in ('n', 'p', 'pF', 'k', 'txRate'))
+
+def makeSimulator(config, rounds, seed):
+    return Simulator(config['n'], config['t'], rounds, config['p'], config['pF'], hashFractions(config),
+        config['txRate'], config['k'], seed=seed)
+
+def timedMethod(method, totals, name):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            total = totals[name]
+            total[0] += 1
+            total[1] += time.perf_counter() - start
+    return timed
+
+def measurePhases(config, rounds, seed, outdir):
+    '''
+    Returns <K, V> = <phase, {'calls', 'seconds'}> of one run, PHASES are
+    wrapped with timers for the length of it
+    '''
+    totals = {cls.__name__ + '.' + name: [0, 0.0] for cls, name in PHASES}
+    originals = [(cls, name, cls.__dict__[name]) for cls, name in PHASES]
+    try:
+        for cls, name, method in originals:
+            setattr(cls, name, timedMethod(method, totals, cls.__name__ + '.' + name))
+        makeSimulator(config, rounds, seed).run(os.path.join(outdir, 'phases'), verbose=False)
+    finally:
+        for cls, name, method in originals:
+            setattr(cls, name, method)
+    return {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in totals.items()}
+
+def benchmarkConfig(config, rounds, seed=0, repeat=3):
+    '''
+    config: simulator parameters, see sweep.DEFAULTS
+    rounds: number of rounds of each run
+    seed: seed of the runs, every measurement simulates the same run
+    repeat: number of timed runs, the fastest one counts
+
+    Returns rounds per second of a whole run (stats and results files included),
+    peak traced memory in bytes and the cost of each phase. Each is measured in a
+    separate run so the timers and tracemalloc don't skew the throughput.
+    '''
+    with tempfile.TemporaryDirectory() as outdir:
+        best = float('inf')
+        for i in range(repeat):
+            sim = makeSimulator(config, rounds, seed)
+            start = time.perf_counter()
+            sim.run(os.path.join(outdir, 'throughput'), verbose=False)
+            best = min(best, time.perf_counter() - start)
+        phases = measurePhases(config, rounds, seed, outdir)
+        tracemalloc.start()
+        try:
+            makeSimulator(config, rounds, seed).run(os.path.join(outdir, 'memory'), verbose=False)
+            peakMemory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'rounds': rounds, 'roundsPerSecond': rounds / best, 'peakMemory': peakMemory, 'phases': phases}
+
+def benchmark(matrix, rounds, seed=0, repeat=3, verbose=False):
+    '''
+    matrix: <K, V> = <parameter, list of values>, see MATRIX
+
+    Returns <K, V> = <config key, result of benchmarkConfig> for every config of the matrix
+    '''
+    results = {}
+    for config in expandGrid(matrix):
+        key = configKey(config)
+        results[key] = benchmarkConfig(config, rounds, seed, repeat)
+        if verbose:
+            print(key + ': ' + str(round(results[key]['roundsPerSecond'])) + ' rounds/s, peak memory ' +
+                str(results[key]['peakMemory'] // 1024) + ' KiB')
+    return results
+
+def currentCommit():
+    '''
+    Short hash of HEAD, with a -dirty suffix if the tree has uncommitted changes
+    '''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+def loadHistory(filename):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as file:
+        return json.load(file)
+
+def saveResults(filename, commit, results):
+    '''
+    Add the results of a commit to the JSON history file, replacing earlier results of it
+    '''
+    history = loadHistory(filename)
+    entry = history.setdefault(commit, {'results': {}})
+    entry['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    entry['python'] = platform.python_version()
+    entry['results'].update(results)
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(history, file, indent=1, sort_keys=True)
+    os.replace(tmp, filename)
+
+def compare(history, base, head, tolerance=0.1):
+    '''
+    history: benchmark history, see saveResults
+    base, head: commits to compare
+    tolerance: relative change that is not a regression
+
+    Returns the regressions of head w.r.t. base in the configs both have results
+    for: lower rounds per second, higher peak memory or higher cost per call of a phase
+    '''
+    for commit in (base, head):
+        if commit not in history:
+            raise KeyError("no benchmark results for commit " + str(commit))
+    regressions = []
+    baseResults, headResults = history[base]['results'], history[head]['results']
+    for key in sorted(set(baseResults) & set(headResults)):
+        old, new = baseResults[key], headResults[key]
+        if new['roundsPerSecond'] < old['roundsPerSecond'] * (1 - tolerance):
+            regressions.append(key + ': rounds/s ' + str(round(old['roundsPerSecond'])) + ' -> ' + str(round(new['roundsPerSecond'])))
+        if new['peakMemory'] > old['peakMemory'] * (1 + tolerance):
+            regressions.append(key + ': peak memory ' + str(old['peakMemory']) + ' -> ' + str(new['peakMemory']))
+        for phase in sorted(set(old['phases']) & set(new['phases'])):
+            oldPhase, newPhase = old['phases'][phase], new['phases'][phase]
+            if oldPhase['calls'] == 0 or newPhase['calls'] == 0:
+                continue
+            oldCost = oldPhase['seconds'] / oldPhase['calls']
+            newCost = newPhase['seconds'] / newPhase['calls']
+            if newCost > oldCost * (1 + tolerance):
+                regressions.append(key + ': ' + phase + ' ' + '%.3g' % (oldCost*1e6) + 'us -> ' + '%.3g' % (newCost*1e6) + 'us per call')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the simulator and track its throughput across commits')
+    parser.add_argument('--history', default='benchmarks.json', help='JSON file of the results of every commit')
+    commands = parser.add_subparsers(dest='command', required=True)
+    runParser = commands.add_parser('run', help='benchmark the current tree and add it to the history')
+    for key, values in MATRIX.items():
+        runParser.add_argument('--' + key, type=type(values[0]), nargs='+', default=values, help='values of ' + key)
+    runParser.add_argument('--rounds', type=int, default=20000, help='number of rounds of each run')
+    runParser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each config')
+    runParser.add_argument('--seed', type=int, default=0, help='seed of the runs')
+    runParser.add_argument('--commit', default=None, help='key of the results in the history, default is the current commit')
+    compareParser = commands.add_parser('compare', help='list the regressions of a commit w.r.t. another one')
+    compareParser.add_argument('base', help='commit to compare against')
+    compareParser.add_argument('head', help='commit to check')
+    compareParser.add_argument('--tolerance', type=float, default=0.1, help='relative change that is not a regression')
+    args = parser.parse_args()
+    if args.command == 'run':
+        matrix = {key: getattr(args, key) for key in MATRIX}
+        results = benchmark(matrix, args.rounds, args.seed, args.repeat, verbose=True)
+        commit = args.commit or currentCommit()
+        saveResults(args.history, commit, results)
+        print('Results of ' + commit + ' are in ' + args.history)
+    else:
+        regressions = compare(loadHistory(args.history), args.base, args.head, args.tolerance)
+        for line in regressions:
+            print(line)
+        print(str(len(regressions)) + ' regression(s) beyond ' + str(args.tolerance*100) + '%')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,267 @@
+#coding: utf-8
+from dataStructures import *
+import numpy as np
+import heapq
+
+class BlockTree:
+    def __init__(self, weight=None, capacity=1024):
+        '''
+        weight: function returning the (integer) weight of a block, None gives every block weight 1,
+                i.e. the longest chain is the heaviest one
+        blocks: blocks by index, the genesis has index 0
+        parent, height, work, digest: parent index, height, total weight and digest (see chainDigest) of the chain ending at each block
+        up: binary lifting table, up[j][i] is the 2**j'th ancestor of block i (the genesis is its own)
+        tips: index of the tip of each node's chain
+        best: tip of the heaviest chain, cached as blocks are added; the first one added wins ties
+        validFruits: valid fruits of all nodes, fruits reach every node at once; <K, V> = <index of the block they hang from, setOfFruits>
+
+        Blocks of all chains stored once as a tree of parent links. A node's chain is the
+        path from the genesis to its tip (see TreeChain), so n nodes share one copy of the
+        blocks and switching to another fork only moves a tip.
+        '''
+        self.weight = weight
+        self.blocks = []
+        self.parent = np.zeros(capacity, dtype=np.int64)
+        self.height = np.zeros(capacity, dtype=np.int64)
+        self.work = np.zeros(capacity, dtype=np.int64)
+        self.digest = np.zeros(capacity, dtype=np.int64)
+        self.up = [np.zeros(capacity, dtype=np.int64)]
+        self.tips = np.zeros(0, dtype=np.int64)
+        self.best = 0
+        self.validFruits = defaultdict(set)
+        genesis = Block()
+        self.blocks.append(genesis)
+        self.height[0] = genesis.height = 1
+        self.digest[0] = chainDigest(0, genesis)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def track(self, nodeID):
+        '''
+        Make room for the tip of the node with id nodeID, new tips are at the genesis
+        '''
+        if nodeID >= len(self.tips):
+            self.tips = np.concatenate((self.tips, np.zeros(nodeID + 1 - len(self.tips), dtype=np.int64)))
+
+    def grow(self):
+        capacity = 2*len(self.parent)
+        for name in ('parent', 'height', 'work', 'digest'):
+            setattr(self, name, np.resize(getattr(self, name), capacity))
+        self.up = [np.resize(level, capacity) for level in self.up]
+
+    def add(self, b, parent):
+        '''
+        Add block b on top of the block with index parent, sets its height. Returns its index
+        '''
+        i = len(self.blocks)
+        if i == len(self.parent):
+            self.grow()
+        self.blocks.append(b)
+        self.parent[i] = parent
+        height = self.height[i] = self.height[parent] + 1
+        b.height = int(height)
+        self.work[i] = self.work[parent] + (1 if self.weight == None else self.weight(b))
+        self.digest[i] = chainDigest(int(self.digest[parent]), b)
+        if height > 1 << len(self.up):
+            # a chain got longer than the jumps reach, add the next level for every block
+            level = self.up[-1]
+            self.up.append(level[level])
+        self.up[0][i] = parent
+        for j in range(1, len(self.up)):
+            self.up[j][i] = self.up[j-1][self.up[j-1][i]]
+        if self.work[i] > self.work[self.best]:
+            self.best = i
+        return i
+
+    def ancestor(self, i, height):
+        '''
+        Returns the index of the ancestor of block i at the given height, O(log height)
+        '''
+        d = int(self.height[i]) - height
+        if d < 0:
+            raise ValueError("block " + str(i) + " is below height " + str(height))
+        j = 0
+        while d:
+            if d & 1:
+                i = self.up[j][i]
+            d >>= 1
+            j += 1
+        return int(i)
+
+    def ancestors(self, indices, height):
+        '''
+        Returns the ancestors at the given height of many blocks at once
+        '''
+        indices = np.array(indices, dtype=np.int64)
+        d = self.height[indices] - height
+        for j, level in enumerate(self.up):
+            jump = (d >> j) & 1 == 1
+            indices[jump] = level[indices[jump]]
+        return indices
+
+    def commonAncestor(self, a, b):
+        '''
+        Returns the index of the highest block both chains ending at blocks a and b contain
+        '''
+        if self.height[a] < self.height[b]:
+            a, b = b, a
+        a = self.ancestor(a, int(self.height[b]))
+        if a == b:
+            return a
+        for level in reversed(self.up):
+            if level[a] != level[b]:
+                a, b = level[a], level[b]
+        return int(self.parent[a])
+
+    def path(self, ancestor, tip):
+        '''
+        Returns the blocks after ancestor up to tip, in chain order
+        '''
+        blocks = []
+        while tip != ancestor:
+            blocks.append(self.blocks[tip])
+            tip = self.parent[tip]
+        blocks.reverse()
+        return blocks
+
+    def chain(self, tip):
+        return [self.blocks[0]] + self.path(0, tip)
+
+    def reorg(self, old, new):
+        '''
+        Returns (blocks that leave the chain, blocks that join it) when a chain switches from tip old to tip new
+        '''
+        ancestor = self.commonAncestor(old, new)
+        return self.path(ancestor, old), self.path(ancestor, new)
+
+    def addFruit(self, f, tip):
+        '''
+        Add fruit f mined on the chain ending at block tip, it's kept with the block it hangs from
+        '''
+        self.validFruits[self.ancestor(tip, f.hangBlockHeight)].add(f)
+
+    def pruneFruits(self, k):
+        '''
+        Drop the fruits that can't be fresh in any node's chain anymore
+        '''
+        lowest = int(self.height[self.tips].min()) - k
+        for i in [i for i in self.validFruits if self.height[i] < lowest]:
+            del self.validFruits[i]
+
+    def deliver(self, i, recipients):
+        '''
+        recipients: ids of the nodes block i is delivered to
+
+        Nodes whose chain is lighter than the one ending at i switch to it (fork choice),
+        the first chain received wins ties
+        '''
+        recipients = np.asarray(recipients)
+        switch = recipients[self.work[self.tips[recipients]] < self.work[i]]
+        self.tips[switch] = i
+
+
+def fruitWeight(b):
+    '''
+    Weight of a block for the heaviest chain rule, the block itself (its implicit fruit) and its fruits
+    '''
+    return b.nFruits + 1
+
+
+class TreeChain:
+    def __init__(self, tree, nodeID):
+        '''
+        tree: BlockTree the chain is part of
+
+        Chain of a node in a BlockTree, the path from the genesis to the node's tip.
+        Reads like a Blockchain, and appending a block adds it to the tree on top of
+        the tip. The tip moves when heavier blocks are delivered to the node.
+        '''
+        self.tree = tree
+        self.nodeID = nodeID
+        tree.track(nodeID)
+
+    @property
+    def tip(self):
+        return int(self.tree.tips[self.nodeID])
+
+    @property
+    def length(self):
+        return int(self.tree.height[self.tip])
+
+    @property
+    def head(self):
+        return self.tree.blocks[self.tip]
+
+    def append(self, b):
+        self.tree.tips[self.nodeID] = self.tree.add(b, self.tip)
+
+    def freshFruits(self, k):
+        '''
+        Returns the valid fruits that hang from one of the last k blocks of this chain and aren't in it.
+        Fruits hanging from blocks of other forks aren't fresh. Only the blocks above the oldest
+        hang block can contain fresh fruits, so the chain isn't walked further
+        '''
+        tree = self.tree
+        first = max(1, self.length - k)
+        fresh, inChain = set(), set()
+        i = self.tip
+        while True:
+            fresh.update(tree.validFruits.get(i, ()))
+            if tree.height[i] == first:
+                return fresh - inChain
+            inChain.update(tree.blocks[i].fruits)
+            i = int(tree.parent[i])
+
+    def __getitem__(self, key):
+        length = self.length
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(length))]
+        if key < 0:
+            key += length
+        if key < 0 or key >= length:
+            raise IndexError("block " + str(key) + " isn't in the chain")
+        return self.tree.blocks[self.tree.ancestor(self.tip, key+1)]
+
+    def digest(self, height=None):
+        '''
+        Returns the digest of the first height blocks, of the whole chain if height is None.
+        Other heights are found by ancestor, so they're O(log length)
+        '''
+        tip = self.tip if height == None else self.tree.ancestor(self.tip, height)
+        return int(self.tree.digest[tip])
+
+    def __eq__(self, other):
+        return self.length == other.length and self.digest() == other.digest()
+
+    def __iter__(self):
+        return iter(self.tree.chain(self.tip))
+
+
+class DeliveryQueue:
+    def __init__(self):
+        '''
+        heap: (roundNum, seq, block index, recipient ids) of the pending deliveries, seq keeps them in the order they're scheduled
+
+        Deliveries of blocks scheduled for later rounds, so blocks reach nodes after a network delay
+        '''
+        self.heap = []
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, roundNum, i, recipients):
+        heapq.heappush(self.heap, (roundNum, self.seq, i, recipients))
+        self.seq += 1
+
+    def popDue(self, roundNum):
+        '''
+        Returns the (block index, recipients) of deliveries scheduled for rounds <= roundNum, earliest first
+        '''
+        due = []
+        heap = self.heap
+        while heap and heap[0][0] <= roundNum:
+            deliveryRound, seq, i, recipients = heapq.heappop(heap)
+            due.append((i, recipients))
+        return due
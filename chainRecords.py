@@ -0,0 +1,150 @@
+#coding: utf-8
+import numpy as np
+
+# Columns of the block and fruit records and their dtypes
+BLOCK_FIELDS = (('mineRound', np.int64), ('miner', np.int64), ('fee', np.int64), ('height', np.int64), ('nFruits', np.int64))
+FRUIT_FIELDS = (('miner', np.int64), ('mineRound', np.int64), ('hangHeight', np.int64), ('contHeight', np.int64), ('block', np.int64))
+
+class RecordTable:
+    def __init__(self, fields, capacity=1024):
+        '''
+        fields: (name, dtype) of each column
+
+        Columns of records that grow by doubling, rows are appended one by one
+        '''
+        self.fields = fields
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in fields}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, *values):
+        if self.size == len(self.columns[self.fields[0][0]]):
+            for name in self.columns:
+                self.columns[name] = np.resize(self.columns[name], 2*self.size)
+        for (name, dtype), value in zip(self.fields, values):
+            self.columns[name][self.size] = value
+        self.size += 1
+
+    def arrays(self):
+        '''
+        Returns <K, V> = <column, array of the rows appended so far>
+        '''
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+
+class ChainRecorder:
+    def __init__(self):
+        '''
+        blocks: mined blocks in chain order, see BLOCK_FIELDS
+        fruits: fruits of the blocks, see FRUIT_FIELDS; block is the index of the containing block in blocks
+
+        Records the chain as compact arrays, enough to compute the rewards
+        of both schemes after the run (see rewards.py)
+        '''
+        self.blocks = RecordTable(BLOCK_FIELDS)
+        self.fruits = RecordTable(FRUIT_FIELDS)
+
+    def addBlock(self, b):
+        index = len(self.blocks)
+        self.blocks.append(b.mineRound, b.minerID, b.totalFee, b.height, b.nFruits)
+        for f in sorted(b.fruits, key=lambda f: f.key):
+            self.fruits.append(f.minerID, f.mineRound, f.hangBlockHeight, b.height, index)
+
+    def records(self):
+        '''
+        Returns the (blocks, fruits) arrays recorded so far
+        '''
+        return self.blocks.arrays(), self.fruits.arrays()
+
+    def save(self, filename):
+        blocks, fruits = self.records()
+        arrays = {'block_' + name: column for name, column in blocks.items()}
+        arrays.update({'fruit_' + name: column for name, column in fruits.items()})
+        with open(filename, 'wb') as file:
+            np.savez(file, **arrays)
+
+
+class ChainArchive:
+    blockDtype = np.dtype(list(BLOCK_FIELDS))
+    fruitDtype = np.dtype(list(FRUIT_FIELDS))
+
+    def __init__(self, filename):
+        '''
+        filename: prefix of the archive, blocks go to filename_blocks and fruits to filename_fruits
+
+        Append-only archive of the blocks evicted from a RollingBlockchain. Rows are the
+        ones of ChainRecorder, written as packed records, see loadChainArchive.
+        '''
+        self.filename = filename
+        self.nBlocks = 0
+        self.nFruits = 0
+        self.blockFile = open(filename + "_blocks", 'wb')
+        self.fruitFile = open(filename + "_fruits", 'wb')
+
+    def addBlocks(self, blocks):
+        '''
+        Append the blocks (in chain order) and their fruits, the genesis isn't archived.
+        Fruits are in key order so the file doesn't depend on the layout of the sets
+        '''
+        blocks = [b for b in blocks if b.minerID != -1]
+        blockRows = np.zeros(len(blocks), dtype=self.blockDtype)
+        fruitRows = np.zeros(sum(b.nFruits for b in blocks), dtype=self.fruitDtype)
+        j = 0
+        for i, b in enumerate(blocks):
+            blockRows[i] = (b.mineRound, b.minerID, b.totalFee, b.height, b.nFruits)
+            for f in sorted(b.fruits, key=lambda f: f.key):
+                fruitRows[j] = (f.minerID, f.mineRound, f.hangBlockHeight, b.height, self.nBlocks + i)
+                j += 1
+        blockRows.tofile(self.blockFile)
+        fruitRows.tofile(self.fruitFile)
+        self.nBlocks += len(blocks)
+        self.nFruits += len(fruitRows)
+
+    def flush(self):
+        self.blockFile.flush()
+        self.fruitFile.flush()
+
+    def close(self):
+        self.blockFile.close()
+        self.fruitFile.close()
+
+    def __getstate__(self):
+        # files can't be pickled, a resumed run continues after the rows written so far.
+        # Like StatsLogger, flush before pickling so they're on disk
+        state = self.__dict__.copy()
+        state['blockFile'] = None
+        state['fruitFile'] = None
+        return state
+
+    def reopen(self):
+        '''
+        Reopen the files of an unpickled archive, dropping rows written after it was pickled
+        '''
+        self.blockFile = open(self.filename + "_blocks", 'r+b')
+        self.blockFile.truncate(self.nBlocks * self.blockDtype.itemsize)
+        self.blockFile.seek(0, 2)
+        self.fruitFile = open(self.filename + "_fruits", 'r+b')
+        self.fruitFile.truncate(self.nFruits * self.fruitDtype.itemsize)
+        self.fruitFile.seek(0, 2)
+
+
+def loadChainArchive(filename):
+    '''
+    Returns the (blocks, fruits) arrays of an archive, like loadChainRecords
+    '''
+    blockRows = np.fromfile(filename + "_blocks", dtype=ChainArchive.blockDtype)
+    fruitRows = np.fromfile(filename + "_fruits", dtype=ChainArchive.fruitDtype)
+    blocks = {name: blockRows[name].copy() for name, dtype in BLOCK_FIELDS}
+    fruits = {name: fruitRows[name].copy() for name, dtype in FRUIT_FIELDS}
+    return blocks, fruits
+
+def loadChainRecords(filename):
+    '''
+    Returns the (blocks, fruits) arrays saved by ChainRecorder.save
+    '''
+    with np.load(filename) as data:
+        blocks = {name: data['block_' + name] for name, dtype in BLOCK_FIELDS}
+        fruits = {name: data['fruit_' + name] for name, dtype in FRUIT_FIELDS}
+    return blocks, fruits
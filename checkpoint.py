@@ -0,0 +1,87 @@
+#coding: utf-8
+import pickle
+import zlib
+import os
+import sys
+import traceback
+
+def writeCheckpoint(obj, path):
+    '''
+    Pickle and compress obj, then atomically replace the file at path
+    '''
+    data = zlib.compress(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL), 1)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+
+def loadCheckpoint(path):
+    with open(path, 'rb') as file:
+        return pickle.loads(zlib.decompress(file.read()))
+
+class Checkpointer:
+    def __init__(self, path):
+        '''
+        path: file the latest checkpoint is kept in
+
+        Writes checkpoints in the background. Where the OS can fork, a child process
+        gets a copy-on-write snapshot of the state and pickles and writes it, so the
+        simulation only pauses for the fork. Otherwise the checkpoint is written in place.
+        '''
+        self.path = path
+        self.pid = None
+
+    def save(self, obj):
+        self.wait()
+        if not hasattr(os, 'fork'):
+            writeCheckpoint(obj, self.path)
+            return
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                writeCheckpoint(obj, self.path)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            sys.stderr.flush()
+            os._exit(status) # skip cleanup of the parent's state
+        self.pid = pid
+
+    def wait(self):
+        '''
+        Wait until the checkpoint that is being written is on disk
+        '''
+        if self.pid != None:
+            self.reaped(*os.waitpid(self.pid, 0))
+
+    def poll(self):
+        '''
+        Check without blocking whether the checkpoint being written failed, so a run
+        finds out as soon as the writer exits instead of at the next save
+        '''
+        if self.pid != None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid != 0:
+                self.reaped(pid, status)
+
+    def reaped(self, pid, status):
+        '''
+        The writer exited with the given wait status, raises a RuntimeError if it failed
+        '''
+        self.pid = None
+        if status != 0:
+            raise RuntimeError("writing checkpoint " + self.path + " failed, exit status " +
+                str(os.waitstatus_to_exitcode(status)) + " (the writer's traceback is on stderr)")
+
+    def remove(self):
+        self.wait()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pid'] = None
+        return state
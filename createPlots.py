@@ -1,83 +1,102 @@
+#coding: utf-8
+
+#python3 createPlots.py results1 results2 --processes 4
 import numpy as np
 import matplotlib.pyplot as plt
+from results import *
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+
+# Size of the figures in inches and their resolution, a series is reduced to one bucket per pixel column
+FIGSIZE = (10, 10)
+DPI = 100
+
+def decimate(x, y, nBuckets):
+    '''
+    x, y: series to plot
+    nBuckets: number of buckets, e.g. the pixel columns of the plot
+
+    Returns (x, y) with the min and the max of y in each bucket of consecutive
+    points, so the plot keeps the envelope and spikes of y with 2*nBuckets points
+    '''
+    if len(y) <= 2*nBuckets:
+        return x, y
+    starts = np.unique(np.linspace(0, len(y), nBuckets, endpoint=False).astype(np.int64))
+    decimatedX = np.repeat(np.asarray(x)[starts], 2)
+    decimatedY = np.empty(2*len(starts), dtype=np.result_type(y))
+    decimatedY[0::2] = np.minimum.reduceat(y, starts)
+    decimatedY[1::2] = np.maximum.reduceat(y, starts)
+    return decimatedX, decimatedY
+
+def isUpToDate(figure, source):
+    '''
+    A figure doesn't need to be rendered again if it's newer than its source data
+    '''
+    return os.path.exists(figure) and os.path.getmtime(figure) >= os.path.getmtime(source)
+
+def plotSeries(figure, x, series, xlabel, ylabel):
+    '''
+    series: (y, style, label) of each line
+    '''
+    plt.figure(figsize=FIGSIZE, dpi=DPI)
+    nBuckets = FIGSIZE[0] * DPI
+    for y, style, label in series:
+        plt.plot(*decimate(x, y, nBuckets), style, label=label)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.legend()
+    plt.savefig(figure)
+    plt.close()
 
-def plotStatistics(filename):
-    """ file format: (roundNum, nUnprocessed, nProcessed) """
-    filename += "_stats"
-    log = np.loadtxt(filename, delimiter=",")
-
-    unprocessedTxs = []
-    processedTxs = []
-
-    miningPoolFrac = []
-    soloFrac = []
-
-    bitcoinReward = []
-    fruitchainReward = []
-
-    for item in log:
-        unprocessedTxs.append(item[1])
-        processedTxs.append(item[2])
+def plotStatistics(filename, force=False):
+    """
+    file format: (roundNum, nUnprocessed, nProcessed, poolHashFraction, bitcoinReward, fruitchainReward)
+    force: render figures that are newer than the stats too
+    """
+    source = resultFile(filename, "stats")
+    figures = [filename + "_stats" + suffix for suffix in ("_txs.png", "_pool.png", "_bitcoinVsFruitchain.png")]
+    if not force and all(isUpToDate(figure, source) for figure in figures):
+        return
+    params, stats = loadResults(source) # columns of binary files are views of the mapped file
 
-        miningPoolFrac.append(item[3])
-        soloFrac.append(1-item[3])
+    rounds = stats['roundNum']
+    unprocessedTxs = stats['unprocessedTxs']
+    processedTxs = stats['processedTxs']
 
-        bitcoinReward.append(item[4])
-        fruitchainReward.append(item[5])
+    miningPoolFrac = stats['poolHashFraction']
+    soloFrac = 1 - miningPoolFrac
 
+    bitcoinReward = stats['bitcoinReward']
+    fruitchainReward = stats['fruitchainReward']
 
     # 1. Plot txs
-    plt.figure(figsize=(10,10))
-    plt.plot(processedTxs, '-b', label='Processed Txs')
-    plt.plot(unprocessedTxs, '-r', label='Unprocessed Txs')
-    plt.xlabel("Rounds")
-    plt.ylabel("Number of Txs")
-    plt.legend()
-    plt.savefig(filename + "_txs.png")
-    plt.close()
-
+    plotSeries(figures[0], rounds, [(processedTxs, '-b', 'Processed Txs'), (unprocessedTxs, '-r', 'Unprocessed Txs')],
+        "Rounds", "Number of Txs")
 
     # 2. Plot miningPool fractions
-    plt.figure(figsize=(10,10))
-    plt.plot(soloFrac, '-b', label='Solo Miners')
-    plt.plot(miningPoolFrac, '-r', label='Mining Pool')
-    plt.xlabel("Rounds")
-    plt.ylabel("Hash Power Fraction")
-    plt.legend()
-    plt.savefig(filename + "_pool.png")
-    plt.close()
+    plotSeries(figures[1], rounds, [(soloFrac, '-b', 'Solo Miners'), (miningPoolFrac, '-r', 'Mining Pool')],
+        "Rounds", "Hash Power Fraction")
 
     # 3. Plot BitcoinReward vs FruitchainReward
-    plt.figure(figsize=(10,10))
-    plt.plot(bitcoinReward, '-b', label='Bitcoin Reward')
-    plt.plot(fruitchainReward, '-r', label='Fruitchain Reward')
-    plt.xlabel("Rounds")
-    plt.ylabel("Amount of Reward")
-    plt.legend()
-    plt.savefig(filename + "_bitcoinVsFruitchain.png")
-    plt.close()
-
-
-def plotMinerRewards(filename):
-    """ file format: (minerID, hashFracs, rewards) """
-    plt.figure(figsize=(10,10))
-    filename += "_rewards"
-    log = np.loadtxt(filename, delimiter=",")
-
-    hashFracs = []
-    bitcoinRewards = []
-    fruitchainRewards = []
+    plotSeries(figures[2], rounds, [(bitcoinReward, '-b', 'Bitcoin Reward'), (fruitchainReward, '-r', 'Fruitchain Reward')],
+        "Rounds", "Amount of Reward")
 
-    for item in log:
-        hashFracs.append(item[1])
-        bitcoinRewards.append(item[2])
-        fruitchainRewards.append(item[3])
 
-    totalBitcoinReward = sum(bitcoinRewards)
-    bitcoinRewards = [i/totalBitcoinReward for i in bitcoinRewards]
+def plotMinerRewards(filename, force=False):
+    """
+    file format: (minerID, hashFracs, rewards)
+    force: render the figure if it's newer than the rewards too
+    """
+    source = resultFile(filename, "rewards")
+    figure = filename + "_rewards_hashPowVsRewards.png"
+    if not force and isUpToDate(figure, source):
+        return
+    params, rewards = loadResults(source)
 
-    totalFruitchainReward = sum(fruitchainRewards)
-    fruitchainRewards = [i/totalFruitchainReward for i in fruitchainRewards]
+    hashFracs = rewards['hashFrac']
+    bitcoinRewards = rewards['totalBitcoinReward'] / rewards['totalBitcoinReward'].sum()
+    fruitchainRewards = rewards['totalFruitchainReward'] / rewards['totalFruitchainReward'].sum()
 
     N = len(hashFracs)
     ind = np.arange(N)
@@ -107,4 +126,38 @@ def plotMinerRewards(filename):
     autolabel(rects2)
     autolabel(rects3)
 
-    plt.savefig(filename + "_hashPowVsRewards.png")
+    plt.savefig(figure)
+    plt.close(fig)
+
+def plotRun(task):
+    '''
+    task: (prefix of the result files of a run, force)
+    '''
+    filename, force = task
+    plotStatistics(filename, force)
+    plotMinerRewards(filename, force)
+    return filename
+
+def useAgg():
+    # workers only write files, they don't need an interactive backend
+    plt.switch_backend('Agg')
+
+def plotAll(filenames, processes=None, force=False):
+    '''
+    filenames: prefixes of the result files of the runs
+    processes: number of worker processes, None means one per core
+
+    Render the figures of every run in a process pool, figures newer than their results are skipped
+    '''
+    with ProcessPoolExecutor(processes, initializer=useAgg) as executor:
+        return list(executor.map(plotRun, [(filename, force) for filename in filenames]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot the results of simulator runs')
+    parser.add_argument('filenames', nargs='+', help='prefixes of the result files')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='render figures that are up to date too')
+    args = parser.parse_args()
+    for filename in plotAll(args.filenames, args.processes, args.force):
+        print('Plotted ' + filename)
@@ -1,5 +1,30 @@
 #coding: utf-8
+from collections import defaultdict
+from array import array
+
+# Bits of a key reserved for minerID+1, keys are collision-free while minerID < 2**ID_BITS - 1
+ID_BITS = 32
+
+def recordKey(minerID, mineRound, kind):
+    '''
+    mineRound||minerID+1||kind as an integer where || denotes concatenation
+    kind is 0 for fruits and 1 for blocks, to distinct them
+    '''
+    return (((mineRound << ID_BITS) | (minerID + 1)) << 1) | kind
+
+def chainDigest(digest, b):
+    '''
+    Digest of a chain after appending block b to a chain with the given digest, 0 for the empty chain.
+    Chains with the same blocks have the same digest. It's Python's tuple hash, not a cryptographic
+    one, so different chains can have the same digest too; equal digests are a fast check, not a proof.
+    The miner and round are hashed instead of b.key, which wraps mod 2**61-1 once mineRound >= 2**28
+    '''
+    return hash((digest, b.minerID, b.mineRound))
+
+
 class Transaction:
+    __slots__ = ('bcastRound', 'fee', 'size', 'includeRound')
+
     def __init__(self, bcastRound, fee, size=1):
         self.bcastRound = bcastRound
         self.fee = fee
@@ -17,6 +42,8 @@ class Transaction:
 
 
 class Fruit:
+    __slots__ = ('minerID', 'hangBlockHeight', 'mineRound', 'includeRound', 'contBlockHeight', 'key')
+
     def __init__(self, minerID=-1, mineRound=0, hangIndex=0):
         '''
         minerID: id of miner who mined the fruit
@@ -27,38 +54,41 @@ class Fruit:
         self.mineRound = mineRound
         self.includeRound = 0
         self.contBlockHeight = 0 # height of the block that contains the fruit
+        # minerID and mineRound uniquely determine a fruit
+        self.key = recordKey(minerID, mineRound, 0)
 
     def __hash__(self):
-        # minerID||mineRound||0 uniquely determines a fruit where || denotes concatanetion
-        # 0 is there to distinct block and fruits
-        return hash(str(self.minerID) + str(self.mineRound) + str(0))
+        return self.key
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return isinstance(other, Fruit) and self.key == other.key
 
     def __repr__(self):
         return str(self.minerID) + '|' + str(self.mineRound) + '|' + str(0)
 
 
 class Block:
+    __slots__ = ('minerID', 'mineRound', 'fruits', 'txs', 'totalFee', 'nTxs', 'height', 'nFruits', 'key')
+    size = 10**4  # in bytes
+
     def __init__(self, minerID=-1, mineRound=0, fruits=set(), txs=[]):
         self.minerID = minerID
         self.mineRound = mineRound
         self.fruits = fruits
-        self.txs = txs
+        self.txs = txs # only filled in when txs are traced, see TraceMempool
         self.totalFee = 0 #sum of fees in txs set
+        self.nTxs = 0
         self.height = 1 # index + 1
 
         self.nFruits = len(fruits)
-        self.size = 10**4  # in bytes
+        # minerID and mineRound uniquely determine a block
+        self.key = recordKey(minerID, mineRound, 1)
 
     def __hash__(self):
-        # minerID||mineRound||1 uniquely determines a block where || denotes concatanetion
-        # 1 is there to distinct block and fruits
-        return hash(str(self.minerID) + str(self.mineRound) + str(1))
+        return self.key
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return isinstance(other, Block) and self.key == other.key
 
     def __repr__(self):
         return str(self.minerID) + '|' + str(self.mineRound) + '|' + str(1)
@@ -66,36 +96,163 @@ class Block:
 
 class Blockchain:
     def __init__(self):
+        '''
+        digests: digests[i] is the digest of the first i+1 blocks, see chainDigest
+
+        Chains are compared by the digests of their prefixes, so equality is O(1)
+        and the common prefix of two chains is found by binary search
+        '''
         self.chain = [] # just a list, not a tree, can be changed later if we broadcast blocks
+        self.digests = array('q')
         self.length = 0
         self.append(Block()) # every chain starts with the genesis
 
     def append(self, b):
+        self.digests.append(chainDigest(self.digests[-1] if self.digests else 0, b))
         self.chain.append(b)
         self.length += 1
         b.height = self.length
         self.head = b
 
+    def digest(self, height=None):
+        '''
+        Returns the digest of the first height blocks, of the whole chain if height is None
+        '''
+        if height == None:
+            return self.digests[-1]
+        return self.digests[height-1]
+
     def __getitem__(self, key):
         return self.chain[key]
 
     def __eq__(self, other):
-        if self.length != other.length:
-            return False
-        else:
-            for i in range(self.length):
-                if self.chain[i] != other.chain[i]:
-                    return False
-        return True
+        return self.length == other.length and self.digest() == other.digest()
 
     def __iter__(self):
-        self.ctr = 0
-        return self
-
-    def __next__(self):
-        if self.ctr < self.length:
-            b = self.chain[self.ctr]
-            self.ctr += 1
-            return b
+        return iter(self.chain)
+
+
+class RollingBlockchain(Blockchain):
+    def __init__(self, window, archive=None):
+        '''
+        window: number of most recent blocks kept in memory
+        archive: ChainArchive evicted blocks are written to, None drops them
+        offset: number of evicted blocks, chain[0] has height offset+1
+        onEvict: functions called with the evicted blocks, to drop what refers to them
+
+        Blockchain that only keeps its last blocks. Once the list holds 2*window
+        blocks the older half is evicted, so appending stays amortized O(1).
+        Heights, length and digests are the ones of the full chain, indexing an evicted
+        block raises an IndexError.
+        '''
+        self.window = window
+        self.archive = archive
+        self.offset = 0
+        self.onEvict = []
+        super().__init__()
+
+    def append(self, b):
+        super().append(b)
+        if len(self.chain) >= 2*self.window:
+            self.evict(len(self.chain) - self.window)
+
+    def evict(self, count):
+        evicted = self.chain[:count]
+        del self.chain[:count]
+        del self.digests[:count]
+        self.offset += count
+        if self.archive != None:
+            self.archive.addBlocks(evicted)
+        for function in self.onEvict:
+            function(evicted, self.offset+1)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if start < self.offset and start < stop:
+                raise IndexError("block " + str(start) + " was evicted from the chain")
+            return self.chain[max(start - self.offset, 0):max(stop - self.offset, 0):step]
+        if key < 0:
+            key += self.length
+        if key < self.offset or key >= self.length:
+            raise IndexError("block " + str(key) + " isn't in the chain window")
+        return self.chain[key - self.offset]
+
+    def digest(self, height=None):
+        '''
+        Digests of evicted prefixes are dropped with their blocks, asking for one raises an IndexError
+        '''
+        if height == None:
+            return self.digests[-1]
+        if height <= self.offset or height > self.length:
+            raise IndexError("digest of height " + str(height) + " isn't in the chain window")
+        return self.digests[height-1-self.offset]
+
+
+def firstKeptHeight(chain):
+    return getattr(chain, 'offset', 0) + 1
+
+def commonPrefix(chain1, chain2):
+    '''
+    Returns the number of blocks the chains have in common, O(log length) digests are compared.
+    A digest is O(1) for Blockchains and O(log length) for TreeChains (see TreeChain.digest).
+    Chains differ from height commonPrefix+1 on. Rolling chains must agree on the lowest height both keep
+    '''
+    low = max(firstKeptHeight(chain1), firstKeptHeight(chain2))
+    high = min(chain1.length, chain2.length)
+    if low > high or chain1.digest(low) != chain2.digest(low):
+        raise IndexError("chains differ below the heights they keep")
+    while low < high: # chains agree on the first low blocks
+        middle = (low + high + 1) // 2
+        if chain1.digest(middle) == chain2.digest(middle):
+            low = middle
         else:
-            raise StopIteration
+            high = middle - 1
+    return low
+
+def commonPrefixOfAll(chains):
+    '''
+    Returns the number of blocks all chains have in common. Chains with the digest of
+    the first one are skipped, so it's O(n) when they're all the same
+    '''
+    first = chains[0]
+    prefix = first.length
+    for chain in chains[1:]:
+        if chain.length < prefix or chain.digest(prefix) != first.digest(prefix):
+            prefix = min(prefix, commonPrefix(first, chain))
+    return prefix
+
+
+def pruneFruits(fruitsInChain, validFruits, evicted, firstHeight):
+    '''
+    Drop the fruits of evicted blocks from fruitsInChain, and the valid fruits
+    hanging from blocks below firstHeight. Neither can be fresh anymore
+    '''
+    for b in evicted:
+        for f in b.fruits:
+            fruitsInChain.pop(f.key, None)
+    for pos in [pos for pos in validFruits if pos < firstHeight]:
+        del validFruits[pos]
+
+
+class Ledger:
+    def __init__(self, window=None):
+        '''
+        blockChain: the canonical chain
+        validFruits: valid fruits mined by any node; <K, V> = <hangBlockPos, setOfFruits>
+        fruitsInChain: fruits that are in the blockchain; <K, V> = <fruit.key, block.height>
+        freshFruits: valid fruits that are not in the blockchain yet; <K, V> = <hangBlockPos, setOfFruits>
+
+        Without network delay every node has the same chain and fruits, so nodes
+        can share one copy of them instead of each keeping its own.
+        window: keep only the last window blocks in memory, see RollingBlockchain
+        '''
+        self.blockChain = Blockchain() if window == None else RollingBlockchain(window)
+        self.validFruits = defaultdict(set)
+        self.fruitsInChain = {}
+        self.freshFruits = {}
+        if window != None:
+            self.blockChain.onEvict.append(self.pruneFruits)
+
+    def pruneFruits(self, evicted, firstHeight):
+        pruneFruits(self.fruitsInChain, self.validFruits, evicted, firstHeight)
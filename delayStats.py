@@ -0,0 +1,148 @@
+#coding: utf-8
+import numpy as np
+
+class Histogram:
+    # Values below 2*SUB are counted exactly, larger ones in SUB buckets per power of two,
+    # so a bucket is less than 1/SUB of its values wide and the number of buckets grows with log(max)
+    SUB = 32
+    BITS = 6 # bits of the values counted exactly
+    # Added values are buffered and put in the buckets once there are BATCH of them
+    BATCH = 2**14
+
+    def __init__(self):
+        '''
+        counts: number of values in each bucket
+        n, total, low, high: number, sum, min. and max. of the values in the buckets
+        pending: (values, counts) arrays added since the buckets were last updated
+
+        Histogram of non-negative integers (delays in rounds or blocks) in bounded memory,
+        quantiles are exact for small values and within a bucket's width for the rest
+        '''
+        self.counts = np.zeros(2*self.SUB, dtype=np.int64)
+        self.n = 0
+        self.total = 0
+        self.low = None
+        self.high = None
+        self.pending = []
+        self.nPending = 0
+
+    def add(self, values, counts=1):
+        '''
+        Add the values, counts is the number of times each one occurs
+        '''
+        if len(values) == 0:
+            return
+        self.pending.append((values, counts))
+        self.nPending += len(values)
+        if self.nPending >= self.BATCH:
+            self.update()
+
+    def update(self):
+        '''
+        Put the pending values in the buckets
+        '''
+        if not self.pending:
+            return
+        values = np.concatenate([np.asarray(part, dtype=np.int64) for part, partCounts in self.pending])
+        counts = np.concatenate([np.broadcast_to(partCounts, np.shape(part)) for part, partCounts in self.pending]).astype(np.int64)
+        self.pending = []
+        self.nPending = 0
+        shift = np.maximum(np.frexp(values)[1] - self.BITS, 0)
+        buckets = self.SUB*shift + (values >> shift)
+        found = np.bincount(buckets, weights=counts).astype(np.int64)
+        if len(found) > len(self.counts):
+            self.counts = np.concatenate((self.counts, np.zeros(len(found) - len(self.counts), dtype=np.int64)))
+        self.counts[:len(found)] += found
+        self.n += int(counts.sum())
+        self.total += int((values * counts).sum())
+        low, high = int(values.min()), int(values.max())
+        self.low = low if self.low == None else min(self.low, low)
+        self.high = high if self.high == None else max(self.high, high)
+
+    def bounds(self, buckets):
+        '''
+        Returns the (lowest, highest) values of the buckets
+        '''
+        buckets = np.asarray(buckets, dtype=np.int64)
+        shift = np.maximum(buckets // self.SUB - 1, 0)
+        first = buckets - self.SUB*shift
+        return first << shift, ((first + 1) << shift) - 1
+
+    def quantile(self, q):
+        '''
+        Returns the highest value of the bucket the q-quantile falls in, None if nothing was added
+        '''
+        self.update()
+        if self.n == 0:
+            return None
+        rank = max(1, int(np.ceil(q * self.n)))
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return int(min(self.bounds(bucket)[1], self.high))
+
+    def mean(self):
+        '''
+        Returns the mean of the values, None if nothing was added
+        '''
+        self.update()
+        return self.total / self.n if self.n else None
+
+    def summary(self):
+        self.update()
+        return {'count': self.n, 'mean': self.mean(), 'min': self.low, 'max': self.high,
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99)}
+
+    def buckets(self):
+        '''
+        Returns (lowest values, highest values, counts) of the non-empty buckets
+        '''
+        self.update()
+        buckets = np.flatnonzero(self.counts)
+        lower, upper = self.bounds(buckets)
+        return lower, upper, self.counts[buckets]
+
+
+class DelayStats:
+    # Tracked delays, in the order they're written
+    metrics = ('txDelay', 'fruitDelay', 'hangDistance')
+
+    def __init__(self):
+        '''
+        txDelay: rounds from a tx's broadcast to the block that contains it
+        fruitDelay: rounds from a fruit's mining to the block that contains it
+        hangDistance: blocks from the block a fruit hangs from to the one that contains it
+
+        Online histograms of the delays, updated as blocks are mined. With network delay
+        only the blocks of the heaviest chain are counted, at the end of the run (see Environment.payRewards)
+        '''
+        self.histograms = {metric: Histogram() for metric in self.metrics}
+
+    def addTxs(self, roundNum, bcastRounds, counts):
+        '''
+        Txs taken into a block in roundNum, as returned by Mempool.fill
+        '''
+        self.histograms['txDelay'].add(roundNum - bcastRounds, counts)
+
+    def addFruits(self, fruits, roundNum, height):
+        '''
+        Fruits put in a block at the given height in roundNum
+        '''
+        if not fruits:
+            return
+        mineRounds = np.fromiter((f.mineRound for f in fruits), dtype=np.int64, count=len(fruits))
+        hangHeights = np.fromiter((f.hangBlockHeight for f in fruits), dtype=np.int64, count=len(fruits))
+        self.histograms['fruitDelay'].add(roundNum - mineRounds)
+        self.histograms['hangDistance'].add(height - hangHeights)
+
+    def summary(self):
+        return {metric: histogram.summary() for metric, histogram in self.histograms.items()}
+
+    def columns(self):
+        '''
+        Returns the non-empty buckets of all histograms as columns; <K, V> = <name, array>,
+        metric is the index of the histogram in metrics
+        '''
+        parts = [(j,) + self.histograms[metric].buckets() for j, metric in enumerate(self.metrics)]
+        return {'metric': np.concatenate([np.full(len(counts), j, dtype=np.int64) for j, lower, upper, counts in parts]),
+            'lower': np.concatenate([lower for j, lower, upper, counts in parts]).astype(np.int64),
+            'upper': np.concatenate([upper for j, lower, upper, counts in parts]).astype(np.int64),
+            'count': np.concatenate([counts for j, lower, upper, counts in parts]).astype(np.int64)}
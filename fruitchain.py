@@ -1,5 +1,15 @@
 #coding: utf-8
 from dataStructures import *
+from leaderSampler import *
+from mempool import *
+from rewards import *
+from miningPools import *
+from instrumentation import *
+from chainRecords import *
+from nodeTable import *
+from workload import *
+from blockTree import *
+from delayStats import *
 from math import ceil
 import random
 from collections import defaultdict
@@ -7,12 +17,31 @@ import numpy as np
 import bisect
 
 class Environment:
-    def __init__(self, p = 1, pF = 1, txRate = 5, k = 16):
+    def __init__(self, p = 1, pF = 1, txRate = 5, k = 16, seed = None, sharedLedger = False, txTrace = False, mempoolCapacity = None,
+        fruitchainRewards = True, poolDynamics = False, poolPolicy = None, postHocRewards = False,
+        nodeTable = False, rollingWindow = None, workload = None, networkDelay = None, forkChoice = 'longest',
+        audit = False, delayStats = False):
         '''
         p: pr. of mining a block in a rounds
         pF: pr. of mining a fruit in a round
         txRate: # of txs supplied to system each round
         k: determines how far a fruit can hang
+        seed: seed of the random generator, same seed gives the same run
+        sharedLedger: nodes share one chain and fruit pool, so a broadcast costs O(1) instead of O(n)
+        txTrace: keep a Transaction object for every tx instead of counts of them
+        mempoolCapacity: max. total size of unprocessed txs, lowest fee rate ones are evicted beyond it
+        fruitchainRewards: also pay rewards acc. to Fruitchain scheme when a block is mined
+        poolDynamics: update the mining pools at the end of every round
+        poolPolicy: PoolPolicy deciding when nodes join/leave which pool, default is a single pool nodes never leave
+        postHocRewards: only record the chain while mining, rewards are computed from the records by payRewards
+        nodeTable: keep the per-node fields in a NodeTable, nodes must be TableNodes
+        rollingWindow: keep only the last rollingWindow blocks of chains in memory (see RollingBlockchain), None keeps all
+        workload: generates the txs of each round (see workload.py), default is txRate txs with fee 1 and size 1
+        networkDelay: blocks reach each other node 0..networkDelay rounds after they're mined, so forks happen.
+                      Chains are kept in a shared BlockTree, None delivers every block at once
+        forkChoice: 'longest' or 'heaviest' (most fruits, see fruitWeight) chain is adopted with network delay
+        audit: check that the chains of all nodes agree after every block, see auditChains
+        delayStats: keep histograms of tx and fruit inclusion delays (see DelayStats)
 
         Environment of the protocol. Handles a mining process.
         '''
@@ -23,21 +52,64 @@ class Environment:
         self.nodes = []
         self.honestNodes = []
         self.corruptNodes = []
+        self.rng = np.random.default_rng(seed)
+        if rollingWindow != None and rollingWindow < k + 2:
+            raise ValueError("rolling window must keep at least k+2 blocks")
+        self.rollingWindow = rollingWindow
+        self.ledger = Ledger(rollingWindow) if sharedLedger else None
 
         # Mining pool related params
-        self.miningPool = set()
-        self.poolHashFraction = 0
+        self.poolDynamics = poolDynamics
+        self.poolPolicy = poolPolicy if poolPolicy != None else PoolPolicy()
+        self.pools = [set() for i in range(self.poolPolicy.nPools)]
+        self.poolHashFractions = [0 for i in range(self.poolPolicy.nPools)]
+        self.poolOf = {} # <K, V> = <Node id, index of its pool>
+        self.miningPool = self.pools[0]
+        self.poolHashFraction = 0 # of all pools
         self.rewardTime = defaultdict(int) # <K, V> = <Node id, Round num. of last reward>
+        self.poolDeadlines = DeadlineQueue() # next round each honest node joins/leaves a pool
 
         # Keep track of txs
-        self.unprocessedTxs = []
-        self.processedTxs = []
+        if txTrace:
+            self.mempool = TraceMempool(mempoolCapacity)
+        elif networkDelay != None:
+            self.mempool = ForkMempool() # checked below
+        else:
+            self.mempool = Mempool(mempoolCapacity)
+        self.workload = workload # None is txRate txs with fee 1 and size 1 each round
+        if workload != None:
+            workload.useRng(self.rng.spawn(1)[0]) # a child stream, the draws of the run don't change
 
         # Fruitchain related params.
         self.c1 = 1/100
         self.c2 = 1/10
         self.c3 = 1/100
         self.nFruitsInWindow = 0
+        self.fruitchainRewards = fruitchainRewards
+        self.fruitchainWindow = None
+        if postHocRewards and poolDynamics:
+            raise ValueError("post-hoc rewards need nodes to mine solo, they can't be used with pool dynamics")
+        self.chainRecorder = ChainRecorder() if postHocRewards else None
+        self.blockTree = None
+        if forkChoice not in ('longest', 'heaviest'):
+            raise ValueError("fork choice must be 'longest' or 'heaviest', not " + repr(forkChoice))
+        if networkDelay != None:
+            if not postHocRewards or sharedLedger or rollingWindow != None:
+                raise ValueError("network delay needs post-hoc rewards, and private chains that aren't rolling")
+            if txTrace or mempoolCapacity != None:
+                raise ValueError("network delay needs a mempool of counted txs without a capacity")
+            self.blockTree = BlockTree(fruitWeight if forkChoice == 'heaviest' else None)
+            self.deliveries = DeliveryQueue()
+            self.delayRng = self.rng.spawn(1)[0]
+        self.networkDelay = networkDelay
+        self.audit = audit
+        self.nodeTable = NodeTable() if nodeTable else None
+
+        self.instrumentation = None # Instrumentation timing the phases of each round, see instrument
+        self.delayStats = DelayStats() if delayStats else None # histograms of tx/fruit inclusion delays, updated as blocks are mined
+        # with network delay, <K, V> = <block.key, groups (bcastRound, fee, size, count) of its txs>
+        self.blockTxs = {}
+        self.mempoolTip = 0 # with network delay, the mempool holds the txs that aren't in the chain ending at this block
 
     def initializeNodes(self, nodes, t = 0):
         '''
@@ -50,26 +122,65 @@ class Environment:
         self.nodes = nodes
         self.n = len(nodes)
         self.t = t
+        if self.nodeTable != None:
+            if not all(isinstance(node, TableNode) for node in nodes):
+                raise ValueError("nodes of an environment with a node table must be TableNodes")
+            self.rewardTime = self.nodeTable.rewardTime
         self.blockLeaderProbs = []
         self.fruitLeaderProbs = []
         for i in range(self.n):
             self.blockLeaderProbs.append(self.p*nodes[i].hashFrac)
             self.fruitLeaderProbs.append(self.pF*nodes[i].hashFrac)
             nodes[i].environment = self
+            if self.ledger != None:
+                nodes[i].useLedger(self.ledger)
             if i < self.n-self.t:
                 self.honestNodes.append(nodes[i])
+                self.poolDeadlines.schedule(nodes[i].id, self.poolPolicy.joinDeadline(self, nodes[i]))
             else:
                 self.corruptNodes.append(nodes[i])
         self.blockLeaderProbs.append(1-self.p) # prob. of nobody mines a block in a round
         self.fruitLeaderProbs.append(1-self.pF) # prob. of nobody mines a fruit in a round
+        self.leaderSampler = LeaderSampler(self.blockLeaderProbs, self.fruitLeaderProbs, self.rng)
+        if self.fruitchainRewards and self.chainRecorder == None:
+            self.fruitchainWindow = FruitchainWindow(self.k, self.c1, self.c2, self.c3)
+
+    def instrument(self):
+        '''
+        Start recording the time of each phase of a round and counters of what's mined,
+        returns the Instrumentation they're recorded in
+        '''
+        if self.instrumentation == None:
+            self.instrumentation = Instrumentation()
+        return self.instrumentation
+
+    def archiveChain(self, archive):
+        '''
+        Write the blocks evicted from the rolling chain to archive (ChainArchive).
+        Every node has the same chain, so only node 0's is archived
+        '''
+        self.nodes[0].blockChain.archive = archive
 
     def generateTxs(self, roundNum):
-        for i in range(self.txRate):
-            fee = 1
-            tx = Transaction(roundNum, fee, 1)
-            # check this unprocessed txs sorted
-            # bisect.insort(self.unprocessedTxs, tx)
-            self.unprocessedTxs.append(tx)
+        if self.workload == None:
+            self.mempool.add(roundNum, 1, 1, self.txRate)
+        else:
+            self.workload.generate(self.mempool, roundNum)
+
+    def generateIdleTxs(self, firstRound, lastRound):
+        '''
+        Generate the txs of rounds firstRound..lastRound in which nothing is mined
+        '''
+        if self.workload == None:
+            self.mempool.addRounds(np.arange(firstRound, lastRound+1), 1, 1, self.txRate)
+        else:
+            self.workload.generateRange(self.mempool, firstRound, lastRound)
+
+    def arrivals(self, firstRound, lastRound):
+        '''
+        Returns the number of txs arriving in each of rounds firstRound..lastRound, a scalar if it's the same every round
+        '''
+        return self.txRate if self.workload == None else self.workload.arrivals(firstRound, lastRound)
 
     def step(self, roundNum):
         '''
@@ -80,30 +191,161 @@ class Environment:
         '''
         #print("Round:" + str(roundNum) + " started.")
 
+        ins = self.instrumentation
+        if ins != None:
+            start = perf_counter()
         # 1. Generate new txs
         self.generateTxs(roundNum)
+        if ins != None:
+            start = ins.lap('txs', start)
         # 2. Check if someone mines
         # Pick an ID for the miner of the block in this round. If ID is n, nobody mines
-        blockLeaderID = np.random.choice(self.n+1, 1, p=self.blockLeaderProbs)[0]
-        fruitLeaderID = np.random.choice(self.n+1, 1, p=self.fruitLeaderProbs)[0]
+        blockLeaderID, fruitLeaderID = self.leaderSampler.next()
+        if ins != None:
+            ins.lap('leaders', start)
+        return self.mine(roundNum, blockLeaderID, fruitLeaderID)
+
+    def mine(self, roundNum, blockLeaderID, fruitLeaderID):
+        '''
+        roundNum: number of the current round
+        blockLeaderID, fruitLeaderID: leaders of the round, ID n means nobody mines
+
+        Have the leaders mine and send mining results to all nodes
+        '''
         b, f = None, None
+        ins = self.instrumentation
+        if ins != None:
+            start = perf_counter()
+        if self.blockTree != None:
+            self.deliverBlocks(roundNum)
+        # The fruit is mined first so it hangs from the chain the round started with. In the
+        # shared ledger it's only published after the block so the block can't contain it
+        if fruitLeaderID != self.n and blockLeaderID != fruitLeaderID: # same node can't mine both a block and a fruit
+            f = self.nodes[fruitLeaderID].mineFruit(roundNum, self.ledger == None and self.blockTree == None)
+            if ins != None:
+                start = ins.lap('mineFruit', start)
+                ins.observe('fruits')
         if blockLeaderID != self.n:
+            if self.blockTree != None:
+                self.moveMempool(self.nodes[blockLeaderID].blockChain.tip)
             b = self.nodes[blockLeaderID].mineBlock(roundNum)
-            self.rewardBitcoin(blockLeaderID, roundNum)
-            # self.rewardFruitchain(blockLeaderID, roundNum)
-        if fruitLeaderID != self.n and blockLeaderID != fruitLeaderID: # same node can't mine both a block and a fruit
-            f = self.nodes[fruitLeaderID-1].mineFruit(roundNum)
-        # 3. Broadcast what's been mined
-        if b != None or f != None:
+            if self.blockTree != None:
+                # the block's txs are out of the mempool, it follows the heaviest chain between blocks
+                self.blockTxs[b.key] = self.mempool.taken
+                self.mempoolTip = self.nodes[blockLeaderID].blockChain.tip
+                self.moveMempool(self.blockTree.best)
+            if ins != None:
+                start = ins.lap('mineBlock', start)
+                ins.observe('freshFruitsPerBlock', b.nFruits)
+                ins.observe('txsPerBlock', b.nTxs)
+                ins.observe('mempoolSize', len(self.mempool))
+            if self.chainRecorder != None:
+                if self.blockTree == None: # with network delay the chain that wins is only known at the end, see payRewards
+                    self.chainRecorder.addBlock(b)
+            else:
+                self.rewardBitcoin(blockLeaderID, roundNum)
+                if self.fruitchainWindow != None:
+                    self.fruitchainWindow.addBlock(b, self.nodes,
+                        self.nodeTable.totalFruitchainReward if self.nodeTable != None else None)
+            if ins != None:
+                start = ins.lap('rewards', start)
+        # 3. Broadcast what's been mined. Miners already put blocks in the shared ledger if there is one,
+        # with network delay fruits go to the pool of the block tree and blocks are delivered later
+        if self.ledger != None:
+            if f != None:
+                self.nodes[fruitLeaderID].addFruit(f)
+        elif self.blockTree != None:
+            if f != None:
+                self.blockTree.addFruit(f, self.nodes[fruitLeaderID].blockChain.tip)
+            if b != None:
+                self.scheduleDelivery(roundNum, blockLeaderID)
+                self.blockTree.pruneFruits(self.k)
+        elif b != None or f != None:
             for node in self.nodes:
                 node.deliver((b, f))
+        if ins != None and (b != None or f != None):
+            start = ins.lap('deliver', start)
+        if self.audit and b != None:
+            self.auditChains(roundNum)
 
         # 4. (Optional) update the mining pool
-        # self.updateMiningPool(roundNum)
+        if self.poolDynamics:
+            self.updateMiningPool(roundNum)
+            if ins != None:
+                ins.lap('pools', start)
 
         #print("Round:" + str(roundNum) + " ended.")
         return b, f
 
+    def scheduleDelivery(self, roundNum, minerID):
+        '''
+        Send the block minerID just mined to the other nodes, each gets it after a delay
+        of 0..networkDelay rounds. Blocks with no delay are delivered at once
+        '''
+        i = self.nodes[minerID].blockChain.tip
+        delays = self.deliveryDelays(minerID)
+        delays[minerID] = -1
+        order = np.argsort(delays, kind='stable')
+        bounds = np.searchsorted(delays[order], np.arange(self.networkDelay + 2))
+        for delay in range(self.networkDelay + 1):
+            recipients = order[bounds[delay]:bounds[delay+1]]
+            if len(recipients) == 0:
+                continue
+            if delay == 0:
+                self.blockTree.deliver(i, recipients)
+            else:
+                self.deliveries.schedule(roundNum + delay, i, recipients)
+
+    def deliveryDelays(self, minerID):
+        '''
+        Returns the delay in rounds of the block of minerID to each node. Override it
+        to model other networks, e.g. corrupt nodes withholding their blocks
+        '''
+        return self.delayRng.integers(0, self.networkDelay + 1, self.n)
+
+    def moveMempool(self, tip):
+        '''
+        Make the mempool hold the txs that aren't in the chain ending at block tip: the txs
+        of blocks that leave the chain are put back, the ones of blocks that join it removed
+        '''
+        left, joined = self.blockTree.reorg(self.mempoolTip, tip)
+        for b in left:
+            self.mempool.putBack(self.blockTxs[b.key])
+        for b in joined:
+            self.mempool.remove(self.blockTxs[b.key])
+        self.mempoolTip = tip
+
+    def deliverBlocks(self, roundNum):
+        '''
+        Deliver the blocks that reach nodes by roundNum, before anything is mined in it
+        '''
+        for i, recipients in self.deliveries.popDue(roundNum):
+            self.blockTree.deliver(i, recipients)
+
+    def auditChains(self, roundNum):
+        '''
+        Check that every node has the same chain, raises a RuntimeError with the height the first
+        differing chain diverges at. Only the digests of the heads are compared, so it's O(n) a block.
+        With network delay chains may fork, the number of blocks of the heaviest chain after
+        the common prefix of all nodes is observed as forkDepth by the instrumentation instead
+        '''
+        if self.ledger != None:
+            return # every node has the ledger's chain
+        if self.blockTree != None:
+            tree = self.blockTree
+            tips = np.unique(tree.tips[:self.n])
+            common = int(tips[0])
+            for tip in tips[1:]:
+                common = tree.commonAncestor(common, int(tip))
+            if self.instrumentation != None:
+                self.instrumentation.observe('forkDepth', int(tree.height[tree.best] - tree.height[common]))
+            return
+        chain = self.nodes[0].blockChain
+        for node in self.nodes[1:]:
+            if node.blockChain != chain:
+                raise RuntimeError("in round " + str(roundNum) + " the chain of node " + str(node.id) +
+                    " diverges from node 0's at height " + str(commonPrefix(chain, node.blockChain) + 1))
+
     def rewardBitcoin(self, blockLeaderID, roundNum=0):
         """
         blockLeaderID: index of the leader node
@@ -113,21 +355,66 @@ class Environment:
         If he's in pool, every member of pool gets a reward w.r.t to their hash fraction
         """
         totalFee = self.nodes[blockLeaderID].blockChain.head.totalFee
-        if blockLeaderID not in self.miningPool:
+        pool = self.poolOf.get(blockLeaderID)
+        if pool == None:
             self.nodes[blockLeaderID].totalBitcoinReward += totalFee
             self.rewardTime[blockLeaderID] = roundNum
+            if blockLeaderID < self.n - self.t: # got a reward, so the wait for joining a pool starts over
+                self.poolDeadlines.schedule(blockLeaderID, self.poolPolicy.joinDeadline(self, self.nodes[blockLeaderID]))
             return
-        for i in self.miningPool:
+        if self.nodeTable != None:
+            self.nodeTable.payPool(pool, totalFee, self.poolHashFractions[pool], roundNum)
+            return
+        for i in self.pools[pool]:
             node = self.nodes[i]
-            node.totalBitcoinReward += round(totalFee * (node.hashFrac / self.poolHashFraction))
+            node.totalBitcoinReward += round(totalFee * (node.hashFrac / self.poolHashFractions[pool]))
             self.rewardTime[i] = roundNum
 
+    def recordTxs(self, block, bcastRounds, counts):
+        '''
+        Add the delays of the txs put in block, as returned by Mempool.fill, to delayStats.
+        With network delay payRewards counts the ones of the blocks of the heaviest chain instead
+        '''
+        if self.delayStats != None and self.blockTree == None:
+            self.delayStats.addTxs(block.mineRound, bcastRounds, counts)
+
+    def recordFruits(self, block, fruits):
+        '''
+        Add the delays of the fruits put in block to delayStats, see recordTxs
+        '''
+        if self.delayStats != None and self.blockTree == None:
+            self.delayStats.addFruits(fruits, block.mineRound, block.height)
+
+    def payRewards(self):
+        '''
+        Set the total rewards of every node from the recorded chain, see postHocRewards.
+        With network delay the recorded chain is the heaviest one of the block tree
+        '''
+        if self.blockTree != None:
+            self.chainRecorder = ChainRecorder()
+            for b in self.blockTree.chain(self.blockTree.best)[1:]:
+                self.chainRecorder.addBlock(b)
+                if self.delayStats != None:
+                    groups = self.blockTxs[b.key]
+                    self.delayStats.addTxs(b.mineRound, np.array([group[0] for group in groups], dtype=np.int64),
+                        np.array([group[3] for group in groups], dtype=np.int64))
+                    self.delayStats.addFruits(b.fruits, b.mineRound, b.height)
+        blocks, fruits = self.chainRecorder.records()
+        bitcoin = bitcoinRewards(blocks, self.n)
+        for node in self.nodes:
+            node.totalBitcoinReward = int(bitcoin[node.id])
+        if self.fruitchainRewards:
+            fruitchain = fruitchainRewards(blocks, fruits, self.n, self.k, self.c1, self.c2, self.c3)
+            for node in self.nodes:
+                node.totalFruitchainReward = float(fruitchain[node.id])
+
     def rewardFruitchain(self, blockLeaderID, roundNum=0):
         """
         blockLeaderID: index of the leader node
 
         Distributes rewards to miners according to Fruitchain rewarding scheme
-        (see paper)
+        (see paper) by walking the fruits of the last k blocks. step uses
+        FruitchainWindow which gives the same rewards incrementally
         """
         head = self.nodes[blockLeaderID].blockChain.head
         blockChain = self.nodes[blockLeaderID].blockChain
@@ -154,12 +441,50 @@ class Environment:
 
     def updateMiningPool(self, roundNum):
         """
-        Have nodes that wait more than their expected time join the mining pool
+        Have nodes that wait more than their expected time join the mining pool.
+        Only nodes whose deadline has passed are touched, the policy decides what they do
         """
-        for node in self.honestNodes:
-            if (node.id not in self.miningPool) and (roundNum - self.rewardTime[node.id]) >= node.expectedBlockInterval:
-                node.joinPool()
-                self.poolHashFraction += node.hashFrac
+        for nodeID in self.poolDeadlines.popDue(roundNum):
+            self.poolPolicy.onDeadline(self, self.nodes[nodeID], roundNum)
+
+    def joinPool(self, nodeID, pool=0, roundNum=0):
+        node = self.nodes[nodeID]
+        self.pools[pool].add(nodeID)
+        self.poolOf[nodeID] = pool
+        self.poolHashFractions[pool] += node.hashFrac
+        self.poolHashFraction += node.hashFrac
+        if self.nodeTable != None:
+            self.nodeTable.setPool(nodeID, pool)
+        self.poolDeadlines.schedule(nodeID, self.poolPolicy.leaveDeadline(self, node, roundNum))
+
+    def leavePool(self, nodeID, roundNum=0):
+        node = self.nodes[nodeID]
+        pool = self.poolOf.pop(nodeID)
+        self.pools[pool].discard(nodeID)
+        self.poolHashFractions[pool] -= node.hashFrac
+        self.poolHashFraction -= node.hashFrac
+        if self.nodeTable != None:
+            self.nodeTable.setPool(nodeID, -1)
+        self.poolDeadlines.schedule(nodeID, self.poolPolicy.joinDeadline(self, node))
+
+    def setHashFractions(self, hashFracs):
+        '''
+        hashFracs: new hash power fraction of each node
+
+        Change the hash power of the nodes, leaders of the coming rounds are drawn acc. to it
+        '''
+        hashFracs = np.asarray(hashFracs, dtype=float)
+        if self.nodeTable != None:
+            self.nodeTable.setHashFractions(hashFracs, self.p)
+        else:
+            for node in self.nodes:
+                node.hashFrac = hashFracs[node.id]
+                node.expectedBlockInterval = ceil(1 / (self.p * node.hashFrac))
+        self.blockLeaderProbs = list(self.p*hashFracs) + [1-self.p]
+        self.fruitLeaderProbs = list(self.pF*hashFracs) + [1-self.pF]
+        self.leaderSampler.setProbs(self.blockLeaderProbs, self.fruitLeaderProbs)
+        self.poolHashFractions = [float(hashFracs[list(pool)].sum()) if pool else 0 for pool in self.pools]
+        self.poolHashFraction = sum(self.poolHashFractions)
 
 class Node:
     def __init__(self, _id=0, hashFrac=1, env=Environment()):
@@ -167,20 +492,32 @@ class Node:
         _id: unique id of the node
         blockChain: local chain of the node
         validFruits: valid fruits received/mined by the node; <K, V> = <hangBlockPos, setOfFruits>
-        fruitsInChain: fruits that are in the blockchain; <K, V> = <fruitHash, block.height>
+        fruitsInChain: fruits that are in the blockchain; <K, V> = <fruit.key, block.height>
+        freshFruits: valid fruits that are not in the blockchain yet; <K, V> = <hangBlockPos, setOfFruits>
         hashFrac: fraction of hash power of the node
 
         environment: environment of the pair (A, Z)
         k: security parameter
         '''
         self.id = _id
-        self.blockChain = Blockchain()
-        self.validFruits = defaultdict(set)
-        self.fruitsInChain = {}
         self.hashFrac =  hashFrac
 
         # simulator related parameters
         self.environment = env
+        if env.ledger != None:
+            self.useLedger(env.ledger)
+        else:
+            self.validFruits = defaultdict(set)
+            self.fruitsInChain = {}
+            self.freshFruits = {}
+            if env.blockTree != None:
+                self.blockChain = TreeChain(env.blockTree, _id)
+                self.validFruits = env.blockTree.validFruits
+            elif env.rollingWindow != None:
+                self.blockChain = RollingBlockchain(env.rollingWindow)
+                self.blockChain.onEvict.append(self.pruneFruits)
+            else:
+                self.blockChain = Blockchain()
         self.k = self.environment.k
         # total reward received by the node acc. Bitcoin sceheme
         self.totalBitcoinReward = 0
@@ -189,14 +526,17 @@ class Node:
         # expected # of rounds between any 2 block of this node
         self.expectedBlockInterval = ceil( 1 / ( self.environment.p * self.hashFrac ))
 
-    def mineFruit(self, roundNum):
+    def mineFruit(self, roundNum, publish=True):
         '''
         Mine the structure by updating its mineRound parameter,
         then add it to validFruits and broadcast to network
+
+        publish: add the fruit to validFruits, otherwise the caller does
         '''
         hangIndex = max(1, self.blockChain.length - self.k) - 1
         fruit = Fruit(self.id, roundNum, hangIndex)
-        self.validFruits[fruit.hangBlockHeight].add(fruit)
+        if publish:
+            self.addFruit(fruit)
 
         #print("Node:" + str(self.id) + " mined a fruit!" )
         return fruit
@@ -212,20 +552,39 @@ class Node:
         freshFruits = self.getFreshFruits()
         block = Block(self.id, roundNum, freshFruits, [])
         self.defaultTxSelection(roundNum, block)
-        # Append the block, update fruits in it
+        # Append the block, update fruits in it. With network delay fruits are shared by the forks
+        # that contain them, they're left as they are (see TreeChain.freshFruits)
         self.blockChain.append(block)
-        for f in freshFruits:
-            f.includeRound = roundNum
-            f.contBlockHeight = self.blockChain.length
-            self.fruitsInChain[hash(f)] = hash(block)
+        if self.environment.blockTree == None:
+            for f in freshFruits:
+                f.includeRound = roundNum
+                f.contBlockHeight = self.blockChain.length
+                self.fruitsInChain[f.key] = block.height
+            self.removeFreshFruits(freshFruits)
+        self.environment.recordFruits(block, freshFruits)
         #print("Node:" + str(self.id) + " mined a block!" )
         return block
 
-    def joinPool(self):
+    def pruneFruits(self, evicted, firstHeight):
+        '''
+        Drop the fruits that refer to blocks evicted from the rolling chain
+        '''
+        pruneFruits(self.fruitsInChain, self.validFruits, evicted, firstHeight)
+
+    def useLedger(self, ledger):
+        '''
+        Make the node's chain and fruits views of the shared ledger
+        '''
+        self.blockChain = ledger.blockChain
+        self.validFruits = ledger.validFruits
+        self.fruitsInChain = ledger.fruitsInChain
+        self.freshFruits = ledger.freshFruits
+
+    def joinPool(self, pool=0):
         """
         Node joins the mining pool
         """
-        self.environment.miningPool.add(self.id)
+        self.environment.joinPool(self.id, pool)
 
     def deliver(self, msg):
         '''
@@ -234,26 +593,53 @@ class Node:
         '''
         b, f = msg[0], msg[1]
         if f != None:
-            self.validFruits[f.hangBlockHeight].add(f)
+            self.addFruit(f)
         if b != None and b != self.blockChain[-1]:
             self.blockChain.append(b)
             for fruit in b.fruits:
-                self.fruitsInChain[hash(fruit)] = b.height
+                self.fruitsInChain[fruit.key] = b.height
+            self.removeFreshFruits(b.fruits)
+
+    def addFruit(self, f):
+        '''
+        Add a valid fruit, it's fresh unless it's already in the chain
+        '''
+        self.validFruits[f.hangBlockHeight].add(f)
+        if f.key not in self.fruitsInChain:
+            bucket = self.freshFruits.get(f.hangBlockHeight)
+            if bucket == None:
+                bucket = self.freshFruits[f.hangBlockHeight] = set()
+            bucket.add(f)
+
+    def removeFreshFruits(self, fruits):
+        '''
+        Fruits that are put in the chain are no longer fresh
+        '''
+        for f in fruits:
+            bucket = self.freshFruits.get(f.hangBlockHeight)
+            if bucket != None:
+                bucket.discard(f)
+                if not bucket:
+                    del self.freshFruits[f.hangBlockHeight]
 
     def getFreshFruits(self):
         '''
         Returns the fruits that are recent w.r.t to chain
         (i.e., they hang from one the last K blocks and not already in chain)
         '''
+        if self.environment.blockTree != None:
+            return self.blockChain.freshFruits(self.k)
         fresh = set()
         lastValidHangBlockHeight = max(1, self.blockChain.length-self.k)
         # Get rid of fruits that lost their recency. Note that a fruit can not become recent once it has lost it. Chain is ever-growing.
         self.validFruits.pop(lastValidHangBlockHeight-1, None)
-        # Fruit can hang from the head of chain
-        for pos in range(lastValidHangBlockHeight, self.blockChain.length+1):
-            for f in self.validFruits[pos]:
-                if hash(f) not in self.fruitsInChain:
-                    fresh.add(f)
+        # Fruit can hang from the head of chain. Fruits in freshFruits aren't in chain, only buckets
+        # that fell behind the window need to be dropped
+        for pos in list(self.freshFruits):
+            if pos < lastValidHangBlockHeight:
+                del self.freshFruits[pos]
+            else:
+                fresh.update(self.freshFruits[pos])
         return fresh
 
     def selectAllTxs(self, roundNum, block):
@@ -261,31 +647,30 @@ class Node:
         Put all unprocessed txs to block, ignoring space limitations i.e., blocks
         have unlimited size
         '''
-        for tx in self.environment.unprocessedTxs:
-            tx.includeRound = roundNum
-            block.totalFee += tx.fee
-            block.txs.append(tx)
-            self.environment.processedTxs.append(tx)
-        self.environment.unprocessedTxs = []
+        bcastRounds, counts = self.environment.mempool.fill(roundNum, block)
+        self.environment.recordTxs(block, bcastRounds, counts)
 
     def defaultTxSelection(self, roundNum, block):
         '''
-        Simply fetch txs from the unprocessed tx list of environment
+        Fetch txs from the mempool of environment, highest fee rate first,
         until you can't fill anymore
-        Assumes unprocessed txs are sorted
-        '''
-        spaceLeft = block.size
-        txList = self.environment.unprocessedTxs
-        for i in range(len(txList)-1, -1, -1):
-            tx = txList[i]
-            if spaceLeft >= tx.size:
-                # update tx include round and total fee of node
-                tx.includeRound = roundNum
-                block.totalFee += tx.fee
-                block.txs.append(tx)
-                spaceLeft -= tx.size
-                # add tx to block/processed and remove tx from unprocessed
-                self.environment.processedTxs.append(tx)
-                del txList[i]
-            else:
-                return
+        '''
+        bcastRounds, counts = self.environment.mempool.fill(roundNum, block, block.size)
+        self.environment.recordTxs(block, bcastRounds, counts)
+
+
+class TableNode(Node):
+    # per-node fields are kept in the environment's NodeTable
+    hashFrac = TableColumn('hashFrac')
+    totalBitcoinReward = TableColumn('totalBitcoinReward')
+    totalFruitchainReward = TableColumn('totalFruitchainReward')
+    expectedBlockInterval = TableColumn('expectedBlockInterval')
+
+    def __init__(self, _id=0, hashFrac=1, env=None):
+        '''
+        Node whose per-node fields live in env.nodeTable, for environments created with nodeTable=True
+        '''
+        self.id = _id
+        self.environment = env
+        env.nodeTable.add(_id)
+        super().__init__(_id, hashFrac, env)
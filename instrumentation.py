@@ -0,0 +1,66 @@
+#coding: utf-8
+from time import perf_counter
+
+class Instrumentation:
+    # Phases of a round, in the order they run
+    phases = ('txs', 'leaders', 'mineFruit', 'mineBlock', 'rewards', 'deliver', 'pools', 'log')
+
+    def __init__(self):
+        '''
+        timers: <K, V> = <phase, [number of calls, total seconds]>
+        counters: <K, V> = <event, [count, total, min, max]> of the observed values
+
+        Records where the time of a run goes. Environment and Simulator call lap at the end of
+        each phase when it has an Instrumentation, and skips it otherwise.
+        '''
+        self.timers = {phase: [0, 0.0] for phase in self.phases}
+        self.counters = {}
+
+    def lap(self, phase, start):
+        '''
+        Add the time since start to phase, returns the current time as the start of the next phase
+        '''
+        now = perf_counter()
+        timer = self.timers[phase]
+        timer[0] += 1
+        timer[1] += now - start
+        return now
+
+    def observe(self, event, value=1):
+        counter = self.counters.get(event)
+        if counter == None:
+            self.counters[event] = [1, value, value, value]
+            return
+        counter[0] += 1
+        counter[1] += value
+        if value < counter[2]:
+            counter[2] = value
+        if value > counter[3]:
+            counter[3] = value
+
+    def summary(self):
+        '''
+        Returns the timers and counters as a dict; phases with their calls, seconds and mean
+        seconds per call, counters with their count, total, mean, min and max
+        '''
+        timers = {phase: {'calls': calls, 'seconds': seconds, 'mean': seconds / calls if calls else 0}
+            for phase, (calls, seconds) in self.timers.items()}
+        counters = {event: {'count': count, 'total': total, 'mean': total / count, 'min': low, 'max': high}
+            for event, (count, total, low, high) in self.counters.items()}
+        return {'timers': timers, 'counters': counters}
+
+    def save(self, filename, header=()):
+        '''
+        Write the summary to filename, header lines are written as comments on top
+        '''
+        summary = self.summary()
+        file = open(filename, 'w')
+        for line in header:
+            file.write("# " + line + "\n")
+        file.write("# phase,calls,seconds\n")
+        for phase, timer in summary['timers'].items():
+            file.write(phase + "," + str(timer['calls']) + "," + "%.6f" % timer['seconds'] + "\n")
+        file.write("# event,count,total,mean,min,max\n")
+        for event, counter in summary['counters'].items():
+            file.write(event + "," + ",".join(str(counter[key]) for key in ('count', 'total', 'mean', 'min', 'max')) + "\n")
+        file.close()
@@ -0,0 +1,112 @@
+#coding: utf-8
+import numpy as np
+
+class LeaderSampler:
+    def __init__(self, blockLeaderProbs, fruitLeaderProbs, rng=None, chunkSize=2**16):
+        '''
+        blockLeaderProbs: pr. of each node mining a block in a round, last entry is pr. of nobody mining
+        fruitLeaderProbs: pr. of each node mining a fruit in a round, last entry is pr. of nobody mining
+        rng: numpy Generator leaders are drawn from
+        chunkSize: number of rounds whose leaders are drawn at once
+
+        Draws block and fruit leaders for chunkSize rounds at a time by searching
+        uniform samples in the cumulative sums of the probabilities. Same rng seed
+        gives the same sequence of leaders.
+        '''
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.chunkSize = chunkSize
+        self.setProbs(blockLeaderProbs, fruitLeaderProbs)
+
+    def setProbs(self, blockLeaderProbs, fruitLeaderProbs):
+        '''
+        Replace the leader probabilities, leaders drawn with the old ones are discarded
+        '''
+        self.n = len(blockLeaderProbs) - 1
+        self.blockLeaderProbs = blockLeaderProbs
+        self.fruitLeaderProbs = fruitLeaderProbs
+        self.blockCdf = None # built on first draw, like np.random.choice probs are only checked when sampling
+        self.fruitCdf = None
+        self.blockLeaders = []
+        self.fruitLeaders = []
+        self.pos = 0
+        self.eventGaps = []
+        self.eventBlockLeaders = []
+        self.eventFruitLeaders = []
+        self.eventPos = 0
+
+    @staticmethod
+    def cdf(probs):
+        probs = np.asarray(probs, dtype=float)
+        if np.any(probs < 0) or abs(probs.sum() - 1) > 1e-8:
+            raise ValueError("leader probabilities must be non-negative and sum to 1")
+        cdf = np.cumsum(probs)
+        cdf[-1] = 1 # so that a sample in [0, 1) never falls past the last entry
+        return cdf
+
+    def next(self):
+        '''
+        Returns (blockLeaderID, fruitLeaderID) for the next round. ID n means nobody mines
+        '''
+        if self.pos == len(self.blockLeaders):
+            self.refill()
+        i = self.pos
+        self.pos += 1
+        return self.blockLeaders[i], self.fruitLeaders[i]
+
+    def refill(self):
+        '''
+        Draw the leaders of the next chunkSize rounds
+        '''
+        if self.blockCdf is None:
+            self.blockCdf = self.cdf(self.blockLeaderProbs)
+            self.fruitCdf = self.cdf(self.fruitLeaderProbs)
+        u = self.rng.random((2, self.chunkSize))
+        # Plain python ints are cheaper to index and compare per round than numpy scalars
+        self.blockLeaders = np.searchsorted(self.blockCdf, u[0], side='right').tolist()
+        self.fruitLeaders = np.searchsorted(self.fruitCdf, u[1], side='right').tolist()
+        self.pos = 0
+
+    def eventProb(self):
+        '''
+        Returns (pr. of a block, pr. of a fruit, pr. of a block or a fruit) being mined in a round
+        '''
+        qB = 1 - self.blockLeaderProbs[self.n]
+        qF = 1 - self.fruitLeaderProbs[self.n]
+        return qB, qF, 1 - (1-qB)*(1-qF)
+
+    def nextEvent(self):
+        '''
+        Returns (gap, blockLeaderID, fruitLeaderID) where gap is the number of rounds
+        until the next round in which a block or a fruit is mined, and the IDs are the
+        leaders of that round. gap is None if nothing can ever be mined.
+        '''
+        if self.eventPos == len(self.eventGaps):
+            if self.eventProb()[2] <= 0:
+                return None, self.n, self.n
+            self.refillEvents()
+        i = self.eventPos
+        self.eventPos += 1
+        return self.eventGaps[i], self.eventBlockLeaders[i], self.eventFruitLeaders[i]
+
+    def refillEvents(self):
+        '''
+        Draw the next chunkSize events. Rounds are independent so the gap between two
+        rounds with an event is geometric with the pr. q of a block or a fruit. Leaders
+        of an event round are drawn conditioned on at least one of them being a node.
+        '''
+        qB, qF, q = self.eventProb()
+        if self.blockCdf is None:
+            self.blockCdf = self.cdf(self.blockLeaderProbs)
+            self.fruitCdf = self.cdf(self.fruitLeaderProbs)
+        gaps = self.rng.geometric(q, self.chunkSize)
+        u = self.rng.random((4, self.chunkSize))
+        # P(block | event) = qB/q, and a round without a block must have a fruit
+        hasBlock = u[0] < qB / q
+        hasFruit = ~hasBlock | (u[1] < qF)
+        # Leaders conditioned on somebody mining: scale uniforms into the node part of the cdf
+        blockLeaders = np.searchsorted(self.blockCdf, u[2] * qB, side='right')
+        fruitLeaders = np.searchsorted(self.fruitCdf, u[3] * qF, side='right')
+        self.eventGaps = gaps.tolist()
+        self.eventBlockLeaders = np.where(hasBlock, np.minimum(blockLeaders, self.n-1), self.n).tolist()
+        self.eventFruitLeaders = np.where(hasFruit, np.minimum(fruitLeaders, self.n-1), self.n).tolist()
+        self.eventPos = 0
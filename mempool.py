@@ -0,0 +1,335 @@
+#coding: utf-8
+from dataStructures import *
+from collections import deque
+import numpy as np
+import bisect
+
+def groupRows(columns, counts):
+    '''
+    columns: equal length arrays, a row is a value of each
+    counts: count of each row
+
+    Returns (columns of the distinct rows in lexicographic order, total count of each)
+    '''
+    order = np.lexsort(columns[::-1])
+    columns = [column[order] for column in columns]
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for column in columns:
+        change[1:] |= column[1:] != column[:-1]
+    starts = np.flatnonzero(change)
+    return [column[starts] for column in columns], np.add.reduceat(np.asarray(counts)[order], starts)
+
+
+class Mempool:
+    def __init__(self, capacity=None):
+        '''
+        capacity: max. total size of unprocessed txs, lowest fee rate txs are evicted
+                  beyond it. None means unbounded
+        rates: distinct fee rates of unprocessed txs, sorted
+        buckets: unprocessed txs with the same fee rate; <K, V> = <feeRate, deque of groups>
+                 a group is [bcastRound, fee, size, count], older groups first
+        nUnprocessed: number of unprocessed txs
+        nProcessed: number of processed txs
+        processedFee: sum of fees of processed txs
+        nEvicted: number of txs evicted due to capacity
+
+        Unprocessed txs kept as counts grouped by (fee, size, bcastRound) in fee rate
+        buckets instead of one Transaction object per tx.
+        '''
+        self.capacity = capacity
+        self.rates = []
+        self.buckets = {}
+        self.nUnprocessed = 0
+        self.unprocessedSize = 0
+        self.nProcessed = 0
+        self.processedFee = 0
+        self.nEvicted = 0
+
+    def __len__(self):
+        return self.nUnprocessed
+
+    def add(self, bcastRound, fee, size=1, count=1):
+        '''
+        Add count txs with the given fee and size broadcast in bcastRound
+        '''
+        if count <= 0:
+            return
+        self.group(bcastRound, fee, size)[3] += count
+        self.added(count, size)
+
+    def group(self, bcastRound, fee, size):
+        '''
+        Returns the group new txs with the given params go in, creates it if needed
+        '''
+        rate = fee / size
+        bucket = self.buckets.get(rate)
+        if bucket == None:
+            bucket = self.buckets[rate] = deque()
+            bisect.insort(self.rates, rate)
+        if bucket and bucket[-1][0] == bcastRound and bucket[-1][1] == fee and bucket[-1][2] == size:
+            return bucket[-1]
+        group = self.newGroup(bcastRound, fee, size)
+        bucket.append(group)
+        return group
+
+    def added(self, count, size):
+        self.nUnprocessed += count
+        self.unprocessedSize += count * size
+        if self.capacity != None and self.unprocessedSize > self.capacity:
+            self.evict()
+
+    def addBatch(self, bcastRound, fees, sizes, counts=None):
+        '''
+        Add the txs broadcast in bcastRound at once. Txs with the same fee and size
+        are merged into a single group before they go into the buckets
+        '''
+        fees = np.asarray(fees)
+        self.addRounds(np.full(fees.shape, bcastRound, dtype=np.int64), fees, sizes, counts)
+
+    def addRounds(self, bcastRounds, fees, sizes, counts=None):
+        '''
+        Add txs broadcast in several rounds at once, in round order. Txs with the
+        same round, fee and size are merged into a single group
+        '''
+        bcastRounds = np.asarray(bcastRounds)
+        if bcastRounds.size == 0:
+            return
+        if np.ndim(fees) == 0 and np.ndim(sizes) == 0 and np.all(bcastRounds[1:] > bcastRounds[:-1]):
+            # already one group per round
+            counts = np.broadcast_to(1 if counts is None else counts, bcastRounds.shape)
+            m = len(bcastRounds)
+            self.addGroups(bcastRounds.tolist(), [fees]*m, [sizes]*m, counts.tolist())
+            return
+        fees = np.broadcast_to(fees, bcastRounds.shape)
+        sizes = np.broadcast_to(sizes, bcastRounds.shape)
+        counts = np.ones(bcastRounds.shape, dtype=np.int64) if counts is None else np.broadcast_to(counts, bcastRounds.shape)
+        keys, totals = groupRows((bcastRounds, fees, sizes), counts)
+        self.addGroups(keys[0].tolist(), keys[1].tolist(), keys[2].tolist(), totals.tolist())
+
+    def addGroups(self, bcastRounds, fees, sizes, counts):
+        '''
+        Add groups of txs given as lists in round order, like add does for each.
+        Without a capacity nothing is evicted in between, so the new fee rates are
+        merged into rates at once and the groups go straight into their buckets.
+        Every distinct fee rate still costs a group, so continuous fees (e.g. lognormal)
+        are as slow as adding txs one by one, round them to keep txs grouped
+        '''
+        if self.capacity != None:
+            for bcastRound, fee, size, count in zip(bcastRounds, fees, sizes, counts):
+                self.add(bcastRound, fee, size, count)
+            return
+        buckets = self.buckets
+        rates = [fee / size for fee, size in zip(fees, sizes)]
+        new = {rate for rate, count in zip(rates, counts) if count > 0 and rate not in buckets}
+        if new:
+            for rate in new:
+                buckets[rate] = deque()
+            self.rates += new
+            self.rates.sort()
+        n = total = 0
+        for bcastRound, fee, size, count, rate in zip(bcastRounds, fees, sizes, counts, rates):
+            if count <= 0:
+                continue
+            bucket = buckets[rate]
+            if bucket and bucket[-1][0] == bcastRound and bucket[-1][1] == fee and bucket[-1][2] == size:
+                bucket[-1][3] += count
+            else:
+                bucket.append([bcastRound, fee, size, count])
+            n += count
+            total += count * size
+        self.nUnprocessed += n
+        self.unprocessedSize += total
+
+    def append(self, tx):
+        self.add(tx.bcastRound, tx.fee, tx.size)
+
+    def newGroup(self, bcastRound, fee, size):
+        return [bcastRound, fee, size, 0]
+
+    def takeGroup(self, group, take, roundNum, block):
+        '''
+        Hook called when take txs of group are put in block
+        '''
+        pass
+
+    def dropGroup(self, group, drop):
+        '''
+        Hook called when the newest drop txs of group are evicted
+        '''
+        pass
+
+    def fill(self, roundNum, block, spaceLeft=None):
+        '''
+        roundNum: round the block is mined in
+        block: block to put the txs in
+        spaceLeft: space left in the block, None means unlimited
+
+        Greedily put txs with the highest fee rate into the block (older first among
+        equal rates) until a tx doesn't fit. Only the buckets and groups that are taken
+        are touched. Returns (bcastRounds, counts) of the taken groups.
+        '''
+        bcastRounds, counts = [], []
+        while self.rates:
+            rate = self.rates[-1]
+            bucket = self.buckets[rate]
+            while bucket:
+                group = bucket[0]
+                take = group[3] if spaceLeft == None else min(group[3], spaceLeft // group[2])
+                if take > 0:
+                    self.takeGroup(group, take, roundNum, block)
+                    fee = take * group[1]
+                    block.nTxs += take
+                    block.totalFee += fee
+                    self.nUnprocessed -= take
+                    self.unprocessedSize -= take * group[2]
+                    self.nProcessed += take
+                    self.processedFee += fee
+                    bcastRounds.append(group[0])
+                    counts.append(take)
+                    group[3] -= take
+                    if spaceLeft != None:
+                        spaceLeft -= take * group[2]
+                if group[3] > 0: # next tx doesn't fit
+                    return np.array(bcastRounds, dtype=np.int64), np.array(counts, dtype=np.int64)
+                bucket.popleft()
+            del self.buckets[rate]
+            self.rates.pop()
+        return np.array(bcastRounds, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+    def evict(self):
+        '''
+        Evict the newest txs with the lowest fee rate until the mempool fits its capacity
+        '''
+        while self.unprocessedSize > self.capacity:
+            rate = self.rates[0]
+            bucket = self.buckets[rate]
+            group = bucket[-1]
+            excess = self.unprocessedSize - self.capacity
+            drop = min(group[3], -(-excess // group[2])) # ceil
+            self.dropGroup(group, drop)
+            group[3] -= drop
+            self.nUnprocessed -= drop
+            self.unprocessedSize -= drop * group[2]
+            self.nEvicted += drop
+            if group[3] == 0:
+                bucket.pop()
+                if not bucket:
+                    del self.buckets[rate]
+                    self.rates.pop(0)
+
+
+class ForkMempool(Mempool):
+    def __init__(self):
+        '''
+        taken: groups (bcastRound, fee, size, count) the last fill took
+
+        Mempool of a run whose chains fork, it holds the txs that aren't in one chain.
+        When it follows another chain the txs of the blocks that leave it are put back
+        and the ones of the blocks that join it are removed, see Environment.moveMempool.
+        Nothing is evicted, so the txs of a joining block are always there.
+        '''
+        Mempool.__init__(self)
+        self.taken = []
+
+    def fill(self, roundNum, block, spaceLeft=None):
+        self.taken = []
+        return Mempool.fill(self, roundNum, block, spaceLeft)
+
+    def takeGroup(self, group, take, roundNum, block):
+        self.taken.append((group[0], group[1], group[2], take))
+
+    def find(self, bucket, bcastRound, fee, size):
+        '''
+        Returns the position of the group of the given params in bucket, or the position
+        it goes to, and whether it's there. Groups are in round order
+        '''
+        for j, group in enumerate(bucket):
+            if group[0] == bcastRound and group[1] == fee and group[2] == size:
+                return j, True
+            if group[0] > bcastRound:
+                return j, False
+        return len(bucket), False
+
+    def putBack(self, groups):
+        '''
+        Return the txs of groups taken by a block that left the chain
+        '''
+        for bcastRound, fee, size, count in groups:
+            rate = fee / size
+            bucket = self.buckets.get(rate)
+            if bucket == None:
+                bucket = self.buckets[rate] = deque()
+                bisect.insort(self.rates, rate)
+            j, found = self.find(bucket, bcastRound, fee, size)
+            if found:
+                bucket[j][3] += count
+            else:
+                bucket.insert(j, [bcastRound, fee, size, count])
+            self.nUnprocessed += count
+            self.unprocessedSize += count * size
+            self.nProcessed -= count
+            self.processedFee -= count * fee
+
+    def remove(self, groups):
+        '''
+        Take out the txs of groups taken by a block that joined the chain
+        '''
+        for bcastRound, fee, size, count in groups:
+            rate = fee / size
+            bucket = self.buckets.get(rate, ())
+            j, found = self.find(bucket, bcastRound, fee, size)
+            if not found or bucket[j][3] < count:
+                raise RuntimeError("txs of round " + str(bcastRound) + " with fee " + str(fee) + " aren't in the mempool")
+            bucket[j][3] -= count
+            if bucket[j][3] == 0:
+                del bucket[j]
+                if not bucket:
+                    del self.buckets[rate]
+                    del self.rates[bisect.bisect_left(self.rates, rate)]
+            self.nUnprocessed -= count
+            self.unprocessedSize -= count * size
+            self.nProcessed += count
+            self.processedFee += count * fee
+
+
+class TraceMempool(Mempool):
+    def __init__(self, capacity=None):
+        '''
+        processedTxs: txs that are put in a block
+
+        Detailed-trace mempool that keeps a Transaction object for every tx,
+        blocks get the txs they contain in their txs list. A group also holds
+        the deque of its txs.
+        '''
+        Mempool.__init__(self, capacity)
+        self.processedTxs = []
+
+    def newGroup(self, bcastRound, fee, size):
+        return [bcastRound, fee, size, 0, deque()]
+
+    def add(self, bcastRound, fee, size=1, count=1):
+        for i in range(count):
+            self.append(Transaction(bcastRound, fee, size))
+
+    def addGroups(self, bcastRounds, fees, sizes, counts):
+        for bcastRound, fee, size, count in zip(bcastRounds, fees, sizes, counts):
+            self.add(bcastRound, fee, size, count)
+
+    def append(self, tx):
+        group = self.group(tx.bcastRound, tx.fee, tx.size)
+        group[3] += 1
+        group[4].append(tx)
+        self.added(1, tx.size)
+
+    def takeGroup(self, group, take, roundNum, block):
+        txs = group[4]
+        for i in range(take):
+            tx = txs.popleft()
+            tx.includeRound = roundNum
+            block.txs.append(tx)
+            self.processedTxs.append(tx)
+
+    def dropGroup(self, group, drop):
+        for i in range(drop):
+            group[4].pop()
@@ -0,0 +1,88 @@
+#coding: utf-8
+import heapq
+
+class DeadlineQueue:
+    def __init__(self):
+        '''
+        heap: (deadline, nodeID) entries, may hold stale entries of re-keyed nodes
+        deadlines: current deadline of each node; <K, V> = <nodeID, roundNum>
+
+        Priority queue of per-node deadlines. Re-keying a node pushes a new entry,
+        the old one is skipped when it comes up.
+        '''
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, nodeID, deadline):
+        '''
+        Set (or re-key) the deadline of a node, None cancels it
+        '''
+        if deadline == None:
+            self.deadlines.pop(nodeID, None)
+            return
+        self.deadlines[nodeID] = deadline
+        heapq.heappush(self.heap, (deadline, nodeID))
+        if len(self.heap) > 2*len(self.deadlines) + 64:
+            # too many stale entries, rebuild from the current deadlines
+            self.heap = [(d, i) for i, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def popDue(self, roundNum):
+        '''
+        Returns the ids of nodes whose deadline is <= roundNum, earliest first, and removes their deadlines
+        '''
+        due = []
+        heap = self.heap
+        while heap and heap[0][0] <= roundNum:
+            deadline, nodeID = heapq.heappop(heap)
+            if self.deadlines.get(nodeID) == deadline:
+                del self.deadlines[nodeID]
+                due.append(nodeID)
+        return due
+
+    def nextDeadline(self):
+        '''
+        Returns the earliest deadline, None if there is none
+        '''
+        heap = self.heap
+        while heap and self.deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+
+class PoolPolicy:
+    def __init__(self, nPools=1, stay=None):
+        '''
+        nPools: number of mining pools, a node joins the one with the least hash power
+        stay: number of rounds a node stays in its pool before mining solo again, None means forever
+
+        Decides when honest nodes join and leave mining pools. A solo node joins a pool
+        once it waits longer than its expected block interval for a reward.
+        Subclass it and override the methods for other pool dynamics.
+        '''
+        self.nPools = nPools
+        self.stay = stay
+
+    def joinDeadline(self, env, node):
+        '''
+        Round a solo node joins a pool, unless it gets a reward before
+        '''
+        return env.rewardTime[node.id] + node.expectedBlockInterval
+
+    def leaveDeadline(self, env, node, roundNum):
+        '''
+        Round a node that joined a pool in roundNum leaves it, None means never
+        '''
+        return None if self.stay == None else roundNum + self.stay
+
+    def choosePool(self, env, node):
+        return min(range(len(env.pools)), key=lambda i: env.poolHashFractions[i])
+
+    def onDeadline(self, env, node, roundNum):
+        if env.poolOf.get(node.id) == None:
+            env.joinPool(node.id, self.choosePool(env, node), roundNum)
+        else:
+            env.leavePool(node.id, roundNum)
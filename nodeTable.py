@@ -0,0 +1,89 @@
+#coding: utf-8
+import numpy as np
+
+class NodeTable:
+    # Per-node columns and their dtypes
+    fields = (('hashFrac', np.float64), ('totalBitcoinReward', np.int64), ('totalFruitchainReward', np.float64),
+        ('expectedBlockInterval', np.int64), ('rewardTime', np.int64), ('pool', np.int64))
+
+    def __init__(self, capacity=1024):
+        '''
+        capacity: number of nodes the columns are allocated for, they grow when more are added
+
+        Per-node fields of all nodes as NumPy columns indexed by node id, so operations
+        over many nodes (pool payouts, snapshots of the rewards) are vectorized. pool is
+        the index of the node's mining pool, -1 if it mines solo. See TableNode.
+        '''
+        self.n = 0
+        for name, dtype in self.fields:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.pool[:] = -1
+        self.members = {} # <K, V> = <pool, ids of its members>, cached until a node joins/leaves it
+
+    def __len__(self):
+        return self.n
+
+    def add(self, nodeID):
+        '''
+        Make room for the node with id nodeID
+        '''
+        if nodeID >= len(self.hashFrac):
+            capacity = max(2*len(self.hashFrac), nodeID+1)
+            for name, dtype in self.fields:
+                column = np.zeros(capacity, dtype=dtype)
+                column[:self.n] = getattr(self, name)[:self.n]
+                setattr(self, name, column)
+            self.pool[self.n:] = -1
+        self.n = max(self.n, nodeID+1)
+
+    def setPool(self, nodeID, pool):
+        '''
+        Put the node in pool, -1 means it mines solo
+        '''
+        old = self.pool[nodeID]
+        self.pool[nodeID] = pool
+        self.members.pop(old, None)
+        self.members.pop(pool, None)
+
+    def poolMembers(self, pool):
+        members = self.members.get(pool)
+        if members is None:
+            members = self.members[pool] = np.flatnonzero(self.pool[:self.n] == pool)
+        return members
+
+    def payPool(self, pool, totalFee, poolHashFraction, roundNum):
+        '''
+        Every member of pool gets a reward w.r.t. its hash fraction, like Environment.rewardBitcoin
+        '''
+        members = self.poolMembers(pool)
+        self.totalBitcoinReward[members] += np.round(totalFee * (self.hashFrac[members] / poolHashFraction)).astype(np.int64)
+        self.rewardTime[members] = roundNum
+
+    def setHashFractions(self, hashFracs, p):
+        '''
+        Replace the hash fractions of all nodes, p is the pr. of the system mining a block in a round
+        '''
+        self.hashFrac[:self.n] = hashFracs
+        self.expectedBlockInterval[:self.n] = np.ceil(1 / (p * self.hashFrac[:self.n]))
+
+    def snapshot(self):
+        '''
+        Returns copies of the reward columns; <K, V> = <column, array>
+        '''
+        return {name: getattr(self, name)[:self.n].copy() for name in ('totalBitcoinReward', 'totalFruitchainReward', 'rewardTime')}
+
+
+class TableColumn:
+    def __init__(self, name):
+        '''
+        Attribute of a TableNode that lives in a column of the environment's NodeTable
+        '''
+        self.name = name
+
+    def __get__(self, node, owner=None):
+        if node is None:
+            return self
+        return getattr(node.environment.nodeTable, self.name)[node.id].item()
+
+    def __set__(self, node, value):
+        getattr(node.environment.nodeTable, self.name)[node.id] = value
@@ -0,0 +1,124 @@
+#coding: utf-8
+
+#python3 replicate.py --n 10 --r 100000 --p 0.1 --pF 0.2 --ci-width 0.01
+from sweep import *
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import tempfile
+import argparse
+import os
+
+class RunningStats:
+    def __init__(self, shape):
+        '''
+        shape: shape of the observed values
+
+        Running mean and variance of observations (Welford), element-wise over arrays
+        '''
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def variance(self):
+        if self.n < 2:
+            return np.full(self.mean.shape, np.inf)
+        return self.m2 / (self.n - 1)
+
+    def halfWidth(self, z):
+        '''
+        Half width of the normal confidence interval of the mean with quantile z
+        '''
+        return z * np.sqrt(self.variance() / max(self.n, 1))
+
+def rewardShares(rewards):
+    total = rewards.sum()
+    return rewards / total if total > 0 else np.zeros(len(rewards))
+
+def runReplica(task):
+    '''
+    task: (config, seed, eventDriven, poolDynamics, poolPolicy)
+
+    Runs one replica and returns (bitcoin reward share of each node,
+    fruitchain reward share of each node, final pool hash fraction)
+    '''
+    config, seed, eventDriven, poolDynamics, poolPolicy = task
+    sim = Simulator(config['n'], config['t'], config['r'], config['p'], config['pF'], hashFractions(config),
+        config['txRate'], config['k'], seed=seed, statsInterval=config['r'], poolDynamics=poolDynamics, poolPolicy=poolPolicy)
+    with tempfile.TemporaryDirectory() as outdir:
+        sim.run(os.path.join(outdir, 'replica'), eventDriven=eventDriven, verbose=False)
+    nodes = sim.environment.nodes
+    bitcoin = rewardShares(np.array([node.totalBitcoinReward for node in nodes], dtype=float))
+    fruitchain = rewardShares(np.array([node.totalFruitchainReward for node in nodes], dtype=float))
+    return bitcoin, fruitchain, sim.environment.poolHashFraction
+
+def replicate(config, ciWidth, confidence=0.95, minReplicas=10, maxReplicas=1000, processes=None, seed=None, eventDriven=False,
+    poolDynamics=False, poolPolicy=None):
+    '''
+    config: simulator parameters, see sweep.DEFAULTS; missing ones get their default
+    ciWidth: target width of the confidence intervals
+    confidence: confidence level of the intervals
+    minReplicas, maxReplicas: bounds on the number of replicas
+    processes: number of worker processes, None means one per core
+    seed: root seed, every replica gets an independent child seed of it
+    poolDynamics, poolPolicy: passed on to every replica's Simulator
+
+    Runs replicas of config in parallel batches, keeping running mean and variance of
+    the per-node reward shares and, with poolDynamics, the pool hash fraction. Stops once
+    every confidence interval is narrower than ciWidth, or after maxReplicas. Returns a dict
+    with nReplicas, converged and the mean/halfWidth of each statistic.
+    '''
+    config = expandGrid({key: [value] for key, value in config.items()})[0]
+    n = config['n']
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    stats = {'bitcoinShare': RunningStats(n), 'fruitchainShare': RunningStats(n)}
+    if poolDynamics:
+        # without pool dynamics nobody joins a pool, the fraction stays 0
+        stats['poolHashFraction'] = RunningStats(())
+    root = np.random.SeedSequence(seed)
+    converged = False
+    batchSize = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(processes) as executor:
+        while not converged and stats['bitcoinShare'].n < maxReplicas:
+            size = min(batchSize, maxReplicas - stats['bitcoinShare'].n)
+            tasks = [(config, child, eventDriven, poolDynamics, poolPolicy) for child in root.spawn(size)]
+            for bitcoin, fruitchain, poolHashFraction in executor.map(runReplica, tasks):
+                stats['bitcoinShare'].add(bitcoin)
+                stats['fruitchainShare'].add(fruitchain)
+                if poolDynamics:
+                    stats['poolHashFraction'].add(poolHashFraction)
+            nReplicas = stats['bitcoinShare'].n
+            converged = nReplicas >= minReplicas and all(np.all(2*s.halfWidth(z) <= ciWidth) for s in stats.values())
+    result = {'nReplicas': stats['bitcoinShare'].n, 'converged': converged}
+    for name, s in stats.items():
+        result[name] = {'mean': s.mean, 'halfWidth': s.halfWidth(z)}
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replicate a simulator config until its confidence intervals are narrow enough')
+    for key, value in DEFAULTS.items():
+        kind = str if key == 'hashFracs' else type(value)
+        parser.add_argument('--' + key, type=kind, default=value, help=key)
+    parser.add_argument('--ci-width', type=float, default=0.01, help='target width of the confidence intervals')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level')
+    parser.add_argument('--min-replicas', type=int, default=10)
+    parser.add_argument('--max-replicas', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None, help='root seed')
+    parser.add_argument('--event-driven', action='store_true', help='skip the rounds in which nothing is mined')
+    parser.add_argument('--pool-dynamics', action='store_true', help='nodes join mining pools during the run')
+    args = parser.parse_args()
+    config = {key: getattr(args, key) for key in DEFAULTS}
+    result = replicate(config, args.ci_width, args.confidence, args.min_replicas, args.max_replicas,
+        args.processes, args.seed, args.event_driven, args.pool_dynamics)
+    print('Replicas: ' + str(result['nReplicas']) + (' (converged)' if result['converged'] else ' (not converged)'))
+    for name in ('bitcoinShare', 'fruitchainShare', 'poolHashFraction'):
+        if name not in result:
+            continue
+        print(name + ': ' + str(np.round(result[name]['mean'], 4)) + ' +- ' + str(np.round(result[name]['halfWidth'], 4)))
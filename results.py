@@ -0,0 +1,105 @@
+#coding: utf-8
+import numpy as np
+import json
+import os
+
+# First bytes of a binary result file
+MAGIC = b'FRCHAIN1'
+# Columns start at a multiple of ALIGNMENT bytes
+ALIGNMENT = 64
+
+def binaryHeader(params, columns, nRows):
+    '''
+    params: run parameters, anything json can write (others are written as strings)
+    columns: (name, dtype) of each column
+    nRows: number of rows of every column
+
+    Returns the header of a binary result file: MAGIC, the length of the json
+    description as 8 bytes, then the description padded so the columns that
+    follow it are aligned. Every column is a block of nRows values.
+    '''
+    description = {'params': params, 'nRows': nRows, 'columns': [[name, np.dtype(dtype).str] for name, dtype in columns]}
+    text = json.dumps(description, default=str).encode()
+    length = -(-(len(MAGIC) + 8 + len(text)) // ALIGNMENT) * ALIGNMENT - len(MAGIC) - 8
+    return MAGIC + np.uint64(length).tobytes() + text.ljust(length)
+
+def writeBinaryResults(filename, params, columns):
+    '''
+    columns: <K, V> = <name, array>, all of the same length
+    '''
+    nRows = len(next(iter(columns.values())))
+    arrays = [np.ascontiguousarray(column) for column in columns.values()]
+    with open(filename, 'wb') as file:
+        file.write(binaryHeader(params, [(name, array.dtype) for name, array in zip(columns, arrays)], nRows))
+        for array in arrays:
+            file.write(array.tobytes())
+
+def readBinaryHeader(file):
+    '''
+    Returns (description, offset of the first column) of an open binary result file, None if it isn't one
+    '''
+    if file.read(len(MAGIC)) != MAGIC:
+        return None
+    length = int(np.frombuffer(file.read(8), dtype=np.uint64)[0])
+    return json.loads(file.read(length).decode()), len(MAGIC) + 8 + length
+
+def loadResults(filename):
+    '''
+    Returns (params, columns) of a result file; <K, V> = <name, array>.
+    Binary files are memory-mapped and their columns are views of the map,
+    legacy text files (_stats, _rewards) are parsed from their comment header.
+    '''
+    with open(filename, 'rb') as file:
+        header = readBinaryHeader(file)
+    if header == None:
+        return loadTextResults(filename)
+    description, offset = header
+    nRows = description['nRows']
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    columns = {}
+    for name, dtype in description['columns']:
+        dtype = np.dtype(dtype)
+        columns[name] = data[offset:offset + nRows*dtype.itemsize].view(dtype)
+        offset += nRows*dtype.itemsize
+    return description['params'], columns
+
+def parseValue(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+def loadTextResults(filename):
+    '''
+    Returns (params, columns) of a text result file. Comment lines hold the
+    parameters as key:value pairs and the column names separated by commas
+    '''
+    params = {}
+    names = None
+    with open(filename) as file:
+        for line in file:
+            if not line.startswith('#'):
+                break
+            line = line[1:].strip()
+            if ':' in line:
+                for item in line.split():
+                    key, value = item.split(':', 1)
+                    if key == 'HashFracs':
+                        params['hashFracs'] = [float(x) for x in value.split(',')]
+                    else:
+                        params[key] = parseValue(value)
+            elif ',' in line:
+                names = [name[0].lower() + name[1:] for name in line.split(',')]
+    data = np.loadtxt(filename, delimiter=',', ndmin=2)
+    if names == None:
+        names = ['column' + str(j) for j in range(data.shape[1])]
+    return params, {name: data[:, j] for j, name in enumerate(names)}
+
+def resultFile(prefix, kind):
+    '''
+    Returns the file of kind ('stats', 'rewards') of the run saved to prefix, the binary one if there is one
+    '''
+    filename = prefix + "_" + kind
+    return filename + ".bin" if os.path.exists(filename + ".bin") else filename
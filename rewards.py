@@ -0,0 +1,177 @@
+#coding: utf-8
+from collections import defaultdict, deque
+import numpy as np
+
+class FruitchainWindow:
+    def __init__(self, k, c1, c2, c3):
+        '''
+        k: number of blocks whose fruits share the reward of a new block
+        c1, c2, c3: reward parameters of Fruitchain (see paper)
+        window: summaries of the last k blocks, oldest first; (weights, number of fruits + 1)
+        weights: share of each miner in the window; <K, V> = <minerID, weight>
+        refs: number of blocks in the window whose summary has the miner
+
+        Distributes rewards acc. to Fruitchain rewarding scheme like
+        Environment.rewardFruitchain, but instead of walking the fruits of the
+        last k blocks on every block, the share of each miner is updated as a
+        block enters or leaves the window.
+        '''
+        self.k = k
+        self.c1 = c1
+        self.c2 = c2
+        self.c3 = c3
+        self.window = deque()
+        self.weights = {}
+        self.refs = defaultdict(int)
+        self.nFruitsInWindow = 0
+
+    def summarize(self, b):
+        '''
+        Returns the share of each miner in the rewards paid to block b's fruits
+        '''
+        weights = defaultdict(float)
+        # in key order, so the sums don't depend on the layout of the set (e.g. after a checkpoint)
+        for f in sorted(b.fruits, key=lambda f: f.key):
+            l = f.contBlockHeight - f.hangBlockHeight - 1 # number of blocks between hanging and containing block
+            dL = self.c3 * (1 - l/(self.k-1))
+            weights[f.minerID] += 1 - self.c2 + dL
+            weights[b.minerID] += self.c2 - dL
+        weights[b.minerID] += 1 # reward of the implicit fruit goes to block miner
+        return weights
+
+    def addBlock(self, head, nodes, rewards=None):
+        '''
+        head: new head of the chain
+        nodes: nodes indexed by their id
+        rewards: Fruitchain reward of each node as an array (see NodeTable), paid into instead of the nodes if given
+
+        Pay the fees of head to the miners of the fruits in the last k blocks, then slide the window
+        '''
+        if len(self.window) == self.k:
+            # 1. Fetch the totalFee from head and award its miner
+            x = head.totalFee
+            # 2. Calculate 'normal' reward and pay every miner its share in the window
+            n0 = (1-self.c1)*x / self.nFruitsInWindow
+            if rewards is None:
+                nodes[head.minerID].totalFruitchainReward += self.c1*x
+                for minerID, weight in self.weights.items():
+                    nodes[minerID].totalFruitchainReward += n0*weight
+            else:
+                rewards[head.minerID] += self.c1*x
+                ids = np.fromiter(self.weights.keys(), dtype=np.int64, count=len(self.weights))
+                weights = np.fromiter(self.weights.values(), dtype=np.float64, count=len(self.weights))
+                rewards[ids] += n0*weights
+            # 3. Oldest block leaves the window
+            weights, nFruits = self.window.popleft()
+            for minerID, weight in weights.items():
+                self.refs[minerID] -= 1
+                if self.refs[minerID] == 0:
+                    del self.refs[minerID], self.weights[minerID]
+                else:
+                    self.weights[minerID] -= weight
+            self.nFruitsInWindow -= nFruits
+        weights = self.summarize(head)
+        for minerID, weight in weights.items():
+            self.refs[minerID] += 1
+            self.weights[minerID] = self.weights.get(minerID, 0) + weight
+        self.window.append((weights, head.nFruits + 1)) # +1 is the implicit fruit (see paper)
+        self.nFruitsInWindow += head.nFruits + 1
+
+
+def bitcoinRewards(blocks, n):
+    '''
+    blocks: block records, see chainRecords.BLOCK_FIELDS
+    n: number of nodes
+
+    Returns the reward of each node acc. to Bitcoin rewarding scheme, for nodes that mine solo
+    '''
+    return np.bincount(blocks['miner'], weights=blocks['fee'], minlength=n).astype(np.int64)
+
+def bitcoinFees(blockRounds, txRate, blockSize):
+    '''
+    blockRounds: increasing rounds in which a block is mined
+    txRate: number of txs arriving each round, each with fee 1 and size 1
+    blockSize: max. number of txs in a block
+
+    Returns the fee of each block. The backlog after block j follows the Lindley recursion
+    B_j = max(0, B_j-1 + a_j - blockSize) with a_j the arrivals since the last block,
+    so B_j = X_j - min(0, min_i<=j X_i) with X the cumulative sum of a_j - blockSize.
+    '''
+    arrivals = np.diff(blockRounds, prepend=0) * txRate
+    x = np.cumsum(arrivals - blockSize)
+    backlog = x - np.minimum(np.minimum.accumulate(x), 0)
+    return np.concatenate(([0], backlog[:-1])) + arrivals - backlog
+
+def fruitchainRates(blocks, k, c1):
+    '''
+    Returns the 'normal' reward n0 each block pays to a fruit of the k blocks
+    before it, 0 for the first k blocks
+    '''
+    fee = blocks['fee']
+    rates = np.zeros(len(fee))
+    if len(fee) > k:
+        nFruits = np.concatenate(([0], np.cumsum(blocks['nFruits'] + 1))) # +1 is the implicit fruit (see paper)
+        j = np.arange(k, len(fee))
+        rates[k:] = (1-c1) * fee[k:] / (nFruits[j] - nFruits[j-k])
+    return rates
+
+def fruitShares(blocks, fruits, k, c2, c3):
+    '''
+    Returns the share of the fruit miner and of the block miner in the reward of each fruit
+    '''
+    l = fruits['contHeight'] - fruits['hangHeight'] - 1 # number of blocks between hanging and containing block
+    dL = c3 * (1 - l/(k-1))
+    return 1 - c2 + dL, c2 - dL
+
+def fruitchainRewards(blocks, fruits, n, k=16, c1=1/100, c2=1/10, c3=1/100):
+    '''
+    blocks, fruits: records of the chain, see chainRecords
+    n: number of nodes
+    k, c1, c2, c3: reward parameters of Fruitchain, need not be the ones of the run
+
+    Returns the reward of each node acc. to Fruitchain rewarding scheme, same as paying
+    every block with FruitchainWindow. A block's fruits get paid by each of the k blocks
+    after it, so with prefix sums of the rates every fruit is paid in one step.
+    Only the rewards change with k, the fruits in the chain are the ones of the run.
+    '''
+    m = len(blocks['fee'])
+    rates = fruitchainRates(blocks, k, c1)
+    cumRates = np.concatenate(([0], np.cumsum(rates)))
+    i = np.arange(m)
+    paid = cumRates[np.minimum(i+k, m-1)+1] - cumRates[i+1] # sum of the rates paid to block i's fruits
+    fruitMinerShare, blockMinerShare = fruitShares(blocks, fruits, k, c2, c3)
+    fruitPaid = paid[fruits['block']]
+    miners = blocks['miner']
+    rewards = c1 * np.bincount(miners[k:], weights=blocks['fee'][k:], minlength=n)
+    rewards += np.bincount(fruits['miner'], weights=fruitPaid*fruitMinerShare, minlength=n)
+    rewards += np.bincount(miners[fruits['block']], weights=fruitPaid*blockMinerShare, minlength=n)
+    rewards += np.bincount(miners, weights=paid, minlength=n) # implicit fruits go to block miners
+    return rewards
+
+def cumulativeRewards(blocks, fruits, nodeID, roundNums, k=16, c1=1/100, c2=1/10, c3=1/100):
+    '''
+    nodeID: node whose rewards are returned
+    roundNums: increasing rounds
+
+    Returns the (Bitcoin, Fruitchain) rewards the node has at the end of each round
+    '''
+    miners = blocks['miner']
+    fee = blocks['fee']
+    mine = miners == nodeID
+    bitcoin = np.cumsum(np.where(mine, fee, 0))
+    # share of the node in each block's fruits, then in the window of each block
+    fruitMinerShare, blockMinerShare = fruitShares(blocks, fruits, k, c2, c3)
+    fruitBlocks = fruits['block']
+    weights = mine.astype(float)
+    weights += np.bincount(fruitBlocks, weights=(fruits['miner'] == nodeID) * fruitMinerShare, minlength=len(fee))
+    weights += np.bincount(fruitBlocks, weights=mine[fruitBlocks] * blockMinerShare, minlength=len(fee))
+    cumWeights = np.concatenate(([0], np.cumsum(weights)))
+    j = np.arange(k, len(fee))
+    fruitchain = np.zeros(len(fee))
+    fruitchain[k:] = c1 * fee[k:] * mine[k:] + fruitchainRates(blocks, k, c1)[k:] * (cumWeights[j] - cumWeights[j-k])
+    fruitchain = np.cumsum(fruitchain)
+    # rewards after the last block mined in or before each round
+    last = np.searchsorted(blocks['mineRound'], roundNums, side='right') - 1
+    bitcoin = np.where(last >= 0, bitcoin[last], 0) if len(fee) else np.zeros(len(roundNums), dtype=np.int64)
+    fruitchain = np.where(last >= 0, fruitchain[last], 0) if len(fee) else np.zeros(len(roundNums))
+    return bitcoin, fruitchain
@@ -2,12 +2,58 @@
 
 #python3 -m cProfile -s time runSimulator.py 10 0 1000 0.1 0.2
 from simulator import *
+import argparse
 import sys
 
 # Setup the parameters
-n, t, r = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
-p, pF = float(sys.argv[4]), float(sys.argv[5])
+parser = argparse.ArgumentParser(description='Run the Bitcoin/Fruitchain simulator')
+parser.add_argument('n', type=int, help='number of nodes')
+parser.add_argument('t', type=int, help='number of corrupt nodes')
+parser.add_argument('r', type=int, help='number of rounds')
+parser.add_argument('p', type=float, help='pr. of mining a block in a round')
+parser.add_argument('pF', type=float, help='pr. of mining a fruit in a round')
+parser.add_argument('filename', nargs='?', default='results', help='prefix of the result files')
+parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+parser.add_argument('--event-driven', action='store_true', help='skip the rounds in which nothing is mined')
+parser.add_argument('--shared-ledger', action='store_true', help='nodes share one chain instead of n copies')
+parser.add_argument('--tx-trace', action='store_true', help='keep a Transaction object for every tx')
+parser.add_argument('--tx-rate', type=int, default=5, help='txs supplied each round, the mean number with --poisson')
+parser.add_argument('--poisson', action='store_true', help='Poisson distributed tx arrivals instead of the same number each round')
+parser.add_argument('--replay', default=None, help='replay the txs of a trace written by workload.writeTrace')
+parser.add_argument('--stats-format', choices=['csv', 'bin'], default='csv', help='format of the per-round stats file')
+parser.add_argument('--stats-interval', type=int, default=1, help='write the stats of every n\'th round only')
+parser.add_argument('--pool-dynamics', action='store_true', help='nodes join mining pools during the run')
+parser.add_argument('--instrument', action='store_true', help='time the phases of each round, written to filename_profile')
+parser.add_argument('--post-hoc-rewards', action='store_true', help='compute the rewards from the recorded chain at the end')
+parser.add_argument('--node-table', action='store_true', help='keep per-node fields in NumPy columns, for large n')
+parser.add_argument('--rolling-window', type=int, default=None, help='keep only this many recent blocks in memory, older ones are archived')
+parser.add_argument('--network-delay', type=int, default=None, help='blocks reach nodes up to this many rounds late, so chains fork')
+parser.add_argument('--fork-choice', choices=['longest', 'heaviest'], default='longest', help='chain nodes adopt with network delay')
+parser.add_argument('--audit', action='store_true', help='check that the chains of all nodes agree after every block')
+parser.add_argument('--delay-stats', action='store_true', help='keep histograms of tx and fruit inclusion delays, written to filename_delays')
+parser.add_argument('--bitcoin-only', action='store_true', help='sample the Bitcoin rewards without stepping through the rounds')
+parser.add_argument('--checkpoint-every', type=int, default=None, help='save the state of the run every n rounds')
+parser.add_argument('--resume', action='store_true', help='continue the run from its latest checkpoint')
+args = parser.parse_args()
+
+n, t, r = args.n, args.t, args.r
+p, pF = args.p, args.pF
 hashFracs = [1/n for i in range(n)]
+workload = None
+if args.poisson:
+    workload = PoissonWorkload(args.tx_rate)
+if args.replay != None:
+    workload = TraceWorkload(args.replay)
 # Run the simulation
-sim = Simulator(n, t, r, p, pF, hashFracs)
-sim.run()
+if args.resume:
+    Simulator.resume(args.filename)
+    sys.exit()
+sim = Simulator(n, t, r, p, pF, hashFracs, txRate=args.tx_rate, seed=args.seed, sharedLedger=args.shared_ledger, txTrace=args.tx_trace,
+    statsFormat=args.stats_format, statsInterval=args.stats_interval, poolDynamics=args.pool_dynamics, instrument=args.instrument,
+    postHocRewards=args.post_hoc_rewards, nodeTable=args.node_table,
+    rollingWindow=args.rolling_window, fruitchainRewards=not args.bitcoin_only, workload=workload,
+    networkDelay=args.network_delay, forkChoice=args.fork_choice, audit=args.audit, delayStats=args.delay_stats)
+if args.bitcoin_only:
+    sim.runBitcoinOnly(args.filename)
+    sys.exit()
+sim.run(args.filename, eventDriven=args.event_driven, checkpointEvery=args.checkpoint_every)
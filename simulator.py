@@ -1,10 +1,15 @@
 #coding: utf-8
 from fruitchain import *
+from statsLogger import *
+from checkpoint import *
 from random import randint
 import math as mt
 
 class Simulator:
-    def __init__(self, n, t, r, p, pF, hashFracs, txRate=5, k=16):
+    def __init__(self, n, t, r, p, pF, hashFracs, txRate=5, k=16, seed=None, sharedLedger=False, txTrace=False, mempoolCapacity=None,
+        statsFormat='csv', statsInterval=1, fruitchainRewards=True, poolDynamics=False, poolPolicy=None, instrument=False,
+        postHocRewards=False, nodeTable=False, rollingWindow=None, workload=None, networkDelay=None, forkChoice='longest',
+        audit=False, delayStats=False):
         '''
         n: number of nodes
         t: number of corrupt nodes
@@ -13,6 +18,24 @@ class Simulator:
         hashFracs: hash power fraction of each node
         txRate: number of txs supplied each round
         k: maximum hanging distance for a fruit
+        seed: seed of the random generator, same seed gives the same run
+        sharedLedger: nodes share one chain and fruit pool instead of keeping n identical copies
+        txTrace: keep a Transaction object for every tx instead of counts of them
+        mempoolCapacity: max. total size of unprocessed txs, None means unbounded
+        statsFormat: 'csv' for the text _stats file, 'bin' for binary columns (_stats.bin)
+        statsInterval: only every statsInterval'th round is written to the stats file
+        fruitchainRewards: also pay rewards acc. to Fruitchain scheme
+        poolDynamics: nodes join/leave mining pools during the run
+        poolPolicy: PoolPolicy deciding when nodes join/leave which pool
+        instrument: time the phases of each round and count what's mined, written to filename_profile
+        postHocRewards: record the chain (filename_chain.npz) and compute the rewards from it at the end
+        nodeTable: keep the per-node fields in NumPy columns (NodeTable), for large n
+        rollingWindow: keep only the last rollingWindow blocks in memory, the chain is archived to filename_chain_*
+        workload: generates the txs of each round (ConstantWorkload, PoissonWorkload, TraceWorkload), default is txRate txs a round
+        networkDelay: max. rounds a block takes to reach a node, chains fork and rewards are paid on the heaviest one (needs postHocRewards)
+        forkChoice: 'longest' or 'heaviest' chain rule of nodes with network delay
+        audit: check that the chains of all nodes agree after every block, a RuntimeError stops the run if they don't
+        delayStats: keep histograms of tx and fruit inclusion delays, written to filename_delays
         '''
         self.n = n
         self.t = t
@@ -22,41 +45,319 @@ class Simulator:
         self.hashFracs = hashFracs
         self.txRate = txRate
         self.k = k
+        self.seed = seed
+        self.statsFormat = statsFormat
+        self.statsInterval = statsInterval
 
-        self.environment = Environment(p, pF, txRate, k) # Environment selects a leader each round for mining
+        # Environment selects a leader each round for mining
+        self.environment = Environment(p=p, pF=pF, txRate=txRate, k=k, seed=seed, sharedLedger=sharedLedger, txTrace=txTrace,
+            mempoolCapacity=mempoolCapacity, fruitchainRewards=fruitchainRewards, poolDynamics=poolDynamics, poolPolicy=poolPolicy,
+            postHocRewards=postHocRewards, nodeTable=nodeTable, rollingWindow=rollingWindow, workload=workload,
+            networkDelay=networkDelay, forkChoice=forkChoice, audit=audit, delayStats=delayStats)
         self.nodes = []
+        nodeClass = TableNode if nodeTable else Node
         for i in range(n):
-            self.nodes.append(Node(i, hashFracs[i], self.environment))
+            self.nodes.append(nodeClass(i, hashFracs[i], self.environment))
         self.environment.initializeNodes(self.nodes, self.t)
-        self.log = []
-
-    def run(self, filename):
-        """ Runs the simulation for r rounds """
-        for i in range(1, self.r+1):
-            self.environment.step(i)
-            self.log.append( (i, len(self.environment.unprocessedTxs), len(self.environment.processedTxs), self.environment.poolHashFraction,
-                self.environment.nodes[0].totalBitcoinReward, self.environment.nodes[0].totalFruitchainReward) )
-            if i%50000 == 0:
-                print('Round:' + str(i) + ' has finished.')
-        print('Simulation for r='+str(self.r)+ ' rounds has finished!')
-        print('Writing results to file: ' + filename)
-        self.saveData(filename)
-        print("Finished!")
+        if instrument:
+            self.environment.instrument()
+        self.logger = None
+        self.verbose = True
+        self.round = 0 # last simulated round
+        self.eventDriven = False
+        self.checkpointer = None
+        self.checkpointEvery = None
+        self.archive = None
+
+    def run(self, filename, eventDriven=False, verbose=True, checkpointEvery=None):
+        """
+        Runs the simulation for r rounds
+
+        eventDriven: jump from one mining event to the next instead of stepping
+        through every round, rounds in between only get their txs
+        verbose: print the progress
+        checkpointEvery: save the whole state to filename_checkpoint every that many rounds,
+        see resume
+        """
+        self.filename = filename
+        self.eventDriven = eventDriven
+        self.verbose = verbose
+        self.checkpointEvery = checkpointEvery
+        if checkpointEvery != None:
+            self.checkpointer = Checkpointer(filename + "_checkpoint")
+        if self.environment.rollingWindow != None:
+            self.archive = ChainArchive(filename + "_chain")
+            self.environment.archiveChain(self.archive)
+        self.openLog(filename)
+        self.simulate()
+
+    @staticmethod
+    def resume(filename, verbose=True):
+        """
+        Continues the run saving to filename from its latest checkpoint.
+        Results are identical to the ones of an uninterrupted run
+        """
+        sim = loadCheckpoint(filename + "_checkpoint")
+        sim.verbose = verbose
+        sim.logger.reopen()
+        if sim.archive != None:
+            sim.archive.reopen()
+        if verbose:
+            print('Resuming from round:' + str(sim.round))
+        sim.simulate()
+        return sim
+
+    def simulate(self):
+        if self.eventDriven:
+            self.runEvents()
+        else:
+            for i in range(self.round+1, self.r+1):
+                self.environment.step(i)
+                self.logRound(i)
+                self.round = i
+                if i%50000 == 0 and self.verbose:
+                    print('Round:' + str(i) + ' has finished.')
+                if self.checkpointEvery != None:
+                    self.checkpointer.poll()
+                    if i%self.checkpointEvery == 0:
+                        self.checkpoint()
+        if self.verbose:
+            print('Simulation for r='+str(self.r)+ ' rounds has finished!')
+            print('Writing results to file: ' + self.filename)
+        self.saveData(self.filename)
+        if self.checkpointer != None:
+            self.checkpointer.remove()
+        if self.verbose:
+            print("Finished!")
+
+    def runBitcoinOnly(self, filename, verbose=True):
+        """
+        Sample the Bitcoin rewards of r rounds without stepping through them and write filename_rewards.
+        With Fruitchain rewards and pool dynamics off, an unbounded mempool and no network delay
+        a node's reward only depends on the rounds and leaders of blocks, so the gaps between
+        blocks are drawn at once (geometric), their leaders at once (acc. to hashFracs) and the fees follow from
+        the tx arrivals (see bitcoinFees). Rewards have the distribution of the ones of run,
+        but aren't the same sample. No stats file is written.
+        """
+        env = self.environment
+        if env.fruitchainRewards or env.poolDynamics or env.mempool.capacity != None or env.poolHashFraction != 0:
+            raise ValueError("Bitcoin-only runs need fruitchainRewards and poolDynamics off, no pools and an unbounded mempool")
+        if env.blockTree != None or env.chainRecorder != None:
+            raise ValueError("Bitcoin-only runs can't have network delay or post-hoc rewards, every block they sample is paid")
+        workload = env.workload
+        if workload != None and (not isinstance(workload, ConstantWorkload) or workload.fee != 1 or workload.size != 1):
+            raise ValueError("Bitcoin-only runs need the same number of txs with fee 1 and size 1 each round")
+        rng = env.rng
+        mean = self.r * self.p
+        gaps = rng.geometric(self.p, size=int(mean + 10*mt.sqrt(mean) + 10))
+        blockRounds = np.cumsum(gaps)
+        while blockRounds[-1] <= self.r:
+            blockRounds = np.concatenate((blockRounds, blockRounds[-1] + np.cumsum(rng.geometric(self.p, size=len(gaps)))))
+        blockRounds = blockRounds[:np.searchsorted(blockRounds, self.r, side='right')]
+        leaders = rng.choice(self.n, size=len(blockRounds), p=self.hashFracs)
+        fees = bitcoinFees(blockRounds, env.txRate if workload == None else workload.txRate, Block.size)
+        rewards = np.bincount(leaders, weights=fees, minlength=self.n).astype(np.int64)
+        for node in self.nodes:
+            node.totalBitcoinReward = int(rewards[node.id])
+        self.round = self.r
+        self.saveRewards(filename)
+        if verbose:
+            print('Sampled ' + str(len(blockRounds)) + ' blocks of r=' + str(self.r) + ' rounds, results are in ' + resultFile(filename, "rewards"))
+
+    def checkpoint(self):
+        """ Save the state of the run in the background """
+        self.logger.flush()
+        if self.archive != None:
+            self.archive.flush()
+        self.checkpointer.save(self)
+
+    def runEvents(self):
+        """
+        Runs the simulation for r rounds by drawing the gap to the next round in
+        which a block or a fruit is mined. Rounds in between only generate txs
+        so their stats are filled in without stepping through them.
+        """
+        env = self.environment
+        ins = env.instrumentation
+        i = self.round
+        while i < self.r:
+            if ins != None:
+                start = perf_counter()
+            gap, blockLeaderID, fruitLeaderID = env.leaderSampler.nextEvent()
+            if ins != None:
+                ins.lap('leaders', start)
+            eventRound = self.r+1 if gap == None else i + gap
+            lastIdle = min(eventRound-1, self.r)
+            if lastIdle > i:
+                self.runIdleRounds(i+1, lastIdle)
+            if eventRound <= self.r:
+                if ins != None:
+                    start = perf_counter()
+                env.generateTxs(eventRound)
+                if ins != None:
+                    ins.lap('txs', start)
+                env.mine(eventRound, blockLeaderID, fruitLeaderID)
+                self.logRound(eventRound)
+            if min(eventRound, self.r)//50000 > i//50000 and self.verbose:
+                print('Round:' + str(min(eventRound, self.r)//50000*50000) + ' has finished.')
+            lastRound = i
+            i = self.round = min(eventRound, self.r)
+            if self.checkpointEvery != None:
+                self.checkpointer.poll()
+                if i//self.checkpointEvery > lastRound//self.checkpointEvery:
+                    self.checkpoint()
+
+    def runIdleRounds(self, firstRound, lastRound):
+        """
+        Run rounds firstRound..lastRound in which nothing is mined. Only rounds
+        in which a node's pool deadline passes are stepped through, and every round
+        if the mempool has a capacity.
+        """
+        env = self.environment
+        ins = env.instrumentation
+        if env.mempool.capacity != None:
+            # what's evicted depends on the txs of every round, so they're stepped through
+            for i in range(firstRound, lastRound+1):
+                if ins != None:
+                    start = perf_counter()
+                env.generateTxs(i)
+                if ins != None:
+                    start = ins.lap('txs', start)
+                if env.poolDynamics:
+                    env.updateMiningPool(i)
+                    if ins != None:
+                        ins.lap('pools', start)
+                self.logRound(i)
+            return
+        while firstRound <= lastRound:
+            deadline = env.poolDeadlines.nextDeadline() if env.poolDynamics else None
+            last = lastRound if deadline == None or deadline > lastRound else max(deadline, firstRound) - 1
+            if last >= firstRound:
+                self.logIdleRounds(firstRound, last)
+                if ins != None:
+                    start = perf_counter()
+                env.generateIdleTxs(firstRound, last)
+                if ins != None:
+                    ins.lap('txs', start)
+            if last == lastRound:
+                return
+            deadline = last+1
+            if ins != None:
+                start = perf_counter()
+            env.generateTxs(deadline)
+            if ins != None:
+                start = ins.lap('txs', start)
+            env.updateMiningPool(deadline)
+            if ins != None:
+                ins.lap('pools', start)
+            self.logRound(deadline)
+            firstRound = deadline+1
+
+    def openLog(self, filename):
+        """ Start streaming the per-round stats to filename_stats """
+        if self.statsFormat == 'bin':
+            filename += "_stats.bin"
+        else:
+            filename += "_stats"
+        header = ["n:" + str(self.n) + " t:" + str(self.t) + " r:" + str(self.r) + " p:" +str(self.p) + " pF:" + str(self.pF),
+            "HashFracs:" + ",".join(map(str, self.hashFracs)),
+            "RoundNum," + "unprocessedTxs," + "processedTxs," + "poolHashFraction" +"," + "bitcoinReward" + "," + "fruitchainReward"]
+        self.logger = StatsLogger(filename, self.r, header, self.statsFormat, self.statsInterval, params=self.params())
+
+    def params(self):
+        """ Parameters of the run, written in the header of binary result files """
+        return {'n': self.n, 't': self.t, 'r': self.r, 'p': self.p, 'pF': self.pF, 'hashFracs': list(self.hashFracs),
+            'txRate': self.txRate, 'k': self.k, 'seed': self.seed, 'statsInterval': self.statsInterval}
+
+    def logRound(self, i):
+        env = self.environment
+        ins = env.instrumentation
+        if ins != None:
+            start = perf_counter()
+        self.logger.log(i, len(env.mempool), env.mempool.nProcessed, env.poolHashFraction,
+            env.nodes[0].totalBitcoinReward, env.nodes[0].totalFruitchainReward)
+        if ins != None:
+            ins.lap('log', start)
+
+    def logIdleRounds(self, firstRound, lastRound):
+        """
+        Log rounds firstRound..lastRound in which nothing is mined. Only the number
+        of unprocessed txs changes, by the arrivals of each round. Call before their txs are generated.
+        """
+        env = self.environment
+        ins = env.instrumentation
+        if ins != None:
+            start = perf_counter()
+        self.logger.logIdleRounds(firstRound, lastRound, len(env.mempool), env.arrivals(firstRound, lastRound), env.mempool.nProcessed,
+            env.poolHashFraction, env.nodes[0].totalBitcoinReward, env.nodes[0].totalFruitchainReward)
+        if ins != None:
+            ins.lap('log', start)
 
     def saveData(self, filename):
         """ Save simulation data """
-        # 1. Save (roundNum, nProcessed, nUnprocessed, miningPoolHashFraction)
-        file = open(filename + "_stats", 'w')
+        # 1. Stats (roundNum, nUnprocessed, nProcessed, miningPoolHashFraction, rewards of node 0) are streamed during the run
+        if self.logger != None:
+            self.logger.close()
+        env = self.environment
+        if self.archive != None:
+            # blocks still in memory complete the archive
+            chain = env.nodes[0].blockChain
+            self.archive.addBlocks(chain.chain)
+            self.archive.close()
+        if env.chainRecorder != None:
+            # rewards weren't paid during the run, compute them and node 0's rewards in the stats from the chain
+            env.payRewards()
+            blocks, fruits = env.chainRecorder.records()
+            env.chainRecorder.save(filename + "_chain.npz")
+            if self.logger != None:
+                def rewardsAt(roundNums):
+                    bitcoin, fruitchain = cumulativeRewards(blocks, fruits, 0, roundNums, env.k, env.c1, env.c2, env.c3)
+                    return bitcoin, (fruitchain if env.fruitchainRewards else np.zeros(len(roundNums)))
+                self.logger.fillRewards(rewardsAt)
+
+        # 2. Save (hashFrac, totalBitcoinReward, totalFruitchainReward) and the histograms of the delays
+        self.saveRewards(filename)
+        if self.environment.delayStats != None:
+            self.saveDelays(filename)
+
+        # 3. (Optional) Save the time of each phase and the counters
+        if self.environment.instrumentation != None:
+            header = ["n:" + str(self.n) + " t:" + str(self.t) + " r:" + str(self.r) + " p:" +str(self.p) + " pF:" + str(self.pF)]
+            self.environment.instrumentation.save(filename + "_profile", header)
+
+    def saveRewards(self, filename):
+        if self.statsFormat == 'bin':
+            nodes = self.environment.nodes
+            writeBinaryResults(filename + "_rewards.bin", self.params(), {
+                'id': np.array([node.id for node in nodes], dtype=np.int64),
+                'hashFrac': np.array([node.hashFrac for node in nodes], dtype=np.float64),
+                'totalBitcoinReward': np.array([node.totalBitcoinReward for node in nodes], dtype=np.int64),
+                'totalFruitchainReward': np.array([node.totalFruitchainReward for node in nodes], dtype=np.float64)})
+        else:
+            self.saveRewardsText(filename)
+
+    def saveDelays(self, filename):
+        """
+        Write the buckets (metric, lower, upper, count) of the delay histograms to filename_delays,
+        metric is the index in DelayStats.metrics. Counts and quantiles of each are in the header
+        """
+        delayStats = self.environment.delayStats
+        if self.statsFormat == 'bin':
+            params = dict(self.params(), metrics=list(delayStats.metrics), summary=delayStats.summary())
+            writeBinaryResults(filename + "_delays.bin", params, delayStats.columns())
+            return
+        columns = delayStats.columns()
+        file = open(filename + "_delays", 'w')
         file.write("# n:" + str(self.n) + " t:" + str(self.t) + " r:" + str(self.r) + " p:" +str(self.p) + " pF:" + str(self.pF) + "\n")
-        file.write("# HashFracs:" + ",".join(map(str, self.hashFracs)) + "\n")
-        file.write("# RoundNum," + "unprocessedTxs," + "processedTxs,"
-         + "poolHashFraction" +"," + "bitcoinReward" + "," + "fruitchainReward" + "\n")
-        for item in self.log:
-            file.write(str(item[0]) + "," + str(item[1]) + "," + str(item[2]) + ","
-            + str(item[3]) + "," + str(item[4]) + "," + str(round(item[5])) + "\n")
+        file.write("# metrics:" + ",".join(delayStats.metrics) + "\n")
+        for metric, summary in delayStats.summary().items():
+            file.write("# " + " ".join(metric + "_" + key + ":" + str(value) for key, value in summary.items()) + "\n")
+        file.write("# Metric," + "Lower," + "Upper," + "Count" + "\n")
+        for row in zip(*[column.tolist() for column in columns.values()]):
+            file.write(",".join(map(str, row)) + "\n")
         file.close()
 
-        # 2. Save (hashFrac, totalBitcoinReward, totalFruitchainReward)
+    def saveRewardsText(self, filename):
         file = open(filename + "_rewards", 'w')
         file.write("# n:" + str(self.n) + " t:" + str(self.t) + " r:" + str(self.r) + " p:" +str(self.p) + " pF:" + str(self.pF) + "\n")
         file.write("# id," + "HashFrac," + "totalBitcoinReward," + "totalFruitchainReward" + "\n")
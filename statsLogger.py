@@ -0,0 +1,193 @@
+#coding: utf-8
+import numpy as np
+import os
+from results import *
+
+class StatsLogger:
+    columns = ('roundNum', 'unprocessedTxs', 'processedTxs', 'poolHashFraction', 'bitcoinReward', 'fruitchainReward')
+    dtypes = (np.int64, np.int64, np.int64, np.float64, np.float64, np.float64)
+    csvFormat = ('%d', '%d', '%d', '%.15g', '%.15g', '%.0f')
+
+    def __init__(self, filename, nRounds, header=(), fmt='csv', interval=1, chunkSize=2**16, params=None):
+        '''
+        filename: file the stats are written to
+        nRounds: number of rounds of the run
+        header: comment lines written at the top of a csv file
+        fmt: 'csv' for the text _stats format, 'bin' for binary columns
+        interval: only every interval'th round is logged
+        chunkSize: number of rows buffered before they are written
+        params: run parameters written in the header of a binary file
+
+        Keeps the per-round stats in preallocated column buffers and writes them
+        to disk chunk by chunk, so memory doesn't grow with the number of rounds
+        and a crashed run keeps what was written. The binary format is the one of
+        results.py, every column is a block of nRounds//interval values, in the order
+        and dtypes of columns.
+        '''
+        if fmt not in ('csv', 'bin'):
+            raise ValueError("unknown stats format: " + str(fmt))
+        self.filename = filename
+        self.fmt = fmt
+        self.interval = interval
+        self.chunkSize = chunkSize
+        self.nRows = nRounds // interval
+        self.buffers = [np.zeros(chunkSize, dtype=dtype) for dtype in self.dtypes]
+        self.pos = 0 # rows in buffers
+        self.rowsWritten = 0
+        self.dataOffset = 0 # where the columns of a binary file start
+        if fmt == 'csv':
+            self.file = open(filename, 'w')
+            for line in header:
+                self.file.write("# " + line + "\n")
+        else:
+            self.file = open(filename, 'wb')
+            binary = binaryHeader(params or {}, list(zip(self.columns, self.dtypes)), self.nRows)
+            self.file.write(binary)
+            self.dataOffset = len(binary)
+            self.file.truncate(self.dataOffset + self.nRows * 8 * len(self.columns))
+
+    def log(self, roundNum, nUnprocessed, nProcessed, poolHashFraction, bitcoinReward, fruitchainReward):
+        if roundNum % self.interval != 0:
+            return
+        i = self.pos
+        buffers = self.buffers
+        buffers[0][i] = roundNum
+        buffers[1][i] = nUnprocessed
+        buffers[2][i] = nProcessed
+        buffers[3][i] = poolHashFraction
+        buffers[4][i] = bitcoinReward
+        buffers[5][i] = fruitchainReward
+        self.pos += 1
+        if self.pos == self.chunkSize:
+            self.flush()
+
+    def logIdleRounds(self, firstRound, lastRound, nUnprocessed, txRate, nProcessed, poolHashFraction, bitcoinReward, fruitchainReward):
+        '''
+        Log rounds firstRound..lastRound in which nothing is mined. Only the number
+        of unprocessed txs changes, by txRate each round starting from nUnprocessed.
+        txRate can also be an array of the arrivals of each round.
+        '''
+        first = -(-firstRound // self.interval) * self.interval # first logged round >= firstRound
+        rounds = np.arange(first, lastRound+1, self.interval)
+        if np.ndim(txRate) == 0:
+            unprocessed = nUnprocessed + txRate*(rounds - firstRound + 1)
+        else:
+            unprocessed = nUnprocessed + np.cumsum(txRate)[rounds - firstRound]
+        while len(rounds):
+            m = min(len(rounds), self.chunkSize - self.pos)
+            rows = slice(self.pos, self.pos+m)
+            self.buffers[0][rows] = rounds[:m]
+            self.buffers[1][rows] = unprocessed[:m]
+            self.buffers[2][rows] = nProcessed
+            self.buffers[3][rows] = poolHashFraction
+            self.buffers[4][rows] = bitcoinReward
+            self.buffers[5][rows] = fruitchainReward
+            self.pos += m
+            rounds = rounds[m:]
+            unprocessed = unprocessed[m:]
+            if self.pos == self.chunkSize:
+                self.flush()
+
+    def flush(self):
+        '''
+        Write the buffered rows to disk
+        '''
+        if self.pos == 0:
+            return
+        cols = [buffer[:self.pos] for buffer in self.buffers]
+        if self.fmt == 'csv':
+            self.writeCsv(self.file, cols)
+        else:
+            for j, col in enumerate(cols):
+                self.file.seek(self.dataOffset + (j * self.nRows + self.rowsWritten) * 8)
+                self.file.write(col.tobytes())
+        self.file.flush()
+        self.rowsWritten += self.pos
+        self.pos = 0
+
+    def writeCsv(self, out, cols):
+        '''
+        Write the columns as csv rows. The rows are formatted from Python lists with one
+        format string, np.savetxt would go through a record for every row
+        '''
+        line = ','.join(self.csvFormat) + '\n'
+        out.write(''.join([line % row for row in zip(*[col.tolist() for col in cols])]))
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def fillRewards(self, rewardsAt):
+        '''
+        rewardsAt: function of an array of rounds returning the (Bitcoin, Fruitchain)
+        rewards at the end of them
+
+        Overwrite the reward columns of the closed log, for runs whose rewards are
+        only known at the end. Rows are rewritten chunk by chunk.
+        '''
+        if self.fmt == 'bin':
+            data = np.memmap(self.filename, dtype=np.uint8, mode='r+')
+            offset = self.dataOffset
+            cols = [data[offset + j*self.nRows*8:offset + (j+1)*self.nRows*8].view(dtype) for j, dtype in enumerate(self.dtypes)]
+            for start in range(0, self.rowsWritten, self.chunkSize):
+                rows = slice(start, min(start + self.chunkSize, self.rowsWritten))
+                cols[4][rows], cols[5][rows] = rewardsAt(cols[0][rows])
+            data.flush()
+            del data, cols
+            return
+        tmp = self.filename + '.tmp'
+        with open(self.filename) as file, open(tmp, 'w') as out:
+            lines = []
+            for line in file:
+                if line.startswith('#'):
+                    out.write(line)
+                    continue
+                lines.append(line)
+                if len(lines) == self.chunkSize:
+                    self.rewriteRows(lines, rewardsAt, out)
+                    lines = []
+            if lines:
+                self.rewriteRows(lines, rewardsAt, out)
+        os.replace(tmp, self.filename)
+
+    def rewriteRows(self, lines, rewardsAt, out):
+        rows = np.loadtxt(lines, delimiter=',', ndmin=2)
+        cols = [rows[:, j].astype(dtype) for j, dtype in enumerate(self.dtypes)]
+        cols[4], cols[5] = rewardsAt(cols[0])
+        self.writeCsv(out, cols)
+
+    def __getstate__(self):
+        # the file can't be pickled, keep where it ends so a resumed run can continue from there.
+        # Buffered rows aren't on disk, so flush before pickling
+        if self.pos != 0:
+            raise RuntimeError("stats logger must be flushed before it is pickled")
+        state = self.__dict__.copy()
+        state['file'] = None
+        state['buffers'] = None
+        state['offset'] = self.file.tell()
+        return state
+
+    def reopen(self):
+        '''
+        Reopen the file of an unpickled logger, dropping what was written after it was pickled
+        '''
+        self.buffers = [np.zeros(self.chunkSize, dtype=dtype) for dtype in self.dtypes]
+        self.file = open(self.filename, 'r+' if self.fmt == 'csv' else 'r+b')
+        if self.fmt == 'csv':
+            self.file.truncate(self.offset)
+        self.file.seek(self.offset)
+
+
+def loadBinaryStats(filename, nRows=None):
+    '''
+    Returns the columns of a binary stats file as a dict of views of the memory-mapped file.
+    nRows is only needed for files written before they had a header
+    '''
+    with open(filename, 'rb') as file:
+        if readBinaryHeader(file) != None:
+            return loadResults(filename)[1]
+    data = np.fromfile(filename, dtype=np.uint8)
+    stats = {}
+    for j, (name, dtype) in enumerate(zip(StatsLogger.columns, StatsLogger.dtypes)):
+        stats[name] = data[j*nRows*8:(j+1)*nRows*8].view(dtype)
+    return stats
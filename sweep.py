@@ -0,0 +1,126 @@
+#coding: utf-8
+
+#python3 sweep.py --n 10 20 --r 100000 --p 0.1 --pF 0.2 0.5 --hashFracs uniform zipf --out sweepResults
+from simulator import *
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import argparse
+import csv
+import os
+
+# Parameters a grid can sweep and their defaults
+DEFAULTS = {'n': 10, 't': 0, 'r': 10000, 'p': 0.1, 'pF': 0.2, 'txRate': 5, 'k': 16, 'hashFracs': 'uniform'}
+
+# Named hash power distributions, each returns the fractions of n nodes
+HASH_DISTRIBUTIONS = {
+    'uniform': lambda n: [1/n for i in range(n)],
+    'linear': lambda n: [2*(i+1)/(n*(n+1)) for i in range(n)],
+    'zipf': lambda n: [(1/(i+1)) / sum(1/(j+1) for j in range(n)) for i in range(n)],
+}
+
+def expandGrid(grid):
+    '''
+    grid: <K, V> = <parameter, list of values>, missing parameters get their default
+
+    Returns the list of configs, one for every combination of the values
+    '''
+    grid = dict(grid)
+    for key in grid:
+        if key not in DEFAULTS:
+            raise ValueError("unknown sweep parameter: " + str(key))
+    keys = list(DEFAULTS)
+    values = [grid.get(key, [DEFAULTS[key]]) for key in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+def hashFractions(config):
+    hashFracs = config['hashFracs']
+    if isinstance(hashFracs, str):
+        return HASH_DISTRIBUTIONS[hashFracs](config['n'])
+    if len(hashFracs) != config['n']:
+        raise ValueError("hashFracs must have a fraction for each of the n nodes")
+    return list(hashFracs)
+
+def estimateCost(config):
+    '''
+    Rough running time of a config, rounds plus broadcasts to every node
+    '''
+    return config['r'] * (1 + config['n'] * (config['p'] + config['pF']))
+
+def runConfig(task):
+    '''
+    task: (index, config, seed, outdir, eventDriven, bitcoinOnly)
+
+    Runs one config and returns its rows of the result table, one per node
+    '''
+    index, config, seed, outdir, eventDriven, bitcoinOnly = task
+    sim = Simulator(config['n'], config['t'], config['r'], config['p'], config['pF'], hashFractions(config),
+        config['txRate'], config['k'], seed=seed, fruitchainRewards=not bitcoinOnly)
+    filename = os.path.join(outdir, 'run' + str(index))
+    env = sim.environment
+    if bitcoinOnly:
+        sim.runBitcoinOnly(filename, verbose=False)
+        # every tx has fee 1, so the rewards add up to the processed txs
+        processedTxs = sum(node.totalBitcoinReward for node in env.nodes)
+        txCounts = {'unprocessedTxs': config['txRate']*config['r'] - processedTxs, 'processedTxs': processedTxs}
+    else:
+        sim.run(filename, eventDriven=eventDriven, verbose=False)
+        txCounts = {'unprocessedTxs': len(env.mempool), 'processedTxs': env.mempool.nProcessed}
+    rows = []
+    for node in env.nodes:
+        row = {'run': index}
+        row.update(config)
+        if not isinstance(config['hashFracs'], str):
+            row['hashFracs'] = 'custom'
+        row.update(txCounts)
+        row.update({'poolHashFraction': env.poolHashFraction, 'id': node.id, 'hashFrac': node.hashFrac,
+            'totalBitcoinReward': node.totalBitcoinReward, 'totalFruitchainReward': node.totalFruitchainReward})
+        rows.append(row)
+    return rows
+
+def sweep(grid, outdir, processes=None, seed=None, eventDriven=False, bitcoinOnly=False):
+    '''
+    grid: <K, V> = <parameter, list of values>, see DEFAULTS for the parameters
+    outdir: directory the _stats/_rewards files of every run and the result table go to
+    processes: number of worker processes, None means one per core
+    seed: root seed, every run gets an independent child seed of it
+    eventDriven: run the simulators in event-driven mode
+    bitcoinOnly: only sample the Bitcoin rewards (see Simulator.runBitcoinOnly), for quick sanity sweeps
+
+    Runs every config of the grid over a process pool, largest configs first so
+    long runs don't leave cores idle at the end. Returns the result table as a list
+    of rows and writes it to outdir/sweep.csv
+    '''
+    configs = expandGrid(grid)
+    seeds = np.random.SeedSequence(seed).spawn(len(configs))
+    os.makedirs(outdir, exist_ok=True)
+    tasks = [(i, configs[i], seeds[i], outdir, eventDriven, bitcoinOnly) for i in range(len(configs))]
+    tasks.sort(key=lambda task: estimateCost(task[1]), reverse=True)
+    results = {}
+    with ProcessPoolExecutor(processes) as executor:
+        for task, rows in zip(tasks, executor.map(runConfig, tasks)):
+            results[task[0]] = rows
+    table = [row for i in range(len(configs)) for row in results[i]]
+    saveTable(table, os.path.join(outdir, 'sweep.csv'))
+    return table
+
+def saveTable(table, filename):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(table[0]))
+        writer.writeheader()
+        writer.writerows(table)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a grid of simulator configs in parallel')
+    for key, value in DEFAULTS.items():
+        kind = str if key == 'hashFracs' else type(value)
+        parser.add_argument('--' + key, type=kind, nargs='+', default=[value], help='values of ' + key)
+    parser.add_argument('--out', default='sweepResults', help='directory of the results')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None, help='root seed of the sweep')
+    parser.add_argument('--event-driven', action='store_true', help='skip the rounds in which nothing is mined')
+    parser.add_argument('--bitcoin-only', action='store_true', help='only sample the Bitcoin rewards, without stepping through the rounds')
+    args = parser.parse_args()
+    grid = {key: getattr(args, key) for key in DEFAULTS}
+    table = sweep(grid, args.out, args.processes, args.seed, args.event_driven, args.bitcoin_only)
+    print('Finished ' + str(len(set(row['run'] for row in table))) + ' runs, results are in ' + os.path.join(args.out, 'sweep.csv'))
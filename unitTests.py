@@ -1,6 +1,13 @@
 #coding: utf-8
 import unittest
-from fruitchain import *
+import tempfile
+import time
+from unittest import mock
+import os
+from simulator import *
+from sweep import *
+from replicate import *
+from benchmarks import *
 
 class TestDataStructures(unittest.TestCase):
 
@@ -23,6 +30,91 @@ class TestDataStructures(unittest.TestCase):
         for b in chain:
             self.assertEqual(b, block)
 
+    def test_recordKeys(self):
+        '''
+        Keys of fruits/blocks don't collide, even if their fields
+        concatenate to the same string
+        '''
+        self.assertNotEqual(Fruit(1, 10), Fruit(11, 0))
+        self.assertNotEqual(Block(1, 10), Block(11, 0))
+        self.assertNotEqual(Fruit(1, 10).key, Block(1, 10).key)
+        self.assertEqual(Fruit(1, 10), Fruit(1, 10, 3))
+        self.assertEqual(len({Fruit(1, 10), Fruit(11, 0), Fruit(1, 10)}), 2)
+        self.assertFalse(hasattr(Fruit(), '__dict__'))
+
+    def test_chainDigests(self):
+        '''
+        Chains with the same blocks have the same digests whatever keeps them,
+        and the common prefix is where the digests start to differ
+        '''
+        full, rolling, forked = Blockchain(), RollingBlockchain(8), Blockchain()
+        tree = BlockTree()
+        view = TreeChain(tree, 0)
+        for r in range(1, 30):
+            for chain in (full, rolling, view):
+                chain.append(Block(0, r))
+            forked.append(Block(0 if r < 20 else 1, r))
+        self.assertEqual(full, rolling)
+        self.assertEqual(full, view)
+        self.assertNotEqual(full, forked)
+        self.assertEqual(full.digest(12), view.digest(12))
+        self.assertEqual(commonPrefix(full, forked), 20) # genesis and the blocks of rounds 1..19
+        self.assertEqual(commonPrefix(rolling, forked), 20)
+        self.assertEqual(commonPrefixOfAll([full, rolling, view, forked]), 20)
+        self.assertEqual(commonPrefixOfAll([rolling, full, view]), 30)
+        with self.assertRaises(IndexError):
+            rolling.digest(3)
+        self.assertEqual([b.mineRound for b in rolling], list(range(16, 30)))
+        # keys of late rounds collide in Python's int hash, the blocks they stand for don't
+        late1, late2 = Blockchain(), Blockchain()
+        late1.append(Block(1, 0))
+        late2.append(Block(0, 2**29))
+        self.assertEqual(hash(late1.head.key), hash(late2.head.key))
+        self.assertNotEqual(late1, late2)
+
+    def test_blockTree(self):
+        '''
+        Forks share their common blocks, ancestors are found by jumps and nodes adopt heavier chains only
+        '''
+        tree = BlockTree()
+        tree.track(2)
+        chains = [TreeChain(tree, i) for i in range(3)]
+        for r in range(1, 40):
+            chains[0].append(Block(0, r))
+        for r in range(1, 6):
+            chains[1].append(Block(1, r))
+        fork = tree.ancestor(chains[0].tip, 5)
+        tree.tips[2] = fork
+        for r in range(1, 4):
+            chains[2].append(Block(2, r))
+        self.assertEqual(tree.commonAncestor(chains[0].tip, chains[2].tip), fork)
+        self.assertEqual(tree.commonAncestor(chains[1].tip, chains[2].tip), 0)
+        self.assertEqual(chains[2][4], chains[0][4])
+        self.assertEqual(chains[2][5], Block(2, 1))
+        self.assertEqual(list(tree.ancestors([chains[0].tip, chains[2].tip], 5)), [fork, fork])
+        removed, added = tree.reorg(chains[2].tip, chains[0].tip)
+        self.assertEqual((len(removed), len(added)), (3, 35))
+        self.assertEqual(tree.best, chains[0].tip)
+
+        tree.deliver(chains[2].tip, [0, 1])
+        self.assertEqual(chains[1].head, Block(2, 3))
+        self.assertEqual(chains[0].head, Block(0, 39))
+        self.assertEqual(chains[1].length, 8)
+        # a fruit is only fresh on the forks that contain the block it hangs from
+        tree.track(3)
+        chains.append(TreeChain(tree, 3))
+        tree.tips[3] = tree.ancestor(chains[0].tip, 8)
+        orphan, common = Fruit(2, 50, 5), Fruit(2, 51, 4)
+        tree.addFruit(orphan, chains[2].tip)
+        tree.addFruit(common, chains[2].tip)
+        self.assertEqual(chains[2].freshFruits(16), {orphan, common})
+        self.assertEqual(chains[3].freshFruits(16), {common})
+        queue = DeliveryQueue()
+        queue.schedule(7, 1, [0])
+        queue.schedule(5, 2, [1])
+        queue.schedule(7, 3, [2])
+        self.assertEqual([i for i, recipients in queue.popDue(7)], [2, 1, 3])
+
     def test_Transaction(self):
         t = Transaction(1, 10, 5)
         t2 = Transaction(1, 20, 10)
@@ -67,6 +159,26 @@ class TestNode(unittest.TestCase):
         freshFruits = node.getFreshFruits()
         self.assertEqual(node.validFruits[1], freshFruits)
 
+    def test_freshFruitIndex(self):
+        '''
+        Fruits leave the fresh index when a block contains them,
+        and buckets expire once they fall behind the last k blocks
+        '''
+        env = Environment(k=2)
+        node = Node(1, env=env)
+        node.mineFruit(1)
+        node.mineBlock(2) # contains the fruit
+        self.assertEqual(node.freshFruits, {})
+        self.assertEqual(node.getFreshFruits(), set())
+
+        f = node.mineFruit(3) # hangs from genesis
+        self.assertEqual(node.getFreshFruits(), {f})
+        # blocks of other miners that don't contain f push genesis out of the window
+        node.deliver((Block(2, 4, set(), []), Fruit(2, 4, 1)))
+        node.deliver((Block(3, 5, set(), []), None))
+        self.assertEqual(node.getFreshFruits(), {Fruit(2, 4, 1)})
+        self.assertNotIn(1, node.freshFruits)
+
     def test_blockMining(self):
         '''
         Mine a block in round 3, see if it's added
@@ -128,29 +240,74 @@ class TestEnvironment(unittest.TestCase):
         Generate 105 txs in a round,
         have a node process them
         '''
+        for txTrace in [False, True]:
+            env = Environment(txTrace=txTrace)
+            node = Node(1, env=env)
+            env.initializeNodes([node])
 
-        env = Environment()
-        node = Node(1)
-        env.initializeNodes([node])
+            # Generate 105 txs in a round 1
+            env.txRate = 105
+            env.generateTxs(1)
+            self.assertEqual(len(env.mempool), 105)
+            # Node mines a block in rnd2 which should contain b.size txs
+            node.mineBlock(2)
+            b = node.blockChain[1]
+            remainingTxs = max(0, 105 - b.size)
+            self.assertEqual(b.nTxs , min(b.size, 105))
+            self.assertEqual(b.totalFee , min(b.size, 105))
+            self.assertEqual(env.mempool.nProcessed, min(b.size, 105))
+            self.assertEqual(len(env.mempool), remainingTxs)
+            if txTrace:
+                self.assertEqual(len(b.txs), b.nTxs)
 
-        # Generate 105 txs in a round 1
-        env.txRate = 105
-        env.generateTxs(1)
-        self.assertEqual(len(env.unprocessedTxs), 105)
-        # Node mines a block in rnd2 which should contain b.size txs
-        node.mineBlock(2)
-        b = node.blockChain[1]
-        remainingTxs = max(0, 105 - b.size)
-        self.assertEqual(len(b.txs) , min(b.size, 105))
-        self.assertEqual(len(env.processedTxs), min(b.size, 105))
-        self.assertEqual(len(env.unprocessedTxs), remainingTxs)
-
-        # Node mines the next block in rnd3 which should contain remainingTxs
-        node.mineBlock(3)
-        b = node.blockChain[2]
-        self.assertEqual(len(b.txs), remainingTxs)
-        self.assertEqual(len(env.processedTxs), 105)
-        self.assertEqual(len(env.unprocessedTxs), 0)
+            # Node mines the next block in rnd3 which should contain remainingTxs
+            node.mineBlock(3)
+            b = node.blockChain[2]
+            self.assertEqual(b.nTxs, remainingTxs)
+            self.assertEqual(env.mempool.nProcessed, 105)
+            self.assertEqual(len(env.mempool), 0)
+
+    def test_mempoolFill(self):
+        '''
+        Counted txs are taken by fee rate, and filling stops
+        at the first tx that doesn't fit
+        '''
+        mempool = Mempool()
+        mempool.add(1, 1, 1, 10)
+        mempool.add(2, 6, 2, 3)  # fee rate 3
+        mempool.add(3, 20, 10, 1) # fee rate 2, doesn't fit after the rate 3 txs
+        block = Block(0, 4, set(), [])
+        bcastRounds, counts = mempool.fill(4, block, 8)
+        self.assertEqual(block.nTxs, 3)
+        self.assertEqual(block.totalFee, 18)
+        self.assertEqual(list(bcastRounds), [2])
+        self.assertEqual(list(counts), [3])
+        self.assertEqual(len(mempool), 11)
+
+        block = Block(0, 5, set(), [])
+        mempool.fill(5, block)
+        self.assertEqual((block.nTxs, block.totalFee), (11, 30))
+        self.assertEqual((len(mempool), mempool.nProcessed, mempool.processedFee), (0, 14, 48))
+
+    def test_feePriority(self):
+        '''
+        Txs are taken by fee rate no matter the order they arrive in,
+        the lowest fee rates are evicted once capacity is exceeded
+        '''
+        mempool = TraceMempool(capacity=5)
+        for fee in [3, 1, 5, 2, 4]:
+            mempool.append(Transaction(1, fee, 1))
+        mempool.addBatch(2, [6, 6, 1], 1)
+        self.assertEqual(mempool.nEvicted, 3)
+        self.assertEqual(len(mempool), 5)
+        block = Block(0, 3, set(), [])
+        mempool.fill(3, block, 3)
+        self.assertEqual([tx.fee for tx in block.txs], [6, 6, 5])
+        self.assertEqual([tx.includeRound for tx in block.txs], [3, 3, 3])
+        block = Block(0, 4, set(), [])
+        mempool.fill(4, block, 3)
+        self.assertEqual([tx.fee for tx in block.txs], [4, 3])
+        self.assertEqual(len(mempool), 0)
 
     def test_rewardFruitchain(self):
         '''
@@ -199,7 +356,7 @@ class TestEnvironment(unittest.TestCase):
             node.deliver((b2, None))
 
         # Env supplies a tx with fee 100, miner5 takes it in a block
-        env.unprocessedTxs.append(Transaction(5, 100, 1))
+        env.mempool.append(Transaction(5, 100, 1))
         env.nFruitsInWindow = 5
 
         b3 = nodes[5].mineBlock(6)
@@ -219,6 +376,24 @@ class TestEnvironment(unittest.TestCase):
         self.assertEqual(round(nodes[4].totalFruitchainReward, 2), 23.76)
         self.assertEqual(nodes[5].totalFruitchainReward, 1)
 
+    def test_fruitchainWindow(self):
+        '''
+        Incremental window gives the same rewards as walking
+        the last k blocks on every block
+        '''
+        rewards = []
+        for incremental in [False, True]:
+            env = Environment(0.2, 0.5, k=4, seed=3, fruitchainRewards=incremental)
+            nodes = [Node(i, 0.25, env) for i in range(4)]
+            env.initializeNodes(nodes)
+            for i in range(1, 2000):
+                b, f = env.step(i)
+                if b != None and not incremental:
+                    env.rewardFruitchain(b.minerID, i)
+            rewards.append([node.totalFruitchainReward for node in nodes])
+        self.assertGreater(sum(rewards[0]), 0)
+        np.testing.assert_allclose(rewards[0], rewards[1])
+
     def test_updateMiningPool(self):
         """
         We have three nodes, each having 3 as expected block interval.
@@ -232,7 +407,7 @@ class TestEnvironment(unittest.TestCase):
         env.initializeNodes(nodes)
 
         for i in range(3):
-            env.unprocessedTxs.append(Transaction(i, 10, 1))
+            env.mempool.append(Transaction(i, 10, 1))
             nodes[0].mineBlock(i+1)
             env.rewardBitcoin(0, i+1)
 
@@ -240,13 +415,676 @@ class TestEnvironment(unittest.TestCase):
         env.updateMiningPool(3)
         self.assertEqual(env.miningPool, {1, 2})
 
-        env.unprocessedTxs.append(Transaction(4, 50, 1))
+        env.mempool.append(Transaction(4, 50, 1))
         nodes[1].mineBlock(4)
         env.rewardBitcoin(1, 4)
 
         self.assertEqual(nodes[1].totalBitcoinReward, 25)
         self.assertEqual(nodes[2].totalBitcoinReward, 25)
 
+    def test_poolDeadlines(self):
+        '''
+        Every round, no solo honest node has waited its expected
+        block interval, i.e. deadlines are re-keyed on rewards
+        '''
+        env = Environment(0.3, 0.3, seed=4, poolDynamics=True)
+        nodes = [Node(i, hashFrac, env) for i, hashFrac in enumerate([0.4, 0.3, 0.2, 0.1])]
+        env.initializeNodes(nodes, 1)
+        for i in range(1, 200):
+            env.step(i)
+            for node in env.honestNodes:
+                if node.id not in env.miningPool:
+                    self.assertLess(i - env.rewardTime[node.id], node.expectedBlockInterval)
+        self.assertNotIn(3, env.miningPool) # corrupt nodes don't join
+        self.assertAlmostEqual(env.poolHashFraction, sum(nodes[i].hashFrac for i in env.miningPool))
+
+    def test_poolPolicy(self):
+        '''
+        Nodes spread over the pools and leave them after stay rounds
+        '''
+        env = Environment(poolPolicy=PoolPolicy(nPools=2, stay=5))
+        nodes = [Node(i, 0.25, env) for i in range(4)]
+        env.initializeNodes(nodes)
+        env.updateMiningPool(4) # all expected intervals are 4
+        self.assertEqual(len(env.pools[0]), 2)
+        self.assertEqual(len(env.pools[1]), 2)
+        self.assertEqual(env.poolHashFraction, 1)
+        env.updateMiningPool(8)
+        self.assertEqual(env.poolHashFraction, 1)
+        env.updateMiningPool(9)
+        self.assertEqual(env.poolOf, {})
+        self.assertEqual(env.poolHashFraction, 0)
+
+
+class TestSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'run')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_runEvents(self):
+        '''
+        Event-driven run logs every round and keeps the tx counts consistent
+        '''
+        sim = Simulator(3, 0, 500, 0.1, 0.2, [1/3]*3, seed=5)
+        sim.run(self.filename, eventDriven=True)
+        log = np.loadtxt(self.filename + "_stats", delimiter=",")
+        self.assertEqual(list(log[:, 0]), list(range(1, 501)))
+        for item in log:
+            self.assertEqual(item[1] + item[2], item[0]*sim.txRate)
+        self.assertEqual(log[-1][4], sim.nodes[0].totalBitcoinReward)
+
+    def test_capacityEvents(self):
+        '''
+        With a mempool capacity event-driven runs log what's left after evictions, like stepped runs
+        '''
+        for eventDriven in (False, True):
+            sim = Simulator(4, 0, 3000, 0.01, 0.02, [0.25]*4, seed=5, mempoolCapacity=50)
+            sim.run(self.filename, eventDriven=eventDriven, verbose=False)
+            log = np.loadtxt(self.filename + "_stats", delimiter=",")
+            mempool = sim.environment.mempool
+            self.assertEqual(list(log[:, 0]), list(range(1, 3001)))
+            self.assertEqual(log[:, 1].max(), 50)
+            self.assertEqual(list(log[-1][1:3]), [len(mempool), mempool.nProcessed])
+            self.assertEqual(len(mempool) + mempool.nProcessed + mempool.nEvicted, 3000*sim.txRate)
+
+    def test_sharedLedger(self):
+        '''
+        Sharing one ledger gives the same run as n private copies
+        '''
+        private = Simulator(4, 0, 300, 0.2, 0.3, [0.25]*4, seed=2, fruitchainRewards=True)
+        shared = Simulator(4, 0, 300, 0.2, 0.3, [0.25]*4, seed=2, sharedLedger=True, fruitchainRewards=True)
+        private.run(self.filename + "_private", eventDriven=True)
+        shared.run(self.filename + "_shared", eventDriven=True)
+        for name in ("_stats", "_rewards"):
+            with open(self.filename + "_private" + name) as f1, open(self.filename + "_shared" + name) as f2:
+                self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(private.nodes[0].blockChain, shared.nodes[0].blockChain)
+        # fruits hang from the same blocks as with private chains, the block of their round isn't one of them
+        hangHeights = lambda sim: [[f.hangBlockHeight for f in sorted(b.fruits, key=lambda f: f.mineRound)] for b in sim.nodes[0].blockChain.chain]
+        self.assertEqual(hangHeights(private), hangHeights(shared))
+        for node in shared.nodes:
+            self.assertIs(node.blockChain, shared.environment.ledger.blockChain)
+
+    def test_poolDynamicsEvents(self):
+        '''
+        Pool joins in idle rounds are logged in the round they happen
+        '''
+        sim = Simulator(4, 0, 400, 0.05, 0.05, [0.25]*4, seed=6, poolDynamics=True)
+        sim.run(self.filename, eventDriven=True, verbose=False)
+        log = np.loadtxt(self.filename + "_stats", delimiter=",")
+        # Replay the joins from the chain, a node joins at the end of the first round
+        # it has waited 80 rounds (its expected block interval) since its last solo block
+        blockRounds = defaultdict(set)
+        for b in sim.nodes[0].blockChain.chain[1:]:
+            blockRounds[b.minerID].add(b.mineRound)
+        joinRound = {}
+        for i in range(4):
+            lastReward = 0
+            for j in range(1, 401):
+                if j in blockRounds[i]:
+                    lastReward = j
+                if j - lastReward >= 80:
+                    joinRound[i] = j
+                    break
+        for item in log:
+            expected = sum(0.25 for i in joinRound if joinRound[i] <= item[0])
+            self.assertAlmostEqual(item[3], expected)
+
+    def test_nodeTable(self):
+        '''
+        Nodes in a NodeTable get the same rewards as plain nodes, pool payouts included
+        '''
+        policy = PoolPolicy(nPools=2, stay=60)
+        plain = Simulator(6, 1, 1500, 0.1, 0.2, [0.1, 0.1, 0.2, 0.2, 0.2, 0.2], seed=9, poolDynamics=True, poolPolicy=policy)
+        plain.run(self.filename + "_plain", verbose=False)
+        sim = Simulator(6, 1, 1500, 0.1, 0.2, [0.1, 0.1, 0.2, 0.2, 0.2, 0.2], seed=9, poolDynamics=True, poolPolicy=policy, nodeTable=True)
+        sim.run(self.filename, verbose=False)
+        for name in ("_stats", "_rewards"):
+            with open(self.filename + name) as file, open(self.filename + "_plain" + name) as plainFile:
+                self.assertEqual(file.read(), plainFile.read())
+        table = sim.environment.nodeTable
+        self.assertEqual(list(table.snapshot()['totalBitcoinReward']), [node.totalBitcoinReward for node in plain.nodes])
+        self.assertEqual(list(table.poolMembers(0)), sorted(plain.environment.pools[0]))
+        sim.environment.setHashFractions([0.5, 0.1, 0.1, 0.1, 0.1, 0.1])
+        self.assertEqual(sim.nodes[0].expectedBlockInterval, 20)
+        self.assertAlmostEqual(sim.environment.blockLeaderProbs[0], 0.05)
+        with self.assertRaises(ValueError):
+            env = Environment(nodeTable=True)
+            env.initializeNodes([Node(0, 1, env)])
+
+    def test_resume(self):
+        '''
+        A run that crashes and resumes from its checkpoint gives
+        the same files as an uninterrupted run, the chain archive included
+        '''
+        original = Simulator.logRound
+        def crashingLogRound(sim, i):
+            if i >= 250:
+                raise KeyboardInterrupt
+            original(sim, i)
+        for eventDriven, rollingWindow in [(False, None), (True, 18)]:
+            full = Simulator(4, 0, 400, 0.1, 0.3, [0.25]*4, seed=8, poolDynamics=True, rollingWindow=rollingWindow)
+            full.run(self.filename + "_full", eventDriven, verbose=False)
+            crashed = Simulator(4, 0, 400, 0.1, 0.3, [0.25]*4, seed=8, poolDynamics=True, rollingWindow=rollingWindow)
+            with mock.patch.object(Simulator, 'logRound', crashingLogRound):
+                with self.assertRaises(KeyboardInterrupt):
+                    crashed.run(self.filename, eventDriven, verbose=False, checkpointEvery=100)
+            crashed.checkpointer.wait()
+            resumed = Simulator.resume(self.filename, verbose=False)
+            self.assertEqual(resumed.round, 400)
+            self.assertFalse(os.path.exists(self.filename + "_checkpoint"))
+            suffixes = ["_stats", "_rewards"] + (["_chain_blocks", "_chain_fruits"] if rollingWindow else [])
+            for suffix in suffixes:
+                with open(self.filename + "_full" + suffix, 'rb') as f1, open(self.filename + suffix, 'rb') as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "checkpoints are written by a forked child")
+    def test_failedCheckpoint(self):
+        '''
+        A checkpoint writer that fails prints its traceback and
+        the parent is told with the path as soon as it polls
+        '''
+        checkpointer = Checkpointer(self.filename + "_checkpoint")
+        with tempfile.TemporaryFile('w+') as err:
+            with mock.patch('sys.stderr', err):
+                checkpointer.save(lambda: 0) # lambdas can't be pickled
+            with self.assertRaises(RuntimeError) as raised:
+                for _ in range(1000):
+                    checkpointer.poll()
+                    time.sleep(0.01)
+            self.assertIn(self.filename + "_checkpoint", str(raised.exception))
+            self.assertIn("exit status 1", str(raised.exception))
+            self.assertEqual(checkpointer.pid, None)
+            err.seek(0)
+            self.assertIn("Traceback", err.read())
+
+    def test_statsLogger(self):
+        '''
+        Every 10th round is written to the binary stats,
+        also when they are written in several chunks
+        '''
+        binRun = Simulator(3, 0, 1000, 0.1, 0.2, [1/3]*3, seed=4, statsFormat='bin', statsInterval=10)
+        binRun.openLog(self.filename + "_bin")
+        binRun.logger.chunkSize = 7
+        binRun.logger.buffers = [np.zeros(7, dtype=dtype) for dtype in StatsLogger.dtypes]
+        binRun.runEvents()
+        binRun.saveData(self.filename + "_bin")
+        stats = loadBinaryStats(self.filename + "_bin_stats.bin", 100)
+        self.assertEqual(list(stats['roundNum']), list(range(10, 1001, 10)))
+        self.assertEqual(list(stats['processedTxs'] + stats['unprocessedTxs']), list(stats['roundNum']*5))
+        self.assertEqual(stats['bitcoinReward'][-1], binRun.nodes[0].totalBitcoinReward)
+
+    def test_loadResults(self):
+        '''
+        Binary and text result files load to the same parameters and columns
+        '''
+        for fmt in ['csv', 'bin']:
+            sim = Simulator(3, 0, 500, 0.1, 0.2, [0.2, 0.3, 0.5], seed=3, statsFormat=fmt)
+            sim.run(self.filename + fmt, verbose=False)
+        textParams, textStats = loadResults(resultFile(self.filename + "csv", "stats"))
+        params, stats = loadResults(resultFile(self.filename + "bin", "stats"))
+        self.assertIsInstance(stats['roundNum'], np.memmap)
+        self.assertEqual(params['seed'], 3)
+        for key in textParams:
+            self.assertEqual(params[key], textParams[key])
+        for name in StatsLogger.columns:
+            np.testing.assert_allclose(stats[name], textStats[name], atol=0.5)
+        textParams, textRewards = loadResults(resultFile(self.filename + "csv", "rewards"))
+        params, rewards = loadResults(resultFile(self.filename + "bin", "rewards"))
+        self.assertEqual(list(rewards['totalBitcoinReward']), list(textRewards['totalBitcoinReward']))
+        self.assertEqual(list(rewards['hashFrac']), [0.2, 0.3, 0.5])
+
+    def test_postHocRewards(self):
+        '''
+        Rewards computed from the recorded chain are the ones paid during a run,
+        also for Fruitchain parameters other than the run's
+        '''
+        inline = Simulator(4, 0, 3000, 0.1, 0.3, [0.1, 0.2, 0.3, 0.4], seed=8, k=6)
+        inline.run(self.filename + "_inline", verbose=False)
+        sim = Simulator(4, 0, 3000, 0.1, 0.3, [0.1, 0.2, 0.3, 0.4], seed=8, k=6, postHocRewards=True)
+        sim.run(self.filename, verbose=False)
+        for node, inlineNode in zip(sim.nodes, inline.nodes):
+            self.assertEqual(node.totalBitcoinReward, inlineNode.totalBitcoinReward)
+            self.assertAlmostEqual(node.totalFruitchainReward, inlineNode.totalFruitchainReward, places=6)
+        stats = np.loadtxt(self.filename + "_stats", delimiter=",")
+        inlineStats = np.loadtxt(self.filename + "_inline_stats", delimiter=",")
+        np.testing.assert_allclose(stats, inlineStats)
+        # pay the same chain with other parameters
+        for node in inline.nodes:
+            node.totalFruitchainReward = 0
+        window = FruitchainWindow(3, 0.05, 0.2, 0.02)
+        for b in sim.nodes[0].blockChain[1:]:
+            window.addBlock(b, inline.nodes)
+        blocks, fruits = loadChainRecords(self.filename + "_chain.npz")
+        rewards = fruitchainRewards(blocks, fruits, 4, 3, 0.05, 0.2, 0.02)
+        np.testing.assert_allclose(rewards, [node.totalFruitchainReward for node in inline.nodes])
+        bitcoin, fruitchain = cumulativeRewards(blocks, fruits, 2, [0, 3000], 3, 0.05, 0.2, 0.02)
+        self.assertEqual(list(bitcoin), [0, sim.nodes[2].totalBitcoinReward])
+        self.assertAlmostEqual(fruitchain[1], rewards[2])
+        # Bitcoin rewards only, the Fruitchain column of the stats stays 0
+        bitcoinOnly = Simulator(4, 0, 3000, 0.1, 0.3, [0.1, 0.2, 0.3, 0.4], seed=8, k=6, postHocRewards=True, fruitchainRewards=False)
+        bitcoinOnly.run(self.filename + "_bitcoin", verbose=False)
+        stats = np.loadtxt(self.filename + "_bitcoin_stats", delimiter=",")
+        np.testing.assert_allclose(stats[:, 4], inlineStats[:, 4])
+        self.assertFalse(stats[:, 5].any())
+
+    def test_rollingWindow(self):
+        '''
+        A rolling chain keeps its last blocks in memory and archives the others,
+        without changing the run
+        '''
+        plain = Simulator(3, 0, 2000, 0.2, 0.3, [1/3]*3, seed=2, k=4, postHocRewards=True)
+        plain.run(self.filename + "_plain", verbose=False)
+        sim = Simulator(3, 0, 2000, 0.2, 0.3, [1/3]*3, seed=2, k=4, postHocRewards=True, rollingWindow=6)
+        sim.run(self.filename, verbose=False)
+        for name in ("_stats", "_rewards"):
+            with open(self.filename + name) as file, open(self.filename + "_plain" + name) as plainFile:
+                self.assertEqual(file.read(), plainFile.read())
+        chain = sim.nodes[0].blockChain
+        self.assertEqual(chain.length, plain.nodes[0].blockChain.length)
+        self.assertLess(len(chain.chain), 12)
+        self.assertEqual(chain[-1], plain.nodes[0].blockChain[-1])
+        with self.assertRaises(IndexError):
+            chain[1]
+        self.assertTrue(all(pos >= chain.offset+1 for pos in sim.nodes[1].validFruits))
+        self.assertLess(len(sim.nodes[1].fruitsInChain), len(plain.nodes[1].fruitsInChain))
+        # the archive has the whole chain, in the format of the chain records
+        blocks, fruits = loadChainArchive(self.filename + "_chain")
+        recordedBlocks, recordedFruits = loadChainRecords(self.filename + "_plain_chain.npz")
+        for name in blocks:
+            self.assertEqual(list(blocks[name]), list(recordedBlocks[name]))
+        for name in fruits:
+            self.assertEqual(list(fruits[name]), list(recordedFruits[name]))
+
+    def test_bitcoinOnly(self):
+        '''
+        Fees follow the backlog of txs, and a Bitcoin-only run pays every tx of the blocks it samples
+        '''
+        rounds = np.array([3, 4, 10, 2000, 2001, 5000, 5003])
+        fees = bitcoinFees(rounds, 7, 10**4)
+        backlog, last, expected = 0, 0, []
+        for roundNum in rounds:
+            backlog += (roundNum - last) * 7
+            last = roundNum
+            expected.append(min(backlog, 10**4))
+            backlog -= expected[-1]
+        self.assertEqual(list(fees), expected)
+        sim = Simulator(4, 0, 100000, 0.1, 0.2, [0.1, 0.2, 0.3, 0.4], seed=1, fruitchainRewards=False)
+        sim.runBitcoinOnly(self.filename, verbose=False)
+        rewards = np.loadtxt(self.filename + "_rewards", delimiter=",")
+        self.assertEqual(list(rewards[:, 2]), [node.totalBitcoinReward for node in sim.nodes])
+        self.assertGreater(rewards[:, 2].sum(), 5*(100000 - 100))
+        self.assertLessEqual(rewards[:, 2].sum(), 5*100000)
+        with self.assertRaises(ValueError):
+            Simulator(4, 0, 100, 0.1, 0.2, [0.25]*4).runBitcoinOnly(self.filename)
+        with self.assertRaises(ValueError):
+            Simulator(4, 0, 100, 0.1, 0.2, [0.25]*4, fruitchainRewards=False, postHocRewards=True, networkDelay=5).runBitcoinOnly(self.filename)
+
+    def test_workloads(self):
+        '''
+        Txs are added in bulk, and every round of step and event-driven runs gets the arrivals of the workload
+        '''
+        perRound, bulk = Mempool(), Mempool()
+        for roundNum, fees in [(1, [3, 1, 3]), (2, []), (3, [2])]:
+            perRound.addBatch(roundNum, fees, 1)
+        bulk.addRounds([3, 1, 1, 1], [2, 3, 1, 3], 1)
+        self.assertEqual(perRound.buckets, bulk.buckets)
+        oneByOne, bulk = Mempool(), Mempool()
+        rounds, continuous = np.repeat(np.arange(1, 21), 10), np.random.default_rng(0).lognormal(size=200)
+        for roundNum, fee in zip(rounds.tolist(), continuous.tolist()):
+            oneByOne.add(roundNum, fee)
+        bulk.addRounds(rounds, continuous, 1)
+        self.assertEqual((oneByOne.rates, oneByOne.buckets, len(oneByOne)), (bulk.rates, bulk.buckets, len(bulk)))
+
+        def fees(rng, count):
+            return rng.integers(1, 10, count)
+        writeTrace(self.filename + "_trace.bin", [5, 1, 700, 5, 300], [2, 1, 4, 3, 1], 1, [10, 2, 7, 1, 40])
+        traceArrivals = np.zeros(800, dtype=np.int64)
+        traceArrivals[[0, 4, 299, 699]] = [2, 11, 40, 7]
+        for workload, arrivals in [(lambda: PoissonWorkload(4, fees, seed=1, chunkRounds=64), PoissonWorkload(4, fees, seed=1, chunkRounds=64).arrivals(1, 800)),
+                (lambda: TraceWorkload(self.filename + "_trace.bin"), traceArrivals)]:
+            for eventDriven in [False, True]:
+                sim = Simulator(3, 0, 800, 0.05, 0.2, [1/3]*3, seed=4, workload=workload())
+                sim.run(self.filename, eventDriven=eventDriven, verbose=False)
+                log = np.loadtxt(self.filename + "_stats", delimiter=",")
+                self.assertTrue(np.array_equal(log[:, 1] + log[:, 2], np.cumsum(arrivals)))
+        with self.assertRaises(ValueError):
+            sim.runBitcoinOnly(self.filename)
+
+    def test_networkDelay(self):
+        '''
+        Without delay the tree gives the run without network delay, with delay
+        chains fork and only the blocks of the heaviest chain are paid
+        '''
+        plain = Simulator(5, 0, 2000, 0.2, 0.3, [0.2]*5, seed=3, postHocRewards=True)
+        plain.run(self.filename + "_plain", verbose=False)
+        tree = Simulator(5, 0, 2000, 0.2, 0.3, [0.2]*5, seed=3, postHocRewards=True, networkDelay=0)
+        tree.run(self.filename, verbose=False)
+        for suffix in ("_stats", "_rewards"):
+            with open(self.filename + suffix) as f1, open(self.filename + "_plain" + suffix) as f2:
+                self.assertEqual(f1.read(), f2.read())
+        for forkChoice in ['longest', 'heaviest']:
+            sim = Simulator(5, 0, 2000, 0.2, 0.3, [0.2]*5, seed=3, postHocRewards=True, networkDelay=4, forkChoice=forkChoice)
+            sim.run(self.filename, eventDriven=True, verbose=False)
+            tree = sim.environment.blockTree
+            chain = tree.chain(tree.best)
+            self.assertLess(len(chain), len(tree))
+            self.assertEqual(sum(node.totalBitcoinReward for node in sim.nodes), sum(b.totalFee for b in chain))
+            # the mempool follows the heaviest chain, txs of orphaned blocks are unprocessed again
+            mempool = sim.environment.mempool
+            self.assertEqual(mempool.nProcessed, sum(b.nTxs for b in chain))
+            self.assertEqual(mempool.nProcessed + len(mempool), 2000*sim.txRate)
+            log = np.loadtxt(self.filename + "_stats", delimiter=",")
+            self.assertEqual(list(log[-1][1:3]), [len(mempool), mempool.nProcessed])
+            # fruits are shared by the forks, they aren't tied to one
+            self.assertFalse(any(node.fruitsInChain for node in sim.nodes))
+            self.assertTrue(all(f.contBlockHeight == 0 for b in tree.blocks for f in b.fruits))
+        with self.assertRaises(ValueError):
+            Environment(networkDelay=2)
+        with self.assertRaises(ValueError):
+            Environment(postHocRewards=True, networkDelay=2, forkChoice='heavy')
+        with self.assertRaises(ValueError):
+            Environment(postHocRewards=True, networkDelay=2, mempoolCapacity=100)
+
+    def test_audit(self):
+        '''
+        Audited runs check every node's chain, a chain that diverges is reported with its height
+        '''
+        sim = Simulator(4, 0, 500, 0.2, 0.3, [0.25]*4, seed=3, audit=True)
+        sim.run(self.filename, verbose=False)
+        chain = sim.nodes[2].blockChain
+        chain.chain[5:] = []
+        del chain.digests[5:]
+        chain.length = 5
+        chain.append(Block(3, 10**6))
+        with self.assertRaisesRegex(RuntimeError, "node 2 diverges from node 0's at height 6"):
+            sim.environment.auditChains(501)
+        sim = Simulator(4, 0, 500, 0.2, 0.3, [0.25]*4, seed=3, postHocRewards=True, networkDelay=3, audit=True, instrument=True)
+        sim.run(self.filename, verbose=False)
+        self.assertGreater(sim.environment.instrumentation.counters['forkDepth'][3], 0)
+
+    def test_delayStats(self):
+        '''
+        Histograms are exact for small delays and within a bucket for large ones,
+        a run counts every processed tx and included fruit in its _delays file
+        '''
+        histogram = Histogram()
+        values = np.arange(100000)
+        histogram.add(values[:50])
+        histogram.add(values[50:], 2)
+        self.assertEqual(histogram.quantile(10 / histogram.n), 9)
+        for q in [0.5, 0.9, 0.99]:
+            exact = np.quantile(np.concatenate((values, values[50:])), q)
+            self.assertLess(abs(histogram.quantile(q) - exact), exact / Histogram.SUB)
+        self.assertLess(len(histogram.counts), 500)
+        summary = histogram.summary()
+        self.assertEqual((summary['min'], summary['max'], summary['count']), (0, 99999, 199950))
+        self.assertEqual(Histogram().summary()['mean'], None)
+
+        sim = Simulator(4, 0, 2000, 0.1, 0.3, [0.25]*4, seed=2, statsFormat='bin', delayStats=True)
+        sim.run(self.filename, verbose=False)
+        params, columns = loadResults(self.filename + "_delays.bin")
+        counts = [columns['count'][columns['metric'] == j].sum() for j in range(3)]
+        nFruits = sum(b.nFruits for b in sim.nodes[0].blockChain)
+        self.assertEqual(counts, [sim.environment.mempool.nProcessed, nFruits, nFruits])
+        self.assertEqual(params['summary']['hangDistance']['max'], sim.k + 1)
+        # with network delay only the blocks of the heaviest chain count
+        sim = Simulator(5, 0, 2000, 0.2, 0.3, [0.2]*5, seed=3, postHocRewards=True, networkDelay=4, delayStats=True)
+        sim.run(self.filename + "_fork", verbose=False)
+        tree = sim.environment.blockTree
+        chain = tree.chain(tree.best)
+        self.assertLess(len(chain), len(tree))
+        summary = sim.environment.delayStats.summary()
+        self.assertEqual(summary['txDelay']['count'], sum(b.nTxs for b in chain))
+        self.assertEqual(summary['fruitDelay']['count'], sum(b.nFruits for b in chain))
+        Simulator(4, 0, 100, 0.1, 0.3, [0.25]*4, seed=2).run(self.filename + "_plain", verbose=False)
+        self.assertFalse(os.path.exists(self.filename + "_plain_delays"))
+
+    def test_instrumentation(self):
+        '''
+        Instrumentation counts every phase and what's mined, without changing the run
+        '''
+        plain = Simulator(3, 0, 1000, 0.1, 0.2, [1/3]*3, seed=6)
+        plain.run(self.filename + "_plain", verbose=False)
+        sim = Simulator(3, 0, 1000, 0.1, 0.2, [1/3]*3, seed=6, instrument=True)
+        sim.run(self.filename, verbose=False)
+        with open(self.filename + "_rewards") as file, open(self.filename + "_plain_rewards") as plainFile:
+            self.assertEqual(file.read(), plainFile.read())
+        summary = sim.environment.instrumentation.summary()
+        chain = sim.nodes[0].blockChain
+        self.assertEqual(summary['timers']['txs']['calls'], 1000)
+        self.assertEqual(summary['timers']['mineBlock']['calls'], chain.length - 1)
+        self.assertEqual(summary['counters']['freshFruitsPerBlock']['count'], chain.length - 1)
+        self.assertEqual(summary['counters']['freshFruitsPerBlock']['total'], sum(b.nFruits for b in chain))
+        self.assertTrue(os.path.exists(self.filename + "_profile"))
+        self.assertFalse(os.path.exists(self.filename + "_plain_profile"))
+
+    def test_instrumentationEvents(self):
+        '''
+        Event-driven runs time the work of idle rounds in the same phases as stepped runs
+        '''
+        timers = {}
+        for eventDriven in (False, True):
+            sim = Simulator(20, 0, 20000, 0.005, 0.005, [0.05]*20, seed=3, poolDynamics=True, instrument=True)
+            env = sim.environment
+            updates = []
+            updateMiningPool = env.updateMiningPool
+            env.updateMiningPool = lambda roundNum: updates.append(roundNum) or updateMiningPool(roundNum)
+            sim.run(self.filename, eventDriven=eventDriven, verbose=False)
+            timers[eventDriven] = env.instrumentation.summary()['timers']
+            self.assertEqual(timers[eventDriven]['pools']['calls'], len(updates))
+            self.assertGreater(timers[eventDriven]['log']['calls'], 0)
+        self.assertEqual(timers[False]['txs']['calls'], 20000)
+        self.assertEqual(timers[False]['log']['calls'], 20000)
+        # idle rounds get their txs and are logged in bulk, once per stretch of idle rounds
+        self.assertGreater(timers[True]['txs']['calls'], 0)
+        self.assertLess(timers[True]['txs']['calls'], 20000)
+        self.assertEqual(timers[True]['log']['calls'], timers[True]['txs']['calls'])
+        for eventDriven in (False, True):
+            self.assertEqual(set(timers[eventDriven]), set(Instrumentation.phases))
+            for phase in Instrumentation.phases:
+                self.assertGreaterEqual(timers[eventDriven][phase]['seconds'], 0)
+
+
+class TestMiningPools(unittest.TestCase):
+
+    def test_deadlineQueue(self):
+        queue = DeadlineQueue()
+        queue.schedule(1, 5)
+        queue.schedule(2, 3)
+        queue.schedule(1, 10) # re-keyed
+        queue.schedule(3, 4)
+        queue.schedule(3, None) # cancelled
+        self.assertEqual(queue.nextDeadline(), 3)
+        self.assertEqual(queue.popDue(6), [2])
+        self.assertEqual(queue.nextDeadline(), 10)
+        self.assertEqual(queue.popDue(10), [1])
+        self.assertEqual(len(queue), 0)
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_expandGrid(self):
+        configs = expandGrid({'n': [3, 5], 'pF': [0.2, 0.4, 0.6]})
+        self.assertEqual(len(configs), 6)
+        self.assertEqual(configs[0]['k'], DEFAULTS['k'])
+        self.assertEqual(hashFractions(configs[-1]), [0.2]*5)
+        with self.assertRaises(ValueError):
+            expandGrid({'m': [1]})
+
+    def test_sweep(self):
+        '''
+        A sweep gives a row per node of every run, and the
+        same root seed gives the same table
+        '''
+        grid = {'n': [2, 3], 'r': [300], 'hashFracs': ['uniform', 'zipf']}
+        with tempfile.TemporaryDirectory() as outdir:
+            table = sweep(grid, outdir, processes=2, seed=1, eventDriven=True)
+            self.assertEqual(len(table), 2*2 + 2*3)
+            self.assertTrue(os.path.exists(os.path.join(outdir, 'sweep.csv')))
+            self.assertTrue(os.path.exists(os.path.join(outdir, 'run3_rewards')))
+            self.assertEqual(sweep(grid, outdir, processes=2, seed=1, eventDriven=True), table)
+
+
+class TestReplicate(unittest.TestCase):
+
+    def test_runningStats(self):
+        x = np.random.default_rng(0).random((50, 3))
+        stats = RunningStats(3)
+        for row in x:
+            stats.add(row)
+        np.testing.assert_allclose(stats.mean, x.mean(0))
+        np.testing.assert_allclose(stats.variance(), x.var(0, ddof=1))
+
+    def test_replicate(self):
+        '''
+        A wide target stops at minReplicas, an impossible one at maxReplicas
+        '''
+        config = {'n': 2, 'r': 300}
+        result = replicate(config, 10, minReplicas=4, processes=2, seed=1, eventDriven=True)
+        self.assertEqual(result['nReplicas'], 4)
+        self.assertTrue(result['converged'])
+        self.assertAlmostEqual(result['bitcoinShare']['mean'].sum(), 1)
+        result = replicate(config, 0, minReplicas=2, maxReplicas=5, processes=2, seed=1, eventDriven=True)
+        self.assertEqual(result['nReplicas'], 5)
+        self.assertFalse(result['converged'])
+        self.assertNotIn('poolHashFraction', result)
+
+    def test_replicatePools(self):
+        '''
+        The pool options reach every replica, so nodes join pools and the fraction is watched
+        '''
+        config = {'n': 10, 'r': 2000, 'p': 0.02, 'pF': 0.02}
+        result = replicate(config, 0, minReplicas=2, maxReplicas=4, processes=2, seed=1, eventDriven=True,
+            poolDynamics=True, poolPolicy=PoolPolicy(2, stay=200))
+        self.assertEqual(result['nReplicas'], 4)
+        self.assertGreater(result['poolHashFraction']['mean'], 0)
+
+
+class TestLeaderSampler(unittest.TestCase):
+
+    def test_reproducible(self):
+        '''
+        Two samplers with the same seed draw the same leaders,
+        also across chunk boundaries
+        '''
+        probs = [0.1, 0.2, 0.7]
+        s1 = LeaderSampler(probs, probs, np.random.default_rng(7), chunkSize=10)
+        s2 = LeaderSampler(probs, probs, np.random.default_rng(7), chunkSize=10)
+        self.assertEqual([s1.next() for i in range(25)], [s2.next() for i in range(25)])
+
+    def test_frequencies(self):
+        '''
+        Leaders are drawn w.r.t. their probabilities, ID n means nobody
+        '''
+        sampler = LeaderSampler([0.2, 0.3, 0.5], [0, 0, 1], np.random.default_rng(1))
+        blockLeaders = []
+        for i in range(20000):
+            b, f = sampler.next()
+            blockLeaders.append(b)
+            self.assertEqual(f, 2)
+        freqs = np.bincount(blockLeaders, minlength=3) / 20000
+        np.testing.assert_allclose(freqs, [0.2, 0.3, 0.5], atol=0.02)
+
+    def test_nextEvent(self):
+        '''
+        Gaps between event rounds are geometric and every event
+        has at least one leader
+        '''
+        sampler = LeaderSampler([0.05, 0.05, 0.9], [0.1, 0.1, 0.8], np.random.default_rng(3))
+        gaps = []
+        for i in range(20000):
+            gap, b, f = sampler.nextEvent()
+            self.assertTrue(b != 2 or f != 2)
+            gaps.append(gap)
+        # pr. of an event in a round is 1 - 0.9*0.8 = 0.28
+        self.assertAlmostEqual(np.mean(gaps), 1/0.28, delta=0.1)
+
+        # nothing is ever mined
+        sampler = LeaderSampler([0, 1], [0, 1])
+        self.assertEqual(sampler.nextEvent(), (None, 1, 1))
+
+    def test_invalidProbs(self):
+        sampler = LeaderSampler([0.5, 0.1], [0.5, 0.5])
+        with self.assertRaises(ValueError):
+            sampler.next()
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_benchmark(self):
+        '''
+        Every phase is timed, and the methods are restored afterwards
+        '''
+        step = Environment.step
+        results = benchmark({'n': [3], 'p': [0.2], 'pF': [0.3], 'k': [4], 'txRate': [5]}, 500, repeat=1)
+        self.assertIs(Environment.step, step)
+        result = results['n=3,p=0.2,pF=0.3,k=4,txRate=5']
+        self.assertGreater(result['roundsPerSecond'], 0)
+        self.assertGreater(result['peakMemory'], 0)
+        self.assertEqual(result['phases']['Environment.step']['calls'], 500)
+        self.assertEqual(result['phases']['Simulator.saveData']['calls'], 1)
+        self.assertEqual(result['phases']['Node.mineBlock']['calls'], result['phases']['FruitchainWindow.addBlock']['calls'])
+
+    def test_compare(self):
+        def result(roundsPerSecond, peakMemory, seconds):
+            return {'roundsPerSecond': roundsPerSecond, 'peakMemory': peakMemory,
+                'phases': {'Node.mineBlock': {'calls': 10, 'seconds': seconds}}}
+        with tempfile.TemporaryDirectory() as outdir:
+            filename = os.path.join(outdir, 'benchmarks.json')
+            saveResults(filename, 'a', {'x': result(1000, 100, 1.0), 'y': result(1000, 100, 1.0)})
+            saveResults(filename, 'b', {'x': result(950, 105, 1.05), 'y': result(800, 100, 1.5)})
+            history = loadHistory(filename)
+        self.assertEqual(compare(history, 'a', 'b', 0.1), ['y: rounds/s 1000 -> 800', 'y: Node.mineBlock 1e+05us -> 1.5e+05us per call'])
+        self.assertEqual(compare(history, 'b', 'a', 0.1), [])
+        with self.assertRaises(KeyError):
+            compare(history, 'a', 'c')
+
+
+try:
+    import createPlots
+except ImportError: # matplotlib is only needed for plotting
+    createPlots = None
+
+@unittest.skipIf(createPlots == None, "matplotlib isn't installed")
+class TestCreatePlots(unittest.TestCase):
+
+    def test_decimate(self):
+        '''
+        Every bucket keeps its min and max, so a single spike survives
+        '''
+        y = np.zeros(10000)
+        y[1234] = 7
+        y[8000] = -3
+        x, decimated = createPlots.decimate(np.arange(10000), y, 100)
+        self.assertEqual(len(decimated), 200)
+        self.assertEqual(decimated.max(), 7)
+        self.assertEqual(decimated.min(), -3)
+        self.assertEqual(list(x[:4]), [0, 0, 100, 100])
+        x, decimated = createPlots.decimate(np.arange(50), y[:50], 100)
+        self.assertEqual(len(decimated), 50)
+
+    def test_plotAll(self):
+        '''
+        Figures are rendered once, until their results change
+        '''
+        with tempfile.TemporaryDirectory() as outdir:
+            filename = os.path.join(outdir, 'run')
+            Simulator(3, 0, 300, 0.1, 0.2, [1/3]*3, seed=1, statsFormat='bin').run(filename, verbose=False)
+            createPlots.plotAll([filename], processes=1)
+            figure = filename + "_stats_txs.png"
+            mtime = os.path.getmtime(figure)
+            os.utime(figure, (mtime + 10, mtime + 10))
+            createPlots.plotAll([filename], processes=1)
+            self.assertEqual(os.path.getmtime(figure), mtime + 10)
+            os.utime(filename + "_stats.bin", (mtime + 20, mtime + 20))
+            createPlots.plotAll([filename], processes=1)
+            self.assertNotEqual(os.path.getmtime(figure), mtime + 10)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,188 @@
+#coding: utf-8
+from results import *
+import numpy as np
+
+class ConstantWorkload:
+    def __init__(self, txRate=5, fee=1, size=1):
+        '''
+        txRate: # of txs supplied to system each round
+        fee, size: fee and size of every tx
+
+        The same txs every round, added to the mempool as one group per round
+        '''
+        self.txRate = txRate
+        self.fee = fee
+        self.size = size
+
+    def useRng(self, rng):
+        pass
+
+    def generate(self, mempool, roundNum):
+        mempool.add(roundNum, self.fee, self.size, self.txRate)
+
+    def generateRange(self, mempool, firstRound, lastRound):
+        mempool.addRounds(np.arange(firstRound, lastRound+1), self.fee, self.size, self.txRate)
+
+    def arrivals(self, firstRound, lastRound):
+        '''
+        Returns the number of txs arriving in each of rounds firstRound..lastRound,
+        a scalar if it's the same every round
+        '''
+        return self.txRate
+
+
+class PoissonWorkload:
+    def __init__(self, rate, fee=1, size=1, seed=None, chunkRounds=4096):
+        '''
+        rate: mean # of txs arriving in a round, the number of each round is Poisson distributed
+        fee, size: fee and size of every tx, or a function (rng, count) returning the fees/sizes of count txs.
+                   Txs with the same round, fee and size are one group of the mempool, so discrete fees are much faster
+        seed: seed of the workload's random generator, None takes one from the environment (see useRng)
+        chunkRounds: number of rounds whose arrivals are drawn at once
+
+        Arrivals are drawn for chunks of rounds ahead as arrays: counts of each round
+        from start on, offsets of their first tx in fees and sizes. Rounds are consumed
+        in increasing order, a round gets the same txs whether it's stepped through or not.
+        '''
+        self.rate = rate
+        self.fee = fee
+        self.size = size
+        self.rng = None if seed == None else np.random.default_rng(seed)
+        self.chunkRounds = chunkRounds
+        self.start = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.fees = None
+        self.sizes = None
+
+    def useRng(self, rng):
+        if self.rng == None:
+            self.rng = rng
+
+    def isConstant(self):
+        return not callable(self.fee) and not callable(self.size)
+
+    def sample(self, values, count):
+        return values(self.rng, count) if callable(values) else np.full(count, values)
+
+    def cover(self, firstRound, lastRound):
+        '''
+        Drop the arrivals of rounds before firstRound and draw chunks until lastRound is buffered
+        '''
+        if firstRound < self.start:
+            raise ValueError("arrivals of round " + str(firstRound) + " were already generated")
+        while self.start + len(self.counts) <= lastRound:
+            counts = self.rng.poisson(self.rate, self.chunkRounds)
+            offsets = self.offsets[-1] + np.cumsum(counts)
+            self.counts = np.concatenate((self.counts, counts))
+            self.offsets = np.concatenate((self.offsets, offsets))
+            if not self.isConstant():
+                total = int(counts.sum())
+                fees, sizes = self.sample(self.fee, total), self.sample(self.size, total)
+                self.fees = fees if self.fees is None else np.concatenate((self.fees, fees))
+                self.sizes = sizes if self.sizes is None else np.concatenate((self.sizes, sizes))
+        self.consume(firstRound)
+
+    def consume(self, roundNum):
+        '''
+        Drop the arrivals of rounds before roundNum
+        '''
+        drop = roundNum - self.start
+        if drop <= 0:
+            return
+        if not self.isConstant():
+            rows = self.offsets[drop] - self.offsets[0]
+            self.fees = self.fees[rows:]
+            self.sizes = self.sizes[rows:]
+        self.counts = self.counts[drop:]
+        self.offsets = self.offsets[drop:]
+        self.start = roundNum
+
+    def generate(self, mempool, roundNum):
+        self.generateRange(mempool, roundNum, roundNum)
+
+    def generateRange(self, mempool, firstRound, lastRound):
+        '''
+        Add the txs of rounds firstRound..lastRound to mempool in bulk
+        '''
+        self.cover(firstRound, lastRound)
+        m = lastRound - firstRound + 1
+        if self.isConstant():
+            if m == 1:
+                mempool.add(firstRound, self.fee, self.size, int(self.counts[0]))
+            else:
+                mempool.addRounds(np.arange(firstRound, lastRound+1), self.fee, self.size, self.counts[:m])
+        else:
+            rows = slice(0, self.offsets[m] - self.offsets[0])
+            if m == 1:
+                mempool.addBatch(firstRound, self.fees[rows], self.sizes[rows])
+            else:
+                mempool.addRounds(np.repeat(np.arange(firstRound, lastRound+1), self.counts[:m]), self.fees[rows], self.sizes[rows])
+        self.consume(lastRound+1)
+
+    def arrivals(self, firstRound, lastRound):
+        self.cover(firstRound, lastRound)
+        return self.counts[:lastRound - firstRound + 1].copy()
+
+
+class TraceWorkload:
+    def __init__(self, filename):
+        '''
+        filename: trace written by writeTrace
+
+        Replays a recorded tx trace. The trace is memory-mapped and the rows
+        of a range of rounds are found by binary search on the round column.
+        '''
+        self.filename = filename
+        self.load()
+
+    def load(self):
+        params, columns = loadResults(self.filename)
+        self.rounds = columns['round']
+        self.fees = columns['fee']
+        self.sizes = columns['size']
+        self.counts = columns['count']
+
+    def __getstate__(self):
+        # don't pickle the mapped columns, they're mapped again when unpickled
+        return {'filename': self.filename}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.load()
+
+    def useRng(self, rng):
+        pass
+
+    def rows(self, firstRound, lastRound):
+        return slice(np.searchsorted(self.rounds, firstRound), np.searchsorted(self.rounds, lastRound, side='right'))
+
+    def generate(self, mempool, roundNum):
+        rows = self.rows(roundNum, roundNum)
+        mempool.addBatch(roundNum, self.fees[rows], self.sizes[rows], self.counts[rows])
+
+    def generateRange(self, mempool, firstRound, lastRound):
+        rows = self.rows(firstRound, lastRound)
+        mempool.addRounds(self.rounds[rows], self.fees[rows], self.sizes[rows], self.counts[rows])
+
+    def arrivals(self, firstRound, lastRound):
+        rows = self.rows(firstRound, lastRound)
+        return np.bincount(self.rounds[rows] - firstRound, weights=self.counts[rows],
+            minlength=lastRound - firstRound + 1).astype(np.int64)
+
+
+def writeTrace(filename, rounds, fees, sizes=1, counts=1, params=None):
+    '''
+    rounds: broadcast round of each row
+    fees, sizes: fee and size of the txs of each row
+    counts: number of txs of each row
+
+    Write a tx trace TraceWorkload can replay, rows are sorted by round
+    '''
+    rounds = np.asarray(rounds, dtype=np.int64)
+    order = np.argsort(rounds, kind='stable')
+    columns = {'round': rounds[order]}
+    for name, values in (('fee', fees), ('size', sizes), ('count', counts)):
+        columns[name] = np.ascontiguousarray(np.broadcast_to(values, rounds.shape)[order])
+    columns['count'] = columns['count'].astype(np.int64)
+    writeBinaryResults(filename, params if params != None else {}, columns)